@@ -0,0 +1,186 @@
+"""Статистика по собранным интервью"""
+import heapq
+from collections import Counter
+
+from pains import canonical_pain, pain_label
+from storage import (
+    CANONICAL_KEY, ID_COLUMN, PAIN_TABLE_COLUMNS, PAINS_KEY, IncrementalIndex, count_pains, pain_canonical,
+)
+
+TOP_PAINS = 10
+
+
+def split_points(points):
+    """Точки напряжения хранятся строкой "A, B" - список выбранных вариантов"""
+    return [point for point in (points or '').split(', ') if point.strip()]
+
+
+class RunningStats(IncrementalIndex):
+    """Агрегаты для /stats, обновляемые при каждом сохранении интервью
+
+    Ответ на /stats не зависит от количества интервью: все счетчики
+    поддерживаются инкрементально, а полный проход по хранилищу нужен
+    только один раз (rebuild) после запуска.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Сбрасывает все счетчики (после /clear_data)"""
+        self.total = 0
+        self.first_date = None
+        self.last_date = None
+        self.total_pains = 0
+        self.high_pain_count = 0
+        self.emotions = Counter()
+
+    def add(self, record):
+        """Учитывает одну запись интервью"""
+        self.total += 1
+        # Записи приходят не по порядку дат (импорт прошлых волн, catch_up), поэтому min/max;
+        # строки "%Y-%m-%d %H:%M:%S" сравниваются как даты
+        date = record.get('Дата') or None
+        if date:
+            if self.first_date is None or date < self.first_date:
+                self.first_date = date
+            if self.last_date is None or date > self.last_date:
+                self.last_date = date
+
+        pains, high = count_pains(record)
+        self.total_pains += pains
+        self.high_pain_count += high
+
+        for pain in record.get(PAINS_KEY) or []:
+            emotion = pain.get('Эмоция')
+            if emotion:
+                self.emotions[emotion] += 1
+
+
+class PainIndex(IncrementalIndex):
+    """Частоты болей по каноническим ID (см. pains)
+
+    Учитываются названия разобранных болей и выбранные точки напряжения.
+    Для каждого ID хранятся интервью, где боль упоминается, и варианты
+    написания; по основе слова находятся все ID, которые ее содержат.
+    Топ болей и поиск респондентов отвечают по словарям, без прохода
+    по хранилищу.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.mentions = Counter()  # ID -> количество упоминаний
+        self.interviews = {}  # ID -> [(ID интервью, респондент)]
+        self.spellings = {}  # ID -> Counter вариантов написания
+        self.by_stem = {}  # основа -> множество ID, в которые она входит
+
+    def add(self, record):
+        names = [(pain_canonical(pain), pain.get('Название')) for pain in record.get(PAINS_KEY) or []]
+        names += [(canonical_pain(point), point) for point in split_points(record.get('Точки_напряжения'))]
+
+        seen = set()
+        for canonical, name in names:
+            if not canonical:
+                continue
+            self.mentions[canonical] += 1
+            spellings = self.spellings.get(canonical)
+            if spellings is None:
+                spellings = self.spellings[canonical] = Counter()
+                for stem in canonical.split():
+                    self.by_stem.setdefault(stem, set()).add(canonical)
+            spellings[pain_label(name)] += 1
+            if canonical not in seen:
+                seen.add(canonical)
+                respondent = record.get('Респондент') or ''
+                self.interviews.setdefault(canonical, []).append((record[ID_COLUMN], respondent))
+
+    def label(self, canonical):
+        """Самое частое написание боли"""
+        return self.spellings[canonical].most_common(1)[0][0]
+
+    def top(self, limit=TOP_PAINS):
+        """[(ID, название, интервью, упоминаний)] по убыванию числа интервью"""
+        top = heapq.nlargest(limit, self.interviews, key=lambda canonical: len(self.interviews[canonical]))
+        return [
+            (canonical, self.label(canonical), len(self.interviews[canonical]), self.mentions[canonical])
+            for canonical in top
+        ]
+
+    def matching(self, text):
+        """ID болей, в которые входят все основы text (после нормализации)"""
+        stems = canonical_pain(text).split()
+        if not stems:
+            return []
+        found = set.intersection(*(self.by_stem.get(stem, set()) for stem in stems))
+        return sorted(found, key=lambda canonical: -len(self.interviews[canonical]))
+
+    def respondents(self, text):
+        """(ID болей, [(ID интервью, респондент)]) интервью, где упоминается боль text"""
+        matched = self.matching(text)
+        interviews = {}
+        for canonical in matched:
+            interviews.update(self.interviews[canonical])
+        return matched, sorted(interviews.items())
+
+
+def compute_analytics(store, categories):
+    """Разбивки по болям для /analytics
+
+    Считается векторно по таблице болей: частые боли, распределение эмоций,
+    гистограмма оценок и средняя/медианная оценка по точкам напряжения
+    (categories - варианты из PAIN_POINT_OPTIONS, выбранные респондентом).
+    """
+    # pandas импортируется при первом использовании, чтобы не замедлять запуск бота
+    import numpy as np
+    import pandas as pd
+
+    pains = pd.DataFrame(store.iter_pains(), columns=PAIN_TABLE_COLUMNS)
+    pains['Оценка'] = pd.to_numeric(pains['Оценка'], errors='coerce').fillna(0).astype(int)
+    # Боли без оценки (записанные через "дальше") в статистику оценок не попадают
+    scored = pains[pains['Оценка'] > 0]
+
+    # Частые боли: названия сравниваются по каноническим ID (регистр, окончания, синонимы)
+    named = pains[pains[CANONICAL_KEY].fillna('') != '']
+    top = (
+        named['Название'].str.strip()
+        .groupby(named[CANONICAL_KEY])
+        .agg(['size', 'first'])
+        .sort_values('size', ascending=False)
+        .head(TOP_PAINS)
+    )
+
+    emotions = pains['Эмоция'].fillna('').str.strip()
+    emotions = emotions[emotions != ''].value_counts()
+
+    histogram = np.bincount(scored['Оценка'].clip(1, 10), minlength=11)[1:]
+
+    # Точки напряжения хранятся строкой "A, B" - разворачиваем в строки и соединяем с болями
+    respondents = pd.DataFrame(
+        ((record[ID_COLUMN], record.get('Точки_напряжения') or '') for record in store.iter_records()),
+        columns=[ID_COLUMN, 'Точки_напряжения'],
+    )
+    points = respondents.assign(Категория=respondents['Точки_напряжения'].str.split(', ')).explode('Категория')
+    points = points[points['Категория'].isin(categories)]
+    by_category = (
+        points.merge(scored, on=ID_COLUMN)
+        .groupby('Категория')['Оценка']
+        .agg(['mean', 'median', 'size'])
+        .sort_values('mean', ascending=False)
+    )
+
+    return {
+        'respondents': len(respondents),
+        'pains': len(pains),
+        'scored': len(scored),
+        'top_pains': [(row['first'], int(row['size'])) for _, row in top.iterrows()],
+        'emotions': [(emotion, int(count)) for emotion, count in emotions.items()],
+        'histogram': [int(count) for count in histogram],
+        'mean_score': float(scored['Оценка'].mean()) if len(scored) else None,
+        'median_score': float(scored['Оценка'].median()) if len(scored) else None,
+        'by_category': [
+            (category, float(row['mean']), float(row['median']), int(row['size']))
+            for category, row in by_category.iterrows()
+        ],
+    }
@@ -0,0 +1,117 @@
+"""Сравнение форматов выгрузки: время построения и размер файла
+
+Запуск: python benchmarks/bench_export.py --records 10000
+Базовая линия - старый путь через pandas DataFrame.to_excel.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporters import write_export  # noqa: E402
+from storage import SQLiteInterviewStore, to_wide  # noqa: E402
+
+WORDS = ["пара", "очередь", "столовая", "расписание", "опоздание", "обед", "кофе", "библиотека",
+         "электричка", "дедлайн", "преподаватель", "аудитория", "перерыв", "общежитие"]
+EMOTIONS = ["Раздражение", "Злость", "Бессилие", "Усталость", "Тревога"]
+
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def make_record(rng, i, started):
+    """Синтетическая запись в формате save_to_global_database"""
+    record = {
+        'Респондент': str(i),
+        'Дата': (started + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+        'Описание_дня': text(rng, 60),
+        'Точки_напряжения': "Длинные очереди, Спешка между парами",
+        'Основные_проблемы': text(rng, 20),
+        'Самая_раздражающая': text(rng, 3),
+        'Волшебная_палочка': text(rng, 15),
+        'Что_удивило': text(rng, 15),
+        'Скрытые_потребности': text(rng, 15),
+        'Сигналы_о_еде': text(rng, 15),
+        'Готовность_платить': text(rng, 10),
+        'Время_записи': started + timedelta(minutes=i),
+    }
+    record['Боли'] = [
+        {
+            'Название': text(rng, 3),
+            'Оценка': rng.randint(1, 10),
+            'Эмоция': rng.choice(EMOTIONS),
+            'Случай': text(rng, 20),
+            'Причина': text(rng, 15),
+        }
+        for _ in range(rng.randint(1, 4))
+    ]
+    return record
+
+
+def bench_pandas_excel(store):
+    import pandas as pd
+
+    buffer = io.BytesIO()
+    df = pd.DataFrame([to_wide(record) for record in store.iter_records()])
+    df = df.sort_values('Время_записи', ascending=True)
+    df.to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+
+def bench_format(store, fmt, table, compress):
+    buffer = io.BytesIO()
+    write_export(fmt, table, store, buffer, compress=compress)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = datetime(2024, 9, 1, 9, 0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteInterviewStore(os.path.join(tmp, "bench.db"), commit_batch=1000)
+        for i in range(args.records):
+            store.add(make_record(rng, i, started))
+        store.flush()
+
+        # Сравнивается одна и та же широкая таблица, плюс xlsx с листами респондентов и болей
+        cases = [
+            ("pandas to_excel (старый путь)", lambda: bench_pandas_excel(store)),
+            ("xlsx (респонденты + боли)", lambda: bench_format(store, 'xlsx', 'all', False)),
+        ]
+        for fmt in ('xlsx', 'csv', 'jsonl', 'parquet'):
+            for compress in (False, True):
+                if fmt == 'xlsx' and compress:
+                    continue
+                name = f"{fmt}{' + gzip' if compress else ''}"
+                cases.append((name, lambda fmt=fmt, compress=compress: bench_format(store, fmt, 'wide', compress)))
+
+        print(f"Записей: {args.records}\n")
+        print(f"{'Формат':<32}{'Время, с':>10}{'Размер, КБ':>14}")
+        for name, run in cases:
+            started_at = time.perf_counter()
+            try:
+                data = run()
+            except Exception as e:
+                print(f"{name:<32}{'—':>10}{'—':>14}  ({type(e).__name__}: {e})")
+                continue
+            elapsed = time.perf_counter() - started_at
+            print(f"{name:<32}{elapsed:>10.2f}{len(data) / 1024:>14.0f}")
+
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Загрузка прошлых волн: потоковый импорт против чтения файла целиком
+
+Запуск: python benchmarks/bench_import.py --rows 100000
+
+Генерируются файлы в колонках выгрузки: широкая таблица csv и xlsx и xlsx
+с листами "Респонденты" и "Боли". Каждый файл загружается в пустую базу
+SQLite в отдельном процессе: выводятся скорость (строк в секунду), пиковая
+память процесса сверх памяти после импорта модулей и время учета одной
+пачки в индексах /stats, /pains и /search - столько event loop бота занят
+на каждую пачку (между пачками он обрабатывает обновления). Для сравнения
+тот же файл читается целиком в pandas (read_csv / read_excel), как пришлось
+бы без потокового чтения.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from exporters import SHEET_TITLES, write_csv, write_xlsx_sheets  # noqa: E402
+from storage import (  # noqa: E402
+    ID_COLUMN, PAIN_TABLE_COLUMNS, PAINS_KEY, RESPONDENT_COLUMNS, iter_pain_rows, to_wide, wide_columns,
+)
+
+WORDS = ["очередь", "столовая", "пара", "расписание", "опоздание", "кофе", "обед", "дедлайн",
+         "библиотека", "электричка", "преподаватель", "перерыв", "общежитие", "сессия"]
+MAX_PAINS = 4
+
+
+def make_record(rng, i):
+    def text(count):
+        return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+    return {
+        ID_COLUMN: i,
+        'Респондент': f"W1-{i}",
+        'Дата': f"2023-03-{1 + i % 28:02d} 12:00:00",
+        'Описание_дня': text(40),
+        'Точки_напряжения': "Длинные очереди, Спешка между парами",
+        'Основные_проблемы': text(10),
+        'Самая_раздражающая': text(3),
+        'Волшебная_палочка': text(8),
+        'Что_удивило': text(8),
+        'Скрытые_потребности': text(8),
+        'Сигналы_о_еде': text(8),
+        'Готовность_платить': text(5),
+        'Время_записи': None,
+        PAINS_KEY: [
+            {'Название': text(2), 'Оценка': rng.randint(1, 10), 'Эмоция': 'Злость', 'Случай': text(10),
+             'Причина': text(8)}
+            for _ in range(rng.randint(1, MAX_PAINS))
+        ],
+    }
+
+
+def records(rows, seed):
+    rng = random.Random(seed)
+    return (make_record(rng, i) for i in range(1, rows + 1))
+
+
+def write_files(tmp, rows, seed):
+    """Файлы для загрузки: {название: путь}"""
+    files = {}
+    path = os.path.join(tmp, 'wide.csv')
+    with open(path, 'wb') as f:
+        write_csv((to_wide(record) for record in records(rows, seed)), wide_columns(MAX_PAINS), f)
+    files['csv wide'] = path
+
+    path = os.path.join(tmp, 'wide.xlsx')
+    with open(path, 'wb') as f:
+        rows_iter = (to_wide(record) for record in records(rows, seed))
+        write_xlsx_sheets([(SHEET_TITLES['wide'], wide_columns(MAX_PAINS), rows_iter)], f)
+    files['xlsx wide'] = path
+
+    path = os.path.join(tmp, 'all.xlsx')
+    with open(path, 'wb') as f:
+        pains = (row for record in records(rows, seed) for row in iter_pain_rows(record))
+        write_xlsx_sheets([
+            (SHEET_TITLES['respondents'], RESPONDENT_COLUMNS, records(rows, seed)),
+            (SHEET_TITLES['pains'], PAIN_TABLE_COLUMNS, pains),
+        ], f)
+    files['xlsx листы'] = path
+    return files
+
+
+def peak_rss():
+    """Пиковая память процесса, байт (ru_maxrss на Linux в КБ, на macOS в байтах)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def read_whole(args):
+    """Без потокового чтения: весь файл в DataFrame"""
+    import openpyxl  # noqa: F401
+    import pandas as pd
+
+    baseline = peak_rss()
+    started = time.perf_counter()
+    if args.path.endswith('.csv'):
+        rows = len(pd.read_csv(args.path))
+    else:
+        rows = len(next(iter(pd.read_excel(args.path, sheet_name=None).values())))
+    return {'rows': rows, 'seconds': time.perf_counter() - started, 'memory': peak_rss() - baseline}
+
+
+def import_streaming(args):
+    """Потоковый импорт в пустую базу и учет одной пачки в индексах бота"""
+    import openpyxl  # noqa: F401
+
+    from analytics import PainIndex, RunningStats
+    from importer import import_file
+    from search import SearchIndex
+    from storage import create_store
+
+    store = create_store('sqlite', args.dir, fsync=not args.no_fsync)
+    first_chunk = []
+
+    def on_chunk(saved):
+        if not first_chunk:
+            first_chunk.extend(saved)
+
+    baseline = peak_rss()
+    started = time.perf_counter()
+    result = import_file(store, args.path, chunk_size=args.chunk, on_chunk=on_chunk)
+    seconds = time.perf_counter() - started
+    memory = peak_rss() - baseline
+    assert result.imported == store.count() == args.rows, f"imported {result.imported} of {args.rows}"
+    store.close()
+
+    # Как index_imported в боте; индексы отдельно, чтобы их память не попала в замер импорта
+    started = time.perf_counter()
+    for index in (RunningStats(), PainIndex(), SearchIndex()):
+        for record, interview_id in first_chunk:
+            index.add_saved(record, interview_id)
+    chunk_ms = (time.perf_counter() - started) * 1000
+    return {'rows': result.imported, 'seconds': seconds, 'memory': memory, 'chunk_ms': chunk_ms}
+
+
+def measure(mode, path, args, tmp):
+    data_dir = tempfile.mkdtemp(dir=tmp)
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--mode', mode, '--path', path,
+               '--dir', data_dir, '--chunk', str(args.chunk), '--rows', str(args.rows)]
+    if args.no_fsync:
+        command.append('--no-fsync')
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--chunk', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-fsync', action='store_true', help="STORAGE_FSYNC=0")
+    parser.add_argument('--no-pandas', action='store_true', help="без сравнения с чтением целиком")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Один замер в отдельном процессе, чтобы пиковая память не смешивалась
+        print(json.dumps(read_whole(args) if args.mode == 'pandas' else import_streaming(args)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        files = write_files(tmp, args.rows, args.seed)
+        print(f"Файлы на {args.rows} строк созданы за {time.perf_counter() - started:.0f} с")
+        print(
+            f"{'Файл':>12}{'МБ':>7}{'импорт, с':>11}{'строк/с':>9}{'память, МБ':>12}{'пачка индексов, мс':>20}"
+            f"{'pandas, с':>11}{'pandas, МБ':>12}"
+        )
+        for name, path in files.items():
+            imported = measure('import', path, args, tmp)
+            if args.no_pandas:
+                pandas_seconds = pandas_memory = '—'
+            else:
+                whole = measure('pandas', path, args, tmp)
+                pandas_seconds = f"{whole['seconds']:.1f}"
+                pandas_memory = f"{whole['memory'] / 2**20:.0f}"
+            print(
+                f"{name:>12}{os.path.getsize(path) / 2**20:>7.1f}{imported['seconds']:>11.1f}"
+                f"{imported['rows'] / imported['seconds']:>9.0f}{imported['memory'] / 2**20:>12.0f}"
+                f"{imported['chunk_ms']:>20.0f}{pandas_seconds:>11}{pandas_memory:>12}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Нагрузочный тест: параллельные интервьюеры проходят интервью целиком
+
+Запуск: python benchmarks/bench_load.py --users 50 --pains 3 --store-sizes 0 5000 20000
+        STORAGE_BACKEND=jsonl python benchmarks/bench_load.py
+
+Собирается настоящее приложение (build_application) с FakeTelegram вместо
+сети. Каждый пользователь проходит все шаги от /start до insights_complete,
+включая цикл разбора нескольких болей. Для каждого обработчика выводятся
+p50/p95/p99 времени работы, для всего прогона - пропускная способность и
+задержка ответа. Прогон повторяется на хранилище разного размера, чтобы было
+видно, как время завершения интервью зависит от числа уже собранных интервью.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_export import make_record  # noqa: E402
+from fake_telegram import FakeTelegram, interview_script, make_update, percentile, replay  # noqa: E402
+
+
+def instrument(application):
+    """Оборачивает callback каждого обработчика замером времени: {имя: [секунды]}"""
+    from telegram.ext import ConversationHandler
+
+    timings = defaultdict(list)
+
+    def wrap(handler):
+        callback = handler.callback
+
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                timings[callback.__name__].append(time.perf_counter() - started)
+
+        handler.callback = timed
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                nested = [*handler.entry_points, *handler.fallbacks]
+                for state_handlers in handler.states.values():
+                    nested.extend(state_handlers)
+                for child in nested:
+                    wrap(child)
+            else:
+                wrap(handler)
+    return timings
+
+
+async def prefill(bot, size, rng):
+    """Дописывает синтетические интервью, пока в хранилище не станет size записей"""
+    store = bot.get_store()
+    missing = size - store.count()
+    if missing <= 0:
+        return
+
+    # Для заполнения фиксируем крупными транзакциями, затем возвращаем настройку бота
+    commit_batch = getattr(store, 'commit_batch', None)
+    if commit_batch is not None:
+        store.commit_batch = 1000
+    started = datetime(2024, 9, 1, 9, 0)
+    for i in range(store.count(), size):
+        store.add(make_record(rng, i, started))
+    store.flush()
+    if commit_batch is not None:
+        store.commit_batch = commit_batch
+
+    # Агрегаты /stats пересчитываются, как после перезапуска бота
+    bot.running_stats = None
+    await bot.get_running_stats()
+
+
+def ms(values, q):
+    return percentile(values, q) * 1000
+
+
+def print_handlers(timings):
+    print(f"  {'Обработчик':<24}{'Вызовов':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, values in sorted(timings.items(), key=lambda item: -percentile(item[1], 50)):
+        print(f"  {name:<24}{len(values):>9}{ms(values, 50):>10.2f}{ms(values, 95):>10.2f}{ms(values, 99):>10.2f}")
+
+
+async def run(args, bot):
+    from telegram.ext import Application
+
+    fake = FakeTelegram(args.rtt_ms / 1000)
+    application = bot.build_application(
+        Application.builder().token('0:bench').request(fake).get_updates_request(fake)
+    )
+    timings = instrument(application)
+    rng = random.Random(args.seed)
+    script = interview_script(args.pains)
+    growth = []
+
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+
+        async def deliver(update):
+            fake.push_update(update)
+
+        for round_number, size in enumerate(args.store_sizes):
+            await prefill(bot, size, rng)
+            timings.clear()
+
+            # Новые пользователи на каждый прогон, чтобы не пересекались состояния диалогов
+            first_user = 100000 * (round_number + 1)
+            conversations = []
+            update_id = first_user * 100
+            for user_id in range(first_user, first_user + args.users):
+                updates = []
+                for text in script:
+                    update_id += 1
+                    updates.append(make_update(update_id, user_id, text))
+                conversations.append(updates)
+
+            last_steps = {updates[-1]['update_id'] for updates in conversations}
+            completion = []
+
+            def on_reply(update, latency):
+                if update['update_id'] in last_steps:
+                    completion.append(latency)
+
+            stored_before = bot.get_store().count()
+            started = time.perf_counter()
+            latencies = await replay(fake, deliver, conversations, on_reply)
+            elapsed = time.perf_counter() - started
+            stored = bot.get_store().count() - stored_before
+
+            print(
+                f"\nХранилище: {size} интервью; пользователей: {args.users}, болей в интервью: {args.pains}, "
+                f"сообщений: {len(latencies)}"
+            )
+            print(
+                f"  {len(latencies) / elapsed:.0f} сообщений/с, {stored / elapsed:.1f} интервью/с; "
+                f"ответ: средн {statistics.mean(latencies) * 1000:.1f} мс, p50 {ms(latencies, 50):.1f}, "
+                f"p95 {ms(latencies, 95):.1f}, p99 {ms(latencies, 99):.1f} мс"
+            )
+            print_handlers(timings)
+            if stored != args.users:
+                print(f"  ВНИМАНИЕ: сохранено {stored} интервью из {args.users}")
+
+            complete = timings.get('insights_complete', [0])
+            growth.append((size, completion, complete))
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    print("\nЗавершение интервью в зависимости от размера хранилища:")
+    print(f"  {'Интервью':>10}{'ответ p50':>12}{'ответ p95':>12}{'ответ p99':>12}{'обработчик p50':>16}")
+    for size, completion, complete in growth:
+        print(
+            f"  {size:>10}{ms(completion, 50):>12.1f}{ms(completion, 95):>12.1f}"
+            f"{ms(completion, 99):>12.1f}{ms(complete, 50):>16.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--pains', type=int, default=2, help="болей в каждом интервью")
+    parser.add_argument('--store-sizes', type=int, nargs='+', default=[0, 2000, 10000])
+    parser.add_argument('--rtt-ms', type=float, default=0)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    args.store_sizes = sorted(args.store_sizes)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Настройки читаются при импорте bot.py
+        os.environ['DATA_DIR'] = tmp
+        os.environ.setdefault('PREWARM_IMPORTS', '0')
+        # Ограничитель выдерживает 1 сообщение в секунду на чат, здесь меряется обработка
+        os.environ.setdefault('RATE_LIMIT', '0')
+        import bot
+
+        logging.getLogger().setLevel(logging.WARNING)
+        try:
+            asyncio.run(run(args, bot))
+        finally:
+            if bot.store is not None:
+                bot.store.close()
+
+
+if __name__ == '__main__':
+    main()
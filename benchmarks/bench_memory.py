@@ -0,0 +1,130 @@
+"""Память на одно интервью: старое представление (dict) против нового (__slots__)
+
+Запуск: python benchmarks/bench_memory.py --sizes 10000 100000
+Меряется через tracemalloc: объекты InterviewData с болями и строки
+в формате save_to_global_database.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Токен не нужен: bot.py только импортируется
+from bot import InterviewData, Pain  # noqa: E402
+
+PAINS_PER_INTERVIEW = 3
+
+
+class LegacyInterviewData:
+    """Старое представление: обычный класс с __dict__ и вложенным словарем"""
+    def __init__(self):
+        self.respondent_id = None
+        self.date = None
+        self.duration = None
+        self.day_description = ""
+        self.pain_points = []
+        self.main_pains = ""
+        self.most_annoying = ""
+        self.pain_analysis = []
+        self.magic_wand = ""
+        self.insights = {
+            "surprise": "",
+            "hidden_needs": "",
+            "food_signals": "",
+            "willingness_to_pay": ""
+        }
+
+
+def text(n, i):
+    # Уникальные строки, как у реальных ответов
+    return f"ответ {n} респондента {i}"
+
+
+def legacy_interview(i):
+    interview = LegacyInterviewData()
+    interview.respondent_id = str(i)
+    interview.day_description = text(1, i)
+    interview.pain_points = ["Длинные очереди"]
+    for p in range(PAINS_PER_INTERVIEW):
+        interview.pain_analysis.append({
+            'name': text(10 + p, i), 'last_case': text(20 + p, i), 'reason': text(30 + p, i),
+            'emotion': "Злость", 'score': p + 5,
+        })
+    interview.insights['surprise'] = text(2, i)
+    return interview
+
+
+def new_interview(i):
+    interview = InterviewData()
+    interview.respondent_id = str(i)
+    interview.day_description = text(1, i)
+    interview.pain_points = ["Длинные очереди"]
+    for p in range(PAINS_PER_INTERVIEW):
+        interview.pain_analysis.append(Pain(
+            name=text(10 + p, i), last_case=text(20 + p, i), reason=text(30 + p, i),
+            emotion="Злость", score=p + 5,
+        ))
+    interview.insights.surprise = text(2, i)
+    return interview
+
+
+def legacy_row(i):
+    # Ключи Боль_{i}_* собирались f-строкой заново для каждой записи
+    row = {'Респондент': str(i), 'Описание_дня': text(1, i)}
+    for p in range(1, PAINS_PER_INTERVIEW + 1):
+        row[f'Боль_{p}_Название'] = text(10 + p, i)
+        row[f'Боль_{p}_Оценка'] = p + 4
+        row[f'Боль_{p}_Эмоция'] = "Злость"
+        row[f'Боль_{p}_Случай'] = text(20 + p, i)
+        row[f'Боль_{p}_Причина'] = text(30 + p, i)
+    return row
+
+
+def new_row(i):
+    # Боли - список маленьких словарей с общими ключами-литералами
+    row = {'Респондент': str(i), 'Описание_дня': text(1, i)}
+    row['Боли'] = [
+        {
+            'Название': text(10 + p, i), 'Оценка': p + 4, 'Эмоция': "Злость",
+            'Случай': text(20 + p, i), 'Причина': text(30 + p, i),
+        }
+        for p in range(1, PAINS_PER_INTERVIEW + 1)
+    ]
+    return row
+
+
+def measure(factory, count):
+    """Байт на объект (включая сами строки ответов)"""
+    gc.collect()
+    tracemalloc.start()
+    objects = [factory(i) for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    cases = [
+        ("InterviewData", legacy_interview, new_interview),
+        ("Строка базы", legacy_row, new_row),
+    ]
+
+    print(f"{'Объект':<16}{'Количество':>12}{'Было, Б':>10}{'Стало, Б':>10}{'Экономия':>10}")
+    for name, legacy, new in cases:
+        for count in args.sizes:
+            before = measure(legacy, count)
+            after = measure(new, count)
+            saved = (1 - after / before) * 100
+            print(f"{name:<16}{count:>12}{before:>10.0f}{after:>10.0f}{saved:>9.0f}%")
+
+
+if __name__ == '__main__':
+    main()
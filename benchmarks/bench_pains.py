@@ -0,0 +1,115 @@
+"""Частые боли и "кто называл боль X": индекс по каноническим ID против прохода
+
+Запуск: python benchmarks/bench_pains.py --sizes 1000 10000 30000
+
+База SQLite заполняется интервью, где одни и те же боли записаны
+по-разному (регистр, падежи, синонимы, "Другое: ..."). Для каждого размера
+выводится, на сколько групп распадаются названия при сравнении без учета
+регистра (как было в /analytics) и по каноническим ID, время построения
+индекса и время ответа: проход по таблице болей против словарей индекса.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import PainIndex  # noqa: E402
+from pains import canonical_pain  # noqa: E402
+from storage import PAINS_KEY, SQLiteInterviewStore  # noqa: E402
+
+# Одна боль - несколько написаний
+VARIANTS = [
+    ["Длинные очереди", "очереди", "Очередь", "огромные очереди", "Другое: толпа"],
+    ["Очереди в столовой", "очередь в столовую", "столовая очередь", "толпа в буфете", "очередь в буфет"],
+    ["Высокие цены", "дорого", "Дорогая еда", "цены на еду", "еда дорогая"],
+    ["Нехватка времени на обед", "не хватает времени на обед", "нет времени пообедать"],
+    ["Проблемы с расписанием", "расписание", "неудобное расписание", "Другое: график пар"],
+    ["Опоздания на пары", "опоздал на пару", "опаздываю на занятия"],
+    ["Спешка между парами", "спешка", "тороплюсь между парами"],
+]
+POINTS = ["Спешка между парами", "Длинные очереди", "Нехватка времени на обед", "Проблемы с расписанием"]
+QUERIES = ["очереди", "столовая", "дорого", "расписание", "опоздания"]
+
+
+def make_record(rng, i):
+    pains = []
+    for _ in range(rng.randint(1, 4)):
+        variants = rng.choice(VARIANTS)
+        name = rng.choice(variants)
+        pains.append({'Название': rng.choice([name, name.lower(), name.upper(), f" {name} "]),
+                      'Оценка': rng.randint(1, 10), 'Эмоция': 'Злость', 'Случай': '', 'Причина': ''})
+    return {
+        'Респондент': str(i),
+        'Дата': f"2024-09-{1 + i % 28:02d} 12:00:00",
+        'Точки_напряжения': ', '.join(rng.sample(POINTS, rng.randint(1, 3))),
+        PAINS_KEY: pains,
+    }
+
+
+def scan_top(store, limit=10):
+    """Без индекса: проход по таблице болей, названия без учета регистра"""
+    counts = Counter(
+        (row['Название'] or '').strip().lower() for row in store.iter_pains() if (row['Название'] or '').strip()
+    )
+    return counts.most_common(limit)
+
+
+def scan_respondents(store, text):
+    """Без индекса: проход по таблице болей с поиском подстроки"""
+    text = text.lower()
+    return {row['Респондент'] for row in store.iter_pains() if text in (row['Название'] or '').lower()}
+
+
+def timed(func, repeat=5):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 30000])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{'Интервью':>9}{'групп: регистр':>16}{'групп: ID':>11}{'построение, с':>15}"
+        f"{'топ: проход, мс':>17}{'топ: индекс, мс':>17}{'боль X: проход, мс':>20}{'боль X: индекс, мс':>20}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            rng = random.Random(args.seed)
+            store = SQLiteInterviewStore(os.path.join(tmp, f'pains_{size}.db'), commit_batch=1000)
+            for i in range(size):
+                store.add(make_record(rng, i))
+            store.flush()
+
+            names = {(row['Название'] or '').strip() for row in store.iter_pains()}
+            by_case = len({name.lower() for name in names})
+            by_id = len({canonical_pain(name) for name in names})
+
+            started = time.perf_counter()
+            index = PainIndex()
+            index.rebuild(store)
+            build = time.perf_counter() - started
+
+            top_scan = timed(lambda: scan_top(store), 2)
+            top_index = timed(lambda: index.top())
+            query_scan = timed(lambda: [scan_respondents(store, query) for query in QUERIES], 2) / len(QUERIES)
+            query_index = timed(lambda: [index.respondents(query) for query in QUERIES]) / len(QUERIES)
+            store.close()
+
+            print(
+                f"{size:>9}{by_case:>16}{by_id:>11}{build:>15.2f}"
+                f"{top_scan:>17.0f}{top_index:>17.3f}{query_scan:>20.0f}{query_index:>20.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Исходящие сообщения под лимитами Telegram: с ограничителем и без
+
+Запуск: python benchmarks/bench_rate_limit.py --finishers 40 --exporters 5 --interactive 10
+
+FakeTelegram с flood_limits отвечает 429 (RetryAfter), как настоящий Telegram,
+если бот превышает 30 сообщений в секунду или 3 в секунду в один чат.
+Одновременно: finishers интервьюеров отправляют последний ответ (отчет и
+сообщение о завершении), exporters запрашивают /export_all csv (по два
+файла), а interactive интервьюеров проходят первые шаги интервью - для них
+меряется задержка подсказок. Без ограничителя сообщения, получившие 429,
+теряются (интервьюер, не получивший подсказку, считается зависшим);
+с PriorityRateLimiter они повторяются, а подсказки идут первыми.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_export import make_record  # noqa: E402
+from fake_telegram import (  # noqa: E402
+    TELEGRAM_LIMITS, FakeTelegram, interview_script, make_update, percentile, replay,
+)
+
+INTERACTIVE_STEPS = 6  # /start ... основные проблемы
+
+
+async def run_mode(bot, args, rate_limit, first_user):
+    from telegram.ext import Application
+
+    bot.RATE_LIMIT = rate_limit
+    fake = FakeTelegram(args.rtt_ms / 1000, flood_limits=TELEGRAM_LIMITS)
+    application = bot.build_application(
+        Application.builder().token('0:bench').request(fake).get_updates_request(fake)
+    )
+    script = interview_script(args.pains)
+    update_ids = iter(range(first_user * 100, first_user * 100 + 10_000_000))
+
+    def updates_for(user_id, texts):
+        return [make_update(next(update_ids), user_id, text) for text in texts]
+
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+
+        async def deliver(update):
+            fake.push_update(update)
+
+        # Подготовка без лимитов: интервьюеры доходят до последнего вопроса
+        finishers = list(range(first_user, first_user + args.finishers))
+        fake.flood_limits = None
+        await replay(fake, deliver, [updates_for(user_id, script[:-1]) for user_id in finishers])
+        fake.flood_limits = TELEGRAM_LIMITS
+        sent_before = len(fake.sent)
+
+        exporters = range(first_user + 1000, first_user + 1000 + args.exporters)
+        interactive = range(first_user + 2000, first_user + 2000 + args.interactive)
+        started = time.perf_counter()
+
+        # Все завершают интервью и запрашивают выгрузки одновременно
+        for user_id in finishers:
+            fake.push_update(updates_for(user_id, script[-1:])[0])
+        for user_id in exporters:
+            fake.push_update(updates_for(user_id, ['/export_all csv'])[0])
+
+        stalled = []
+        prompts = await replay(
+            fake, deliver, [updates_for(user_id, script[:INTERACTIVE_STEPS]) for user_id in interactive],
+            timeout=args.timeout, stalled=stalled,
+        )
+
+        # Ждем, пока разойдутся все сообщения о завершении (или станет ясно, что часть потеряна)
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            completed = sum(
+                1 for _, method, _, params in fake.sent[sent_before:]
+                if method == 'sendMessage' and str(params.get('text', '')).startswith('🎉')
+            )
+            if completed == args.finishers:
+                break
+            await asyncio.sleep(0.1)
+        elapsed = time.perf_counter() - started
+        documents = sum(1 for _, method, _, _ in fake.sent[sent_before:] if method == 'sendDocument')
+
+        limiter = application.bot.rate_limiter
+        retries = limiter.retries if limiter else 0
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+
+    return {
+        'prompts': prompts,
+        'stalled': len(stalled),
+        'completed': completed,
+        'documents': documents,
+        'rejected': fake.rejected,
+        'lost': fake.rejected - retries,
+        'elapsed': elapsed,
+    }
+
+
+async def main_async(args, bot):
+    print(
+        f"Завершают интервью: {args.finishers}, выгрузки: {args.exporters} (по 2 файла), "
+        f"проходят первые шаги: {args.interactive}\n"
+    )
+    print(
+        f"{'Режим':<16}{'Завершено':>11}{'Файлов':>8}{'Ответов 429':>13}{'Потеряно':>10}"
+        f"{'Подсказка p50':>15}{'p95':>8}{'Зависли':>9}{'Всё, с':>8}"
+    )
+    modes = [('без лимитов', False), ('с ограничителем', True)]
+    for number, (name, rate_limit) in enumerate(modes):
+        result = await run_mode(bot, args, rate_limit, first_user=100000 * (number + 1))
+        # Если все подсказки потеряны, задержку не из чего считать
+        prompts = [value * 1000 for value in result['prompts']] or [float('nan')]
+        print(
+            f"{name:<16}{result['completed']:>6}/{args.finishers:<4}{result['documents']:>5}/{args.exporters * 2:<2}"
+            f"{result['rejected']:>13}{result['lost']:>10}"
+            f"{percentile(prompts, 50):>12.0f} мс{percentile(prompts, 95):>5.0f} мс"
+            f"{result['stalled']:>5}/{args.interactive:<3}{result['elapsed']:>8.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--finishers', type=int, default=40)
+    parser.add_argument('--exporters', type=int, default=5)
+    parser.add_argument('--interactive', type=int, default=10)
+    parser.add_argument('--pains', type=int, default=3)
+    parser.add_argument('--rtt-ms', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=30, help="сколько ждать ответа бота, с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Настройки читаются при импорте bot.py
+        os.environ['DATA_DIR'] = tmp
+        os.environ.setdefault('PREWARM_IMPORTS', '0')
+        import bot
+
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+        # Немного данных, чтобы выгрузке было что отправлять
+        store = bot.get_store()
+        rng = random.Random(1)
+        for i in range(200):
+            store.add(make_record(rng, i, datetime(2024, 9, 1, 9, 0)))
+        store.flush()
+
+        try:
+            asyncio.run(main_async(args, bot))
+        finally:
+            if bot.store is not None:
+                bot.store.close()
+
+
+if __name__ == '__main__':
+    main()
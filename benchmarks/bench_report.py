@@ -0,0 +1,91 @@
+"""Доставка отчета: нарезка по 4000 символов против упаковки разделов
+
+Запуск: python benchmarks/bench_report.py --pains 1 5 20 60 --answer-chars 300
+
+Для интервью с разным числом болей и длиной ответов считается, сколько
+запросов к Bot API уходит на отчет, сколько сообщений длиннее лимита
+Telegram в единицах UTF-16 (такое сообщение Telegram отклоняет) и сколько
+строк оказалось разрезано.
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import InterviewData, Pain  # noqa: E402
+from reports import MAX_MESSAGE_LENGTH, split_message, utf16_len  # noqa: E402
+
+WORDS = "очередь столовая пара библиотека перемена 📚 ⏰ 😡 опоздал дорого долго неудобно 👍🏽".split()
+
+
+def make_interview(rng, pains, answer_chars):
+    def answer():
+        words = []
+        while sum(len(word) + 1 for word in words) < answer_chars:
+            words.append(rng.choice(WORDS))
+        return ' '.join(words)
+
+    interview = InterviewData(respondent_id='42', date='2024-09-01 12:00')
+    interview.pain_points = ["⏳ Длинные очереди", "💸 Высокие цены"]
+    interview.main_pains = answer()
+    interview.most_annoying = answer()
+    interview.pain_analysis = [
+        Pain(name=f"Боль {number}", last_case=answer(), reason=answer(), emotion="😡 Злость", score=rng.randint(1, 10))
+        for number in range(pains)
+    ]
+    interview.magic_wand = answer()
+    interview.insights.surprise = answer()
+    interview.insights.hidden_needs = answer()
+    interview.insights.food_signals = answer()
+    interview.insights.willingness_to_pay = answer()
+    return interview
+
+
+def old_split(report):
+    """Как было: срез каждые 4000 символов Python"""
+    return [report[i:i + 4000] for i in range(0, len(report), 4000)]
+
+
+def describe(report, parts):
+    too_long = sum(1 for part in parts if utf16_len(part) > MAX_MESSAGE_LENGTH)
+    # Строка разрезана, если в сообщении есть строка, которой нет в отчете целиком
+    lines = set(report.split('\n'))
+    broken = sum(1 for part in parts for line in part.split('\n') if line not in lines)
+    return len(parts), too_long, broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pains', type=int, nargs='+', default=[1, 5, 20, 60])
+    parser.add_argument('--answer-chars', type=int, default=300)
+    parser.add_argument('--document-after', type=int, default=2, help="как REPORT_DOCUMENT_AFTER")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('PREWARM_IMPORTS', '0')
+    import bot
+
+    rng = random.Random(args.seed)
+    print(
+        f"{'Болей':>6}{'UTF-16':>9}{'Было: запросов':>16}{'> 4096':>8}{'разрезанных строк':>19}"
+        f"{'Стало: сообщений':>18}{'> 4096':>8}{'запросов':>10}"
+    )
+    for pains in args.pains:
+        report = bot.generate_report(make_interview(rng, pains, args.answer_chars))
+        old = describe(report, old_split(report))
+
+        parts = split_message(report)
+        new = describe(report, parts)
+        # Отчет из многих сообщений уходит одним файлом
+        requests = 1 if args.document_after and len(parts) > args.document_after else len(parts)
+        print(
+            f"{pains:>6}{utf16_len(report):>9}{old[0]:>16}{old[1]:>8}{old[2]:>19}"
+            f"{new[0]:>18}{new[1]:>8}{requests:>10}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Поиск по ответам: инвертированный индекс против прохода по хранилищу
+
+Запуск: python benchmarks/bench_search.py --sizes 1000 10000 30000
+
+База SQLite заполняется синтетическими интервью (словарь с частотами по
+закону Ципфа и падежными формами, как в живых ответах). Для каждого размера
+выводятся время построения индекса и память под него, задержка запросов
+(p50/p95) по индексу и полным проходом с поиском подстрок, время учета
+нового интервью (add_saved) и дочитывания чужих записей (catch_up).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import percentile  # noqa: E402
+from search import SearchIndex, record_texts, snippet, terms  # noqa: E402
+from storage import ID_COLUMN, PAINS_KEY, SQLiteInterviewStore  # noqa: E402
+
+STEMS = ["очеред", "столов", "расписани", "опоздани", "обед", "коф", "библиотек", "электричк",
+         "дедлайн", "преподавател", "аудитори", "перерыв", "общежити", "стипенди", "сесси"]
+ENDINGS = ["", "а", "и", "ь", "ью", "ей", "ям", "ях", "ами", "ой", "у", "е"]
+SYLLABLES = ["ка", "ло", "ре", "ми", "до", "ст", "на", "пр", "ви", "то", "ль", "ру", "бо", "ше"]
+QUERIES = ["очередь в столовой", "опоздание на пары", "кофе", "дедлайны и сессия",
+           "электричка", "преподаватель", "перерыв обед"]
+
+
+def make_vocabulary(rng, size):
+    words = [stem + ending for stem in STEMS for ending in ENDINGS]
+    while len(words) < size:
+        words.append(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Закон Ципфа: вес слова обратно пропорционален его рангу
+    return words, [1 / rank for rank in range(1, len(words) + 1)]
+
+
+def make_record(rng, vocabulary, i):
+    words, weights = vocabulary
+
+    def text(count):
+        return ' '.join(rng.choices(words, weights, k=count))
+
+    return {
+        'Респондент': str(i),
+        'Дата': f"2024-09-{1 + i % 28:02d} 12:00:00",
+        'Описание_дня': text(60),
+        'Точки_напряжения': "Длинные очереди, Спешка между парами",
+        'Основные_проблемы': text(20),
+        'Самая_раздражающая': text(3),
+        'Волшебная_палочка': text(15),
+        'Что_удивило': text(15),
+        'Скрытые_потребности': text(15),
+        'Сигналы_о_еде': text(15),
+        'Готовность_платить': text(10),
+        PAINS_KEY: [
+            {'Название': text(3), 'Оценка': rng.randint(1, 10), 'Эмоция': 'Злость',
+             'Случай': text(20), 'Причина': text(15)}
+            for _ in range(rng.randint(1, 4))
+        ],
+    }
+
+
+def scan_search(store, query, limit):
+    """Без индекса: проход по всем записям и поиск слов запроса подстрокой"""
+    words = [word for word in query.lower().split() if len(word) > 2]
+    hits = []
+    for record in store.iter_records():
+        text = ' '.join(value for _, value in record_texts(record)).lower()
+        score = sum(text.count(word) for word in words)
+        if score:
+            hits.append((score, record[ID_COLUMN]))
+    hits.sort(reverse=True)
+    return len(hits), hits[:limit]
+
+
+def timed(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def run(size, args, tmp):
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    store = SQLiteInterviewStore(os.path.join(tmp, f'search_{size}.db'), commit_batch=1000)
+    for i in range(size):
+        store.add(make_record(rng, vocabulary, i))
+    store.flush()
+
+    started = time.perf_counter()
+    index = SearchIndex()
+    index.rebuild(store)
+    build = time.perf_counter() - started
+
+    # Память - отдельным построением: tracemalloc сильно замедляет выделения
+    tracemalloc.start()
+    measured = SearchIndex()
+    measured.rebuild(store)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+
+    def indexed():
+        # Как в /search: ранжирование по индексу, затем фрагменты из найденных записей
+        for query in QUERIES:
+            _, hits = index.search(query, limit=args.limit)
+            records = store.get_records([interview_id for interview_id, _, _ in hits])
+            query_terms = set(terms(query))
+            for record in records.values():
+                snippet(record, query_terms)
+
+    indexed_ms = [value / len(QUERIES) for value in timed(indexed, args.repeat)]
+    scan_ms = [value / len(QUERIES) for value in timed(
+        lambda: [scan_search(store, query, args.limit) for query in QUERIES], args.scan_repeat
+    )]
+
+    adds = []
+    for i in range(size, size + 100):
+        record = make_record(rng, vocabulary, i)
+        interview_id = store.add(record)
+        started = time.perf_counter()
+        index.add_saved(record, interview_id)
+        adds.append((time.perf_counter() - started) * 1000)
+
+    # Интервью другого процесса: в хранилище есть, в индексе еще нет
+    for i in range(size + 100, size + 200):
+        store.add(make_record(rng, vocabulary, i))
+    store.flush()
+    started = time.perf_counter()
+    index.catch_up(store)
+    catch_up = (time.perf_counter() - started) * 1000
+    assert len(index) == store.count() == size + 200
+    store.close()
+
+    return build, memory, indexed_ms, scan_ms, adds, catch_up, index.term_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 30000])
+    parser.add_argument('--vocabulary', type=int, default=5000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scan-repeat', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{'Интервью':>9}{'термов':>8}{'построение, с':>15}{'память, МБ':>12}"
+        f"{'индекс p50/p95, мс':>20}{'проход p50, мс':>16}{'add_saved, мс':>15}{'catch_up 100, мс':>18}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            build, memory, indexed_ms, scan_ms, adds, catch_up, term_count = run(size, args, tmp)
+            latency = f"{percentile(indexed_ms, 50):.1f}/{percentile(indexed_ms, 95):.1f}"
+            print(
+                f"{size:>9}{term_count:>8}{build:>15.2f}{memory / 2**20:>12.1f}{latency:>20}"
+                f"{percentile(scan_ms, 50):>16.0f}{percentile(adds, 50):>15.2f}{catch_up:>18.1f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
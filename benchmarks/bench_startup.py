@@ -0,0 +1,93 @@
+"""Время холодного запуска: импорт bot.py по данным python -X importtime
+
+Запуск: python benchmarks/bench_startup.py --runs 5 --budget-ms 600
+Сравнивается текущий импорт bot.py с "жадным" вариантом, где pandas и openpyxl
+импортируются заранее (как было раньше). Скрипт завершается с кодом 1, если
+импорт bot.py дольше бюджета или при запуске снова подгружаются тяжелые библиотеки.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Эти библиотеки не должны импортироваться при запуске бота
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'pyarrow')
+
+
+def import_profile(code):
+    """Запускает python -X importtime и возвращает [(глубина, модуль, накопленное время, мкс)]"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    profile = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Вложенность обозначается отступом по два пробела после разделителя
+        name = name[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        profile.append((depth, name.strip(), int(cumulative)))
+    return profile
+
+
+def total_ms(profile):
+    """Суммарное время импорта модулей верхнего уровня, мс"""
+    return sum(us for depth, _, us in profile if depth == 0) / 1000
+
+
+def measure(code, runs):
+    """Медиана времени импорта и профиль последнего запуска"""
+    times = []
+    profile = []
+    for _ in range(runs):
+        profile = import_profile(code)
+        times.append(total_ms(profile))
+    return statistics.median(times), profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=600)
+    parser.add_argument('--top', type=int, default=8)
+    args = parser.parse_args()
+
+    # Первый запуск прогревает кэш байткода и файловой системы
+    import_profile('import bot')
+
+    eager_ms, _ = measure('import pandas, openpyxl; import bot', args.runs)
+    lazy_ms, profile = measure('import bot', args.runs)
+
+    print(f"{'Вариант':<36}{'Импорт, мс':>12}")
+    print(f"{'pandas и openpyxl при запуске':<36}{eager_ms:>12.0f}")
+    print(f"{'ленивый импорт (текущий bot.py)':<36}{lazy_ms:>12.0f}")
+    print(f"\nУскорение: {eager_ms / lazy_ms:.1f}x, бюджет: {args.budget_ms:.0f} мс\n")
+
+    print("Самые тяжелые модули при импорте bot.py:")
+    # Прямые импорты bot.py (глубина 1 в дереве importtime)
+    direct = [(name, us) for depth, name, us in profile if depth == 1]
+    for name, us in sorted(direct, key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<34}{us / 1000:>10.0f} мс")
+
+    loaded = {name.split('.')[0] for _, name, _ in profile}
+    heavy = [name for name in HEAVY_MODULES if name in loaded]
+
+    failed = False
+    if heavy:
+        print(f"\nОШИБКА: при запуске импортируются {', '.join(heavy)}")
+        failed = True
+    if lazy_ms > args.budget_ms:
+        print(f"\nОШИБКА: импорт bot.py занимает {lazy_ms:.0f} мс при бюджете {args.budget_ms:.0f} мс")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Задержка ответа бота в режимах polling и webhook без доступа к сети
+
+Запуск: python benchmarks/bench_webhook.py --users 20 --rtt-ms 80
+        python benchmarks/bench_webhook.py --updates recorded.jsonl
+
+Собирается настоящее приложение (build_application) с FakeTelegram вместо
+api.telegram.org. В режиме webhook обновления отправляются POST-запросом на
+встроенный сервер PTB с секретным заголовком, в режиме polling отдаются через
+getUpdates. Задержка - от появления обновления "в Telegram" до доставки
+первого ответа бота; --rtt-ms моделирует сеть между ботом и Telegram.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402  (зависимость python-telegram-bot)
+
+from fake_telegram import (  # noqa: E402
+    INTERVIEW_SCRIPT, FakeTelegram, load_updates, make_update, percentile, replay,
+)
+
+SECRET = 'bench-secret'
+URL_PATH = 'telegram'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_conversations(users, first_user_id):
+    """Полные интервью для users пользователей"""
+    update_id = first_user_id * 100
+    conversations = []
+    for user_id in range(first_user_id, first_user_id + users):
+        updates = []
+        for text in INTERVIEW_SCRIPT:
+            update_id += 1
+            updates.append(make_update(update_id, user_id, text))
+        conversations.append(updates)
+    return conversations
+
+
+def recorded_conversations(path):
+    """Записанные обновления, сгруппированные по чатам (порядок внутри чата сохраняется)"""
+    chats = defaultdict(list)
+    for update in load_updates(path):
+        chats[update['message']['chat']['id']].append(update)
+    return list(chats.values())
+
+
+async def run_polling(bot, conversations, rtt):
+    from telegram.ext import Application
+
+    fake = FakeTelegram(rtt)
+    application = bot.build_application(
+        Application.builder().token('0:bench').request(fake).get_updates_request(fake)
+    )
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0.0, timeout=10)
+
+        async def deliver(update):
+            fake.push_update(update)
+
+        started = time.perf_counter()
+        latencies = await replay(fake, deliver, conversations)
+        elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+    return latencies, elapsed, fake
+
+
+async def run_webhook(bot, conversations, rtt):
+    from telegram.ext import Application
+
+    fake = FakeTelegram(rtt)
+    application = bot.build_application(
+        Application.builder().token('0:bench').request(fake).get_updates_request(fake)
+    )
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/{URL_PATH}"
+    async with application:
+        await application.start()
+        await application.updater.start_webhook(
+            listen='127.0.0.1', port=port, url_path=URL_PATH,
+            webhook_url=url, secret_token=SECRET,
+        )
+
+        async with httpx.AsyncClient() as client:
+            # Запрос без секрета должен быть отклонен встроенным сервером
+            rejected = await client.post(url, json=conversations[0][0])
+            if rejected.status_code != 403:
+                raise RuntimeError(f"Webhook accepted a request without the secret token: {rejected.status_code}")
+
+            async def deliver(update):
+                # Telegram доставляет обновление по сети
+                if rtt:
+                    await asyncio.sleep(rtt / 2)
+                response = await client.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+                response.raise_for_status()
+
+            started = time.perf_counter()
+            latencies = await replay(fake, deliver, conversations)
+            elapsed = time.perf_counter() - started
+
+        await application.updater.stop()
+        await application.stop()
+        await bot.post_shutdown(application)
+    return latencies, elapsed, fake
+
+
+def report(name, latencies, elapsed, fake):
+    ms = [value * 1000 for value in latencies]
+    print(
+        f"{name:<10}{len(ms):>10}{statistics.mean(ms):>10.1f}{percentile(ms, 50):>10.1f}"
+        f"{percentile(ms, 95):>10.1f}{percentile(ms, 99):>10.1f}{len(ms) / elapsed:>12.1f}"
+        f"{fake.calls.get('getUpdates', 0):>12}"
+    )
+
+
+async def main_async(args, bot):
+    rtt = args.rtt_ms / 1000
+    print(f"RTT до Telegram: {args.rtt_ms:.0f} мс\n")
+    print(f"{'Режим':<10}{'Ответов':>10}{'Средн':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'Обн/с':>12}{'getUpdates':>12}")
+
+    for offset, (name, runner) in enumerate((('polling', run_polling), ('webhook', run_webhook))):
+        if args.updates:
+            conversations = recorded_conversations(args.updates)
+        else:
+            # Разные пользователи для каждого режима, чтобы не пересекались состояния диалогов
+            conversations = synthetic_conversations(args.users, 10000 * (offset + 1))
+        latencies, elapsed, fake = await runner(bot, conversations, rtt)
+        report(name, latencies, elapsed, fake)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rtt-ms', type=float, default=50)
+    parser.add_argument('--updates', help="JSONL с записанными обновлениями Bot API")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Настройки читаются при импорте bot.py
+        os.environ['DATA_DIR'] = tmp
+        os.environ.setdefault('PREWARM_IMPORTS', '0')
+        # Ограничитель выдерживает 1 сообщение в секунду на чат, здесь меряется обработка
+        os.environ.setdefault('RATE_LIMIT', '0')
+        import bot
+
+        logging.getLogger().setLevel(logging.WARNING)
+        try:
+            asyncio.run(main_async(args, bot))
+        finally:
+            if bot.store is not None:
+                bot.store.close()
+
+
+if __name__ == '__main__':
+    main()
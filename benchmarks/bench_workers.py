@@ -0,0 +1,180 @@
+"""Пропускная способность в режиме нескольких процессов (WORKERS) за одним webhook
+
+Запуск: python benchmarks/bench_workers.py --workers 1 2 4 --users 40
+
+Бот запускается как в продакшене (python bot.py, BOT_MODE=webhook) с
+BOT_API_URL на локальный поддельный сервер Bot API. Пользователи проходят
+интервью целиком, отправляя обновления POST-запросами на webhook; следующее
+сообщение уходит после ответа бота. Для каждого числа процессов выводятся
+пропускная способность, задержка ответа и проверка общего хранилища: все
+интервью сохранены ровно один раз, хотя их писали разные процессы.
+Прирост от процессов ограничен числом ядер машины (выводится в заголовке).
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402  (зависимость python-telegram-bot)
+import tornado.web  # noqa: E402  (зависимость python-telegram-bot[webhooks])
+
+from bench_webhook import SECRET, URL_PATH, free_port  # noqa: E402
+from fake_telegram import BOT_USER, interview_script, make_update, percentile  # noqa: E402
+
+TOKEN = '0:bench'
+
+
+class FakeBotApi:
+    """Поддельный api.telegram.org по HTTP: запоминает отправки и будит ожидающих ответа"""
+
+    def __init__(self):
+        self.calls = {}
+        self.waiting = {}  # chat_id -> future первого ответа
+        self.webhook_set = asyncio.Event()
+        self._next_message_id = 1
+
+    def handle(self, method, params):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            self.webhook_set.set()
+            return True
+        if not method.startswith('send'):
+            return True
+
+        chat_id = int(params.get('chat_id', 0))
+        future = self.waiting.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', ''),
+        }
+
+    def app(self):
+        api = self
+
+        class MethodHandler(tornado.web.RequestHandler):
+            def post(self, token, method):
+                # PTB передает параметры формой (или multipart для файлов)
+                params = {key: self.get_body_argument(key) for key in self.request.body_arguments}
+                self.set_header('Content-Type', 'application/json')
+                self.write(json.dumps({'ok': True, 'result': api.handle(method, params)}))
+
+        return tornado.web.Application([(r"/bot([^/]+)/(\w+)", MethodHandler)])
+
+
+async def run(args, workers, tmp):
+    api = FakeBotApi()
+    api_port = free_port()
+    server = api.app().listen(api_port, address='127.0.0.1')
+    webhook_port = free_port()
+
+    data_dir = os.path.join(tmp, f'workers_{workers}')
+    os.makedirs(data_dir)
+    env = {
+        **os.environ,
+        'BOT_TOKEN': TOKEN,
+        'BOT_MODE': 'webhook',
+        'WEBHOOK_URL': f'http://127.0.0.1:{webhook_port}',
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': str(webhook_port),
+        'WEBHOOK_PATH': URL_PATH,
+        'WEBHOOK_SECRET': SECRET,
+        'BOT_API_URL': f'http://127.0.0.1:{api_port}',
+        'DATA_DIR': data_dir,
+        'WORKERS': str(workers),
+        'PREWARM_IMPORTS': '0',
+        # Ограничитель выдерживает 1 сообщение в секунду на чат, здесь меряется обработка
+        'RATE_LIMIT': '0',
+    }
+    log = open(os.path.join(tmp, f'bot_{workers}.log'), 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bot.py')], env=env, stdout=log, stderr=log)
+
+    try:
+        await asyncio.wait_for(api.webhook_set.wait(), timeout=60)
+        # Каждый процесс-обработчик при запуске вызывает getMe
+        deadline = time.perf_counter() + 60
+        while api.calls.get('getMe', 0) < workers and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        script = interview_script(args.pains)
+        first_user = 100000 * workers
+        latencies = []
+        loop = asyncio.get_running_loop()
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.users)) as client:
+            async def user(user_id):
+                for step, text in enumerate(script):
+                    future = loop.create_future()
+                    api.waiting[user_id] = future
+                    started = time.perf_counter()
+                    response = await client.post(
+                        f'http://127.0.0.1:{webhook_port}/{URL_PATH}',
+                        json=make_update(user_id * 100 + step, user_id, text),
+                        headers={'X-Telegram-Bot-Api-Secret-Token': SECRET},
+                    )
+                    response.raise_for_status()
+                    latencies.append(await asyncio.wait_for(future, timeout=60) - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(user_id) for user_id in range(first_user, first_user + args.users)))
+            elapsed = time.perf_counter() - started
+    finally:
+        # Пока бот завершается, его последние отправки еще обслуживает этот event loop
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.to_thread(process.wait, 60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        server.stop()
+
+    with sqlite3.connect(os.path.join(data_dir, 'interviews.db')) as conn:
+        stored, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM interviews").fetchone()
+    return latencies, elapsed, stored, distinct, process.returncode
+
+
+async def main_async(args):
+    print(f"Ядер: {os.cpu_count()}; пользователей: {args.users}, болей в интервью: {args.pains}\n")
+    print(
+        f"{'Процессов':>10}{'сообщений/с':>13}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+        f"{'сохранено':>11}{'код выхода':>12}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            latencies, elapsed, stored, distinct, returncode = await run(args, workers, tmp)
+            ms = [value * 1000 for value in latencies]
+            status = f"{stored}/{args.users}" + ("" if stored == distinct == args.users else " !")
+            print(
+                f"{workers:>10}{len(latencies) / elapsed:>13.0f}{percentile(ms, 50):>10.1f}"
+                f"{percentile(ms, 95):>10.1f}{percentile(ms, 99):>10.1f}{status:>11}{returncode:>12}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--pains', type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""Проверка сохранности данных при падении процесса записи
+
+Запуск: python benchmarks/crash_injection.py --backend jsonl sqlite --rounds 30
+
+Процесс записи сохраняет интервью в хранилище и после каждого add
+сообщает ID подтвержденной записи. Его убивают (SIGKILL) в случайный
+момент, в том числе посреди переноса журнала в снимок: в части раундов
+процесс сам завершается сразу после одной из атомарных замен файлов.
+После каждого падения хранилище открывается заново и проверяется, что
+все подтвержденные интервью на месте ровно по одному разу и совпадают
+с записанными, а ID идут подряд. Снимок делается часто (--snapshot-every),
+чтобы падения попадали и на него. Выводится время восстановления.
+
+Вторая таблица - время открытия журнала jsonl с N интервью: весь журнал
+без снимков (как было) против снимка и хвоста не длиннее JSONL_SNAPSHOT_EVERY.
+"""
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import ID_COLUMN, PAIN_FIELDS, PAINS_KEY, create_store  # noqa: E402
+
+
+def make_record(number):
+    """Интервью, которое можно восстановить по номеру для сравнения"""
+    rng = random.Random(number)
+    return {
+        'Респондент': str(number),
+        'Дата': '2024-09-01 12:00:00',
+        'Описание_дня': ' '.join(rng.choice(["пара", "очередь", "столовая", "обед"]) for _ in range(rng.randint(5, 400))),
+        PAINS_KEY: [
+            {'Название': f"Боль {number}.{i}", 'Оценка': rng.randint(1, 10), 'Эмоция': 'Злость',
+             'Случай': '', 'Причина': ''}
+            for i in range(rng.randint(0, 3))
+        ],
+    }
+
+
+def writer(args):
+    """Процесс записи: добавляет интервью начиная с --start, пока его не убьют"""
+    if args.exit_after_replace:
+        # Падение сразу после одной из атомарных замен (снимок или журнал)
+        rng = random.Random(args.start)
+        real_replace = os.replace
+
+        def replace(src, dst):
+            real_replace(src, dst)
+            if rng.random() < 0.3:
+                os._exit(1)
+
+        os.replace = replace
+
+    store = create_store(args.backend[0], args.dir, snapshot_every=args.snapshot_every)
+    number = args.start
+    while True:
+        interview_id = store.add(make_record(number))
+        # Подтверждение уходит только после возврата из add
+        sys.stdout.write(f"{number} {interview_id}\n")
+        sys.stdout.flush()
+        number += 1
+
+
+def check(backend, data_dir, acknowledged, snapshot_every):
+    """Открывает хранилище после падения; возвращает (записей, время открытия, ошибки)"""
+    started = time.perf_counter()
+    store = create_store(backend, data_dir, snapshot_every=snapshot_every)
+    opened = time.perf_counter() - started
+
+    errors = []
+    seen = {}
+    expected_id = 1
+    for record in store.iter_records():
+        if record[ID_COLUMN] != expected_id:
+            errors.append(f"ID {record[ID_COLUMN]} вместо {expected_id}")
+            expected_id = record[ID_COLUMN]
+        expected_id += 1
+        number = int(record['Респондент'])
+        if number in seen:
+            errors.append(f"интервью {number} записано дважды")
+        seen[number] = record
+
+    for number, interview_id in acknowledged.items():
+        record = seen.get(number)
+        if record is None:
+            errors.append(f"подтвержденное интервью {number} (ID {interview_id}) потеряно")
+            continue
+        expected = make_record(number)
+        pains = [{field: pain.get(field) for field in PAIN_FIELDS} for pain in record[PAINS_KEY]]
+        if record['Описание_дня'] != expected['Описание_дня'] or pains != expected[PAINS_KEY]:
+            errors.append(f"интервью {number} повреждено")
+        if record[ID_COLUMN] != interview_id:
+            errors.append(f"интервью {number}: ID {record[ID_COLUMN]}, подтвержден {interview_id}")
+    count = store.count()
+    if count != len(seen):
+        errors.append(f"count() = {count}, прочитано {len(seen)}")
+    store.close()
+    return len(seen), opened, errors
+
+
+def run(backend, args, tmp):
+    data_dir = os.path.join(tmp, backend)
+    os.makedirs(data_dir)
+    rng = random.Random(args.seed)
+    acknowledged = {}
+    next_number = 1
+    failures = 0
+    recoveries = []
+    injected = 0
+
+    for round_number in range(args.rounds):
+        exit_after_replace = backend == 'jsonl' and rng.random() < 0.3
+        injected += exit_after_replace
+        command = [
+            sys.executable, os.path.abspath(__file__), '--writer', '--backend', backend,
+            '--dir', data_dir, '--start', str(next_number), '--snapshot-every', str(args.snapshot_every),
+        ]
+        if exit_after_replace:
+            command.append('--exit-after-replace')
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+
+        # Убиваем после случайного числа подтверждений или по таймеру
+        deadline = time.perf_counter() + rng.uniform(0.05, args.max_seconds)
+        target = rng.randint(1, args.max_records)
+        confirmed = 0
+        while confirmed < target and time.perf_counter() < deadline:
+            line = process.stdout.readline()
+            if not line:
+                break  # Процесс завершился сам (внедренное падение)
+            number, interview_id = map(int, line.split())
+            acknowledged[number] = interview_id
+            next_number = number + 1
+            confirmed += 1
+        if process.poll() is None:
+            process.send_signal(signal.SIGKILL)
+        # Подтверждения, успевшие прийти до смерти процесса
+        for line in process.stdout:
+            number, interview_id = map(int, line.split())
+            acknowledged[number] = interview_id
+            next_number = number + 1
+        process.wait()
+        # Номера записей, которые процесс мог записать без подтверждения, больше не используются
+        next_number += args.max_records
+
+        records, opened, errors = check(backend, data_dir, acknowledged, args.snapshot_every)
+        recoveries.append(opened)
+        if errors:
+            failures += 1
+            print(f"  раунд {round_number + 1}: " + "; ".join(errors[:5]))
+
+    return len(acknowledged), records, failures, injected, recoveries
+
+
+def bench_recovery(sizes, snapshot_every, tmp):
+    print(f"\n{'Интервью':>9}{'без снимка, мс':>16}{'снимок + хвост, мс':>20}{'хвост':>7}")
+    for size in sizes:
+        times = []
+        for name, every in (('full', 0), ('snapshot', snapshot_every)):
+            data_dir = os.path.join(tmp, f'recovery_{name}_{size}')
+            os.makedirs(data_dir)
+            store = create_store('jsonl', data_dir, snapshot_every=every, fsync=False)
+            for number in range(size):
+                store.add(make_record(number))
+            tail = store._tail
+            started = time.perf_counter()
+            create_store('jsonl', data_dir, snapshot_every=every)
+            times.append((time.perf_counter() - started) * 1000)
+        print(f"{size:>9}{times[0]:>16.1f}{times[1]:>20.1f}{tail:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', nargs='+', default=['jsonl', 'sqlite'])
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--max-records', type=int, default=200, help="сколько записей максимум за раунд")
+    parser.add_argument('--max-seconds', type=float, default=1.0)
+    parser.add_argument('--snapshot-every', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--recovery-sizes', type=int, nargs='*', default=[10500, 50500])
+    parser.add_argument('--recovery-snapshot-every', type=int, default=1000)
+    parser.add_argument('--writer', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    parser.add_argument('--start', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--exit-after-replace', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.writer:
+        writer(args)
+        return
+
+    print(
+        f"{'Хранилище':>10}{'раундов':>9}{'подтверждено':>14}{'в хранилище':>13}"
+        f"{'падений у замены':>18}{'открытие p50/max, мс':>22}{'ошибок':>8}"
+    )
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backend:
+            acknowledged, records, failures, injected, recoveries = run(backend, args, tmp)
+            recoveries.sort()
+            recovery = f"{recoveries[len(recoveries) // 2] * 1000:.1f}/{recoveries[-1] * 1000:.1f}"
+            print(
+                f"{backend:>10}{args.rounds:>9}{acknowledged:>14}{records:>13}"
+                f"{injected:>18}{recovery:>22}{failures:>8}"
+            )
+            failed = failed or failures > 0
+        if args.recovery_sizes:
+            bench_recovery(args.recovery_sizes, args.recovery_snapshot_every, tmp)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Локальная замена Bot API для стендов: бот работает без сети и без токена
+
+FakeTelegram подставляется в Application.builder() через request(...) и
+get_updates_request(...). Исходящие вызовы (sendMessage, sendDocument и т.д.)
+фиксируются с отметкой времени, getUpdates отдает обновления из очереди.
+Задержка сети моделируется параметром rtt: половина на запрос, половина на ответ.
+С flood_limits отправки сверх лимитов Telegram получают ответ 429 с retry_after.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import defaultdict, deque
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': 'Interview Bot', 'username': 'interview_test_bot'}
+
+# Лимиты Telegram для бота: сообщений в секунду всего, в секунду в один личный чат, в минуту в группу
+TELEGRAM_LIMITS = {'overall': 30, 'chat': 3, 'group_per_minute': 20}
+
+# Полный сценарий интервью: одна строка на сообщение респондента
+INTERVIEW_SCRIPT = [
+    "/start",
+    "Студент 2 курса",
+    "Утром пары, потом библиотека, вечером подработка",
+    "Длинные очереди",
+    "Продолжить",
+    "Очереди в столовой и нет времени поесть",
+    "Очереди в столовой",
+    "Вчера простоял 20 минут и опоздал на пару",
+    "Все приходят в одно время",
+    "Злость",
+    "8",
+    "дальше",
+    "Предзаказ еды к перемене",
+    "Что проблема не в еде, а во времени",
+    "Успевать поесть за перемену",
+    "Покупает перекусы в автомате",
+    "До 300 рублей за обед",
+]
+
+PAIN_STEPS = slice(6, 11)  # Название, случай, причина, эмоция, оценка одной боли
+
+
+def interview_script(pains=1):
+    """Сценарий интервью с pains болями (цикл разбора болей повторяется)"""
+    script = INTERVIEW_SCRIPT[:PAIN_STEPS.start]
+    for number in range(1, pains + 1):
+        name, *rest = INTERVIEW_SCRIPT[PAIN_STEPS]
+        script += [f"{name} ({number})", *rest]
+    return script + INTERVIEW_SCRIPT[PAIN_STEPS.stop:]
+
+
+def make_update(update_id, user_id, text):
+    """Обновление в формате Bot API с текстовым сообщением от пользователя"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': f'User {user_id}'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def load_updates(path):
+    """Записанные обновления: JSONL, одно обновление Bot API на строку"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(fake, deliver, conversations, on_reply=None, timeout=60, stalled=None):
+    """Проигрывает диалоги параллельно, в каждом чате - строго по очереди
+
+    Следующее сообщение пользователя отправляется только после ответа бота
+    на предыдущее, как в живом интервью. deliver(update) доставляет обновление
+    боту; on_reply(update, задержка) вызывается на каждый первый ответ.
+    Если передан список stalled, диалог без ответа за timeout секунд
+    прерывается, а обновление добавляется в stalled (иначе - TimeoutError).
+    Возвращает список задержек в секундах.
+    """
+    loop = asyncio.get_running_loop()
+    pending = {}
+
+    def on_send(method, chat_id, at):
+        future = pending.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(at)
+
+    fake.listen(on_send)
+    latencies = []
+
+    async def user(updates):
+        for update in updates:
+            future = loop.create_future()
+            pending[update['message']['chat']['id']] = future
+            started = time.perf_counter()
+            await deliver(update)
+            try:
+                replied = await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                if stalled is None:
+                    raise
+                stalled.append(update)
+                return
+            latencies.append(replied - started)
+            if on_reply is not None:
+                on_reply(update, replied - started)
+
+    await asyncio.gather(*(user(updates) for updates in conversations))
+    return latencies
+
+
+class FakeTelegram(BaseRequest):
+    """Слой запросов, который отвечает вместо api.telegram.org"""
+
+    def __init__(self, rtt=0.0, flood_limits=None):
+        self.rtt = rtt
+        self.flood_limits = flood_limits
+        self.rejected = 0  # Ответы 429 Too Many Requests
+        self._overall_window = deque()
+        self._chat_windows = defaultdict(deque)
+        self.updates = asyncio.Queue()
+        self.sent = []  # (время доставки, метод, chat_id, параметры)
+        self.calls = {}
+        self._listeners = []
+        self._next_message_id = 1
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def listen(self, callback):
+        """callback(метод, chat_id, время) вызывается при каждом исходящем сообщении"""
+        self._listeners.append(callback)
+
+    def push_update(self, update):
+        """Обновление "пришло в Telegram" и будет отдано ближайшему getUpdates"""
+        self.updates.put_nowait(update)
+
+    async def _network(self):
+        if self.rtt:
+            await asyncio.sleep(self.rtt / 2)
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+
+        # Запрос идет до Telegram
+        await self._network()
+
+        if api_method == 'getUpdates':
+            result = await self._get_updates(params)
+        elif api_method == 'getMe':
+            result = BOT_USER
+        elif api_method.startswith('send'):
+            retry_after = self._flood_check(int(params.get('chat_id', 0)))
+            if retry_after:
+                self.rejected += 1
+                await self._network()
+                return 429, json.dumps({
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                }).encode('utf-8')
+            result = self._record(api_method, params)
+        else:
+            # setWebhook, deleteWebhook, setMyCommands и прочие служебные вызовы
+            result = True
+
+        # Ответ идет обратно к боту
+        await self._network()
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+    async def _get_updates(self, params):
+        # Long polling: ждем первое обновление не дольше timeout, затем забираем все накопленные
+        timeout = float(params.get('timeout') or 0)
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.01))
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return batch
+
+    def _flood_check(self, chat_id):
+        """0, если отправка укладывается в лимиты (и учитывается), иначе retry_after в секундах"""
+        if not self.flood_limits:
+            return 0
+        now = time.monotonic()
+        if chat_id < 0:
+            window, limit = 60.0, self.flood_limits['group_per_minute']
+        else:
+            window, limit = 1.0, self.flood_limits['chat']
+        checks = [
+            (self._overall_window, 1.0, self.flood_limits['overall']),
+            (self._chat_windows[chat_id], window, limit),
+        ]
+        retry_after = 0
+        for events, length, events_limit in checks:
+            while events and events[0] <= now - length:
+                events.popleft()
+            if len(events) >= events_limit:
+                retry_after = max(retry_after, math.ceil(events[0] + length - now))
+        if retry_after:
+            return max(1, retry_after)
+        for events, _, _ in checks:
+            events.append(now)
+        return 0
+
+    def _record(self, api_method, params):
+        now = time.perf_counter()
+        chat_id = int(params.get('chat_id', 0))
+        self.sent.append((now, api_method, chat_id, params))
+        for callback in self._listeners:
+            callback(api_method, chat_id, now)
+
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+        }
+        if api_method == 'sendMessage':
+            message['text'] = str(params.get('text', ''))
+        elif api_method == 'sendDocument':
+            message['document'] = {'file_id': f'doc{message_id}', 'file_unique_id': f'u{message_id}'}
+        return message
@@ -1,12 +1,41 @@
 import logging
-import pandas as pd
 import os
+import io
+import asyncio
+import contextlib
+import functools
+import importlib
+import secrets
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
+from telegram import Bot, Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.ext import (
+    Application, ApplicationHandlerStop, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes,
+    ConversationHandler,
+)
 from telegram.error import BadRequest
 import re
 from dotenv import load_dotenv
+from storage import create_store, CANONICAL_KEY, PAINS_KEY
+from analytics import PainIndex, RunningStats, compute_analytics
+from pains import canonical_pain
+from search import SearchIndex, snippet, terms
+from exporters import EXPORT_FORMATS, ExportFormatUnavailable, write_export
+from importer import ImportFormatError, import_file, import_format
+from update_processor import ChatOrderedUpdateProcessor
+from rate_limiter import BULK, OVERALL_BURST, PriorityRateLimiter
+from reports import REPORT_DOCUMENT_FORMATS, report_document, split_message
+from models import InterviewData, Pain
+from persistence import SESSIONS_FILENAME, SQLiteSessionPersistence
+from sessions import EXPIRED_KEY, SessionManager
+from workers import WorkerPool, feed_updates, ignore_stop_signals, serve_ingress
+from metrics import (
+    HANDLER_DURATION, HANDLER_ERRORS, SIZE_BUCKETS, install_error_counter, instrument_application, metrics,
+    start_http_server,
+)
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
@@ -25,8 +54,114 @@ logger = logging.getLogger(__name__)
  CONFIRM_CLEAR_DATA) = range(17)
 
 # Хранилище данных
-interviews = {}
-all_interviews = []  # Глобальная база всех интервью
+store = None  # Глобальная база всех интервью (см. get_store)
+running_stats = None  # Агрегаты для /stats (см. get_running_stats)
+search_index = None  # Поисковый индекс для /search (см. get_search_index)
+pain_index = None  # Частоты болей для /pains (см. get_pain_index)
+_index_builds = {}  # Построения индексов, которые уже идут в потоке (см. build_index_in_thread)
+
+# Файлы данных
+DATA_DIR = os.getenv('DATA_DIR', os.getcwd())
+EXCEL_FILENAME = "все_интервью.xlsx"
+
+# Бэкенд хранения:
+#   sqlite - база interviews.db (по умолчанию)
+#   jsonl  - журнал все_интервью.jsonl, каждое интервью дописывается одной строкой;
+#            каждые JSONL_SNAPSHOT_EVERY записей журнал переносится в снимок все_интервью.snapshot
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite').lower()
+SQLITE_COMMIT_BATCH = int(os.getenv('SQLITE_COMMIT_BATCH', '1'))
+JSONL_SNAPSHOT_EVERY = int(os.getenv('JSONL_SNAPSHOT_EVERY', '1000'))
+# Сбрасывать каждое сохраненное интервью на диск (fsync): переживает и отключение питания
+STORAGE_FSYNC = os.getenv('STORAGE_FSYNC', '1') == '1'
+# Перезаписывать таблицу Excel после каждого интервью (иначе она строится только по /export_all)
+EXCEL_AUTOSAVE = os.getenv('EXCEL_AUTOSAVE', '0') == '1'
+
+# Отложенная запись: изменения сбрасываются на диск не чаще раза в FLUSH_INTERVAL секунд
+# или сразу, когда накопилось FLUSH_MAX_PENDING новых интервью
+FLUSH_INTERVAL = float(os.getenv('FLUSH_INTERVAL', '30'))
+FLUSH_MAX_PENDING = int(os.getenv('FLUSH_MAX_PENDING', '20'))
+
+# Пул для построения Excel-файлов (чтобы не блокировать event loop)
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '1'))
+EXPORT_QUEUE_SIZE = int(os.getenv('EXPORT_QUEUE_SIZE', '4'))
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='export')
+_export_slots = None  # asyncio.Semaphore, создается в event loop при первом использовании
+
+# Несколько процессов-обработчиков (только BOT_MODE=webhook и STORAGE_BACKEND=sqlite): главный
+# процесс принимает webhook и раздает обновления по chat id, интервью и сессии - в общих файлах SQLite
+WORKERS = int(os.getenv('WORKERS', '1'))
+# Файлы выгрузки строятся одним процессом за раз; дольше этого блокировку не ждем
+EXPORT_LOCK_TIMEOUT = float(os.getenv('EXPORT_LOCK_TIMEOUT', '300'))
+SHARED_EXPORTS_DIR = 'exports'  # Готовые файлы выгрузки, общие для процессов (в DATA_DIR)
+export_lock = None  # multiprocessing.Lock в процессе-обработчике (см. worker_main)
+
+# Сервер Bot API (например, свой telegram-bot-api); по умолчанию api.telegram.org
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org').rstrip('/')
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Публичный адрес бота без пути, например https://my-bot.up.railway.app
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+# Railway и Render передают порт в PORT
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8443')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Незавершенные интервью сохраняются в sessions.db не реже раза в SESSIONS_INTERVAL секунд
+# и продолжаются с того же шага после перезапуска
+SESSIONS_INTERVAL = float(os.getenv('SESSIONS_INTERVAL', '5'))
+
+# Интервью без ответов дольше SESSION_TTL секунд закрываются (0 - не закрывать);
+# сборщик проверяет сессии раз в SESSION_SWEEP_INTERVAL секунд
+SESSION_TTL = float(os.getenv('SESSION_TTL', '7200'))
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '600'))
+# Сообщать интервьюеру, что интервью закрыто из-за неактивности
+SESSION_NOTIFY = os.getenv('SESSION_NOTIFY', '1') == '1'
+
+SESSION_EXPIRED_TEXT = (
+    "⌛ Интервью закрыто из-за долгого отсутствия ответов.\n"
+    "Несохраненные ответы удалены. Начать заново: /start"
+)
+
+# Ограничение исходящих сообщений под лимиты Telegram: общее (в секунду) и на один чат
+# (в секунду, с допустимой пачкой); при RetryAfter отправка повторяется
+RATE_LIMIT = os.getenv('RATE_LIMIT', '1') == '1'
+RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', '25'))
+RATE_LIMIT_CHAT = float(os.getenv('RATE_LIMIT_CHAT', '1'))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '3'))
+RATE_LIMIT_RETRIES = int(os.getenv('RATE_LIMIT_RETRIES', '3'))
+
+# Отчет, которому нужно больше REPORT_DOCUMENT_AFTER сообщений, отправляется одним файлом
+# (REPORT_DOCUMENT_FORMAT: html или txt); 0 - всегда сообщениями
+REPORT_DOCUMENT_AFTER = int(os.getenv('REPORT_DOCUMENT_AFTER', '2'))
+REPORT_DOCUMENT_FORMAT = os.getenv('REPORT_DOCUMENT_FORMAT', 'html').lower()
+if REPORT_DOCUMENT_FORMAT not in REPORT_DOCUMENT_FORMATS:
+    REPORT_DOCUMENT_FORMAT = 'html'
+
+# Сколько интервью показывать в ответе /search
+SEARCH_RESULTS = int(os.getenv('SEARCH_RESULTS', '10'))
+# /pains: сколько болей в топе и сколько респондентов перечислять
+PAINS_TOP = int(os.getenv('PAINS_TOP', '10'))
+PAINS_RESPONDENTS = int(os.getenv('PAINS_RESPONDENTS', '50'))
+# /import и python bot.py import: сколько строк файла записывать в хранилище одной пачкой
+IMPORT_CHUNK = int(os.getenv('IMPORT_CHUNK', '200'))
+
+# Сколько обновлений обрабатывается одновременно (разные чаты параллельно,
+# сообщения одного чата - по очереди); 1 - последовательная обработка
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '32'))
+
+# Страница метрик Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 - выключена)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# Telegram id пользователей, которым доступна команда /metrics (через запятую; пусто - всем)
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').replace(',', ' ').split()}
+
+# pandas и openpyxl нужны только для выгрузок и аналитики, поэтому импортируются при первом
+# использовании; через PREWARM_DELAY секунд после запуска они подгружаются в фоне
+PREWARM_IMPORTS = os.getenv('PREWARM_IMPORTS', '1') == '1'
+PREWARM_DELAY = float(os.getenv('PREWARM_DELAY', '5'))
+HEAVY_MODULES = ('pandas', 'openpyxl')
 
 # Константы для кнопок
 PAIN_POINT_OPTIONS = [
@@ -40,25 +175,6 @@ EMOTION_OPTIONS = [
     ["Усталость", "Тревога", "Другое"]
 ]
 
-class InterviewData:
-    """Класс для хранения данных интервью"""
-    def __init__(self):
-        self.respondent_id = None
-        self.date = None
-        self.duration = None
-        self.day_description = ""
-        self.pain_points = []
-        self.main_pains = ""
-        self.most_annoying = ""
-        self.pain_analysis = []
-        self.magic_wand = ""
-        self.insights = {
-            "surprise": "",
-            "hidden_needs": "",
-            "food_signals": "",
-            "willingness_to_pay": ""
-        }
-
 def escape_markdown(text):
     """Экранирует специальные символы Markdown"""
     if not text:
@@ -80,8 +196,6 @@ def safe_markdown_text(text, parse_mode='Markdown'):
 
 def save_to_global_database(interview):
     """Сохраняем интервью в общую базу"""
-    global all_interviews
-    
     try:
         # Преобразуем данные в удобный формат
         interview_data = {
@@ -92,74 +206,382 @@ def save_to_global_database(interview):
             'Основные_проблемы': interview.main_pains or '',
             'Самая_раздражающая': interview.most_annoying or '',
             'Волшебная_палочка': interview.magic_wand or '',
-            'Что_удивило': interview.insights.get('surprise', '') or '',
-            'Скрытые_потребности': interview.insights.get('hidden_needs', '') or '',
-            'Сигналы_о_еде': interview.insights.get('food_signals', '') or '',
-            'Готовность_платить': interview.insights.get('willingness_to_pay', '') or '',
+            'Что_удивило': interview.insights.surprise or '',
+            'Скрытые_потребности': interview.insights.hidden_needs or '',
+            'Сигналы_о_еде': interview.insights.food_signals or '',
+            'Готовность_платить': interview.insights.willingness_to_pay or '',
             'Время_записи': datetime.now()
         }
         
-        # Добавляем анализ болей (до 10 болей для удобства)
-        max_pains = 10
-        for i, pain in enumerate(interview.pain_analysis[:max_pains], 1):
-            interview_data[f'Боль_{i}_Название'] = pain.get('name', '') or ''
-            interview_data[f'Боль_{i}_Оценка'] = pain.get('score', 0) or 0
-            interview_data[f'Боль_{i}_Эмоция'] = pain.get('emotion', '') or ''
-            interview_data[f'Боль_{i}_Случай'] = pain.get('last_case', '') or ''
-            interview_data[f'Боль_{i}_Причина'] = pain.get('reason', '') or ''
+        # Добавляем анализ болей (все боли, в хранилище они лежат отдельной таблицей)
+        interview_data[PAINS_KEY] = [
+            {
+                'Название': pain.name or '',
+                'Оценка': pain.score or 0,
+                'Эмоция': pain.emotion or '',
+                'Случай': pain.last_case or '',
+                'Причина': pain.reason or '',
+                CANONICAL_KEY: canonical_pain(pain.name),
+            }
+            for pain in interview.pain_analysis
+        ]
         
-        all_interviews.append(interview_data)
+        interview_id = get_store().add(interview_data)
+        if running_stats is not None:
+            running_stats.add_saved(interview_data, interview_id)
+        if search_index is not None:
+            search_index.add_saved(interview_data, interview_id)
+        if pain_index is not None:
+            pain_index.add_saved(interview_data, interview_id)
         logger.info(f"Интервью респондента {interview.respondent_id} сохранено в базу")
         
-        # Автосохранение в файл
-        save_all_to_excel()
-        
     except Exception as e:
         logger.error(f"Ошибка при сохранении интервью в базу: {e}", exc_info=True)
         raise
 
-def save_all_to_excel():
-    """Сохраняем все данные в Excel"""
-    global all_interviews
+def index_imported(saved):
+    """Учитывает в индексах пачку [(запись, ID)], загруженную /import (вызывается в event loop)
+
+    Импорт пишет пачки в потоке, а индексы меняются только в event loop,
+    поэтому каждая пачка передается сюда через call_soon_threadsafe.
+    """
+    for index in (running_stats, search_index, pain_index):
+        if index is not None:
+            for record, interview_id in saved:
+                index.add_saved(record, interview_id)
+
+def get_store():
+    """Возвращает хранилище интервью, создавая его при первом обращении"""
+    global store
+    if store is None:
+        store = create_store(
+            STORAGE_BACKEND, DATA_DIR, commit_batch=SQLITE_COMMIT_BATCH,
+            snapshot_every=JSONL_SNAPSHOT_EVERY, fsync=STORAGE_FSYNC,
+        )
+        logger.info(f"Storage backend: {STORAGE_BACKEND}, records: {store.count()}")
+    return store
+
+async def build_index_in_thread(key, build):
+    """Строит индекс функцией build в потоке и дочитывает интервью, сохраненные за это время
+
+    Event loop во время построения обрабатывает обновления; одновременные
+    запросы ждут одно и то же построение (по ключу key).
+    """
+    future = _index_builds.get(key)
+    if future is None:
+        future = _index_builds[key] = asyncio.get_running_loop().run_in_executor(None, build)
+    try:
+        index = await asyncio.shield(future)
+    finally:
+        if _index_builds.get(key) is future and future.done():
+            del _index_builds[key]
+    index.catch_up(get_store())
+    return index
+
+def build_running_stats():
+    """Считает агрегаты /stats по всем интервью (выполняется в потоке)"""
+    started = time.perf_counter()
+    stats = RunningStats()
+    stats.rebuild(get_store())
+    logger.info(f"Running stats built: {stats.total} interviews in {time.perf_counter() - started:.2f}s")
+    return stats
+
+async def get_running_stats():
+    """Возвращает агрегаты для /stats
+
+    Полный проход по хранилищу (после запуска или очистки) идет в потоке;
+    дальше интервью, сохраненные другими процессами, дочитываются по ID.
+    """
+    global running_stats
+    if running_stats is not None and running_stats.catch_up(get_store()):
+        return running_stats
+    running_stats = await build_index_in_thread('stats', build_running_stats)
+    return running_stats
+
+def build_pain_index():
+    """Считает частоты болей /pains по всем интервью (выполняется в потоке)"""
+    started = time.perf_counter()
+    index = PainIndex()
+    index.rebuild(get_store())
+    logger.info(f"Pain index built: {len(index.mentions)} pains in {time.perf_counter() - started:.2f}s")
+    return index
+
+async def get_pain_index():
+    """Возвращает частоты болей для /pains (как get_running_stats)"""
+    global pain_index
+    if pain_index is not None and pain_index.catch_up(get_store()):
+        return pain_index
+    pain_index = await build_index_in_thread('pains', build_pain_index)
+    return pain_index
+
+def build_search_index():
+    """Строит поисковый индекс по всем интервью (выполняется в потоке)"""
+    started = time.perf_counter()
+    index = SearchIndex()
+    index.rebuild(get_store())
+    logger.info(
+        f"Search index built: {len(index)} interviews, {index.term_count} terms "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+    return index
+
+async def get_search_index():
+    """Возвращает поисковый индекс, дочитывая интервью других процессов (как get_running_stats)"""
+    global search_index
+    if search_index is not None and search_index.catch_up(get_store()):
+        return search_index
+    search_index = await build_index_in_thread('search', build_search_index)
+    return search_index
+
+class ExportQueueFull(Exception):
+    """Очередь построения файлов переполнена"""
+
+@contextlib.contextmanager
+def exclusive_export():
+    """Общая для процессов-обработчиков блокировка записи файлов (в одном процессе не нужна)"""
+    if export_lock is None:
+        yield
+        return
+    if not export_lock.acquire(timeout=EXPORT_LOCK_TIMEOUT):
+        raise ExportQueueFull()
+    try:
+        yield
+    finally:
+        export_lock.release()
+
+def write_file_atomic(path, data):
+    """Записывает файл целиком: читатели видят либо старую, либо новую версию"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        # Иначе после сбоя питания на месте файла может оказаться пустой
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+async def run_in_export_pool(func, *args):
+    """Выполняет тяжелую операцию в пуле потоков, не блокируя event loop"""
+    global _export_slots
     
-    if not all_interviews:
-        logger.warning("No data to save to Excel")
-        return None
+    if _export_slots is None:
+        # Работающие задачи + ожидающие в очереди
+        _export_slots = asyncio.Semaphore(EXPORT_WORKERS + EXPORT_QUEUE_SIZE)
     
-    try:
-        df = pd.DataFrame(all_interviews)
+    if _export_slots.locked():
+        raise ExportQueueFull()
+    
+    async with _export_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(export_executor, functools.partial(func, *args))
+
+class WriteBehind:
+    """Отложенная запись: объединяет сохранения при пачке завершенных интервью
+    
+    Интервью помечают данные как измененные, а фиксация хранилища и перезапись
+    таблицы Excel выполняются одним сбросом по таймеру JobQueue.
+    """
+    def __init__(self, interval, max_pending):
+        self.interval = interval
+        self.max_pending = max(1, max_pending)
+        self.pending = 0
+        self.job_queue = None
+        self._flushing = False
+        self._flush_scheduled = False  # Досрочный сброс уже поставлен в JobQueue
+    
+    def start(self, job_queue):
+        """Запускает периодический сброс"""
+        if job_queue is None:
+            logger.warning("JobQueue is not available, changes will be flushed immediately")
+            return
+        self.job_queue = job_queue
+        job_queue.run_repeating(self._on_timer, interval=self.interval, first=self.interval, name='write_behind')
+    
+    def mark_dirty(self):
+        """Отмечает, что появились несохраненные изменения"""
+        self.pending += 1
+        if self.job_queue is None:
+            asyncio.get_running_loop().create_task(self.flush())
+        else:
+            self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """Порог достигнут - сбрасываем, не дожидаясь таймера (один раз на пачку)"""
+        if self.pending >= self.max_pending and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.job_queue.run_once(self._on_timer, 0, name='write_behind_now')
+    
+    async def _on_timer(self, context: ContextTypes.DEFAULT_TYPE):
+        await self.flush()
+    
+    async def flush(self):
+        """Сбрасывает накопленные изменения"""
+        self._flush_scheduled = False
+        if not self.pending or self._flushing:
+            return
         
-        # Сортируем по времени записи
-        if 'Время_записи' in df.columns:
-            df = df.sort_values('Время_записи', ascending=True)
+        self._flushing = True
+        pending = self.pending
+        self.pending = 0
+        try:
+            get_store().flush()
+            if EXCEL_AUTOSAVE:
+                # Одна перезапись таблицы вместо отдельной на каждое интервью
+                data = await get_export_file('xlsx', 'all')
+                if data:
+                    await run_in_export_pool(save_all_to_excel, data)
+            logger.info(f"Flushed {pending} pending interviews")
+        except ExportQueueFull:
+            # Повторим на следующем срабатывании таймера или при следующем сохранении
+            self.pending += pending
+            return
+        except Exception as e:
+            logger.error(f"Error flushing pending interviews: {e}", exc_info=True)
+        finally:
+            self._flushing = False
         
-        # Определяем путь к файлу (используем текущую директорию)
+        # Интервью, сохраненные во время сброса, могли снова набрать порог
+        if self.job_queue is not None:
+            self._schedule_flush()
+
+write_behind = WriteBehind(FLUSH_INTERVAL, FLUSH_MAX_PENDING)
+
+session_manager = SessionManager(SESSION_TTL)
+
+class VersionedCache:
+    """Кэш результатов по версии данных (файлы экспорта, аналитика)
+    
+    Хранит результаты только для последней версии: при изменении данных
+    старые значения вытесняются.
+    """
+    def __init__(self):
+        self.version = None
+        self.files = {}
+    
+    def get(self, version, key):
+        if version != self.version:
+            return None
+        return self.files.get(key)
+    
+    def put(self, version, key, data):
+        if version != self.version:
+            self.files.clear()
+            self.version = version
+        self.files[key] = data
+
+export_cache = VersionedCache()
+analytics_cache = VersionedCache()
+
+async def get_export_file(fmt='xlsx', table='all', compress=False):
+    """Возвращает файл экспорта из кэша или строит его в пуле"""
+    key = f"{fmt}:{table}{'.gz' if compress else ''}"
+    # Версия берется до построения: если данные изменятся во время сборки,
+    # следующий запрос увидит новую версию и построит файл заново
+    version = get_store().version()
+    data = export_cache.get(version, key)
+    if data is None:
+        if export_lock is not None:
+            data = await run_in_export_pool(build_shared_export, fmt, table, compress, version)
+        else:
+            data = await run_in_export_pool(build_export_bytes, fmt, table, compress)
+        if data:
+            export_cache.put(version, key, data)
+    else:
+        logger.info(f"Export '{key}' served from cache (version {version})")
+    return data
+
+def build_export_bytes(fmt='xlsx', table='all', compress=False):
+    """Строит файл выгрузки со всеми интервью (xlsx, csv, jsonl или parquet)
+    
+    Записи читаются из хранилища по одной (уже в порядке времени записи)
+    и сразу пишутся в файл, без промежуточного списка и DataFrame.
+    """
+    store = get_store()
+    if store.count() == 0:
+        logger.warning("No data to export")
+        return None
+    
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    total = write_export(fmt, table, store, buffer, compress=compress)
+    
+    labels = {'format': f"{fmt}.gz" if compress else fmt, 'table': table}
+    metrics.histogram('bot_export_duration_seconds', "Время построения файла выгрузки", **labels).observe(
+        time.perf_counter() - started
+    )
+    metrics.histogram('bot_export_size_bytes', "Размер файла выгрузки", SIZE_BUCKETS, **labels).observe(buffer.tell())
+    
+    logger.info(f"Export built: {fmt}/{table}{' (gzip)' if compress else ''}, rows: {total}, size: {buffer.tell()} bytes")
+    return buffer.getvalue()
+
+def build_shared_export(fmt, table, compress, version):
+    """Файл выгрузки в режиме нескольких процессов
+    
+    Строит один процесс за раз; файл той же версии данных, уже построенный
+    другим процессом, читается с диска.
+    """
+    directory = os.path.join(DATA_DIR, SHARED_EXPORTS_DIR)
+    name = f"{fmt}_{table}{'.gz' if compress else ''}"
+    path = os.path.join(directory, f"{version}_{name}")
+    with exclusive_export():
+        if os.path.exists(path):
+            logger.info(f"Export '{name}' served from {path}")
+            with open(path, 'rb') as f:
+                return f.read()
+        
+        data = build_export_bytes(fmt, table, compress)
+        if data:
+            os.makedirs(directory, exist_ok=True)
+            write_file_atomic(path, data)
+            # Файлы прошлых версий данных больше не понадобятся
+            for filename in os.listdir(directory):
+                if not filename.startswith(f"{version}_"):
+                    with contextlib.suppress(OSError):
+                        os.remove(os.path.join(directory, filename))
+        return data
+
+def clear_excel_file():
+    """Перезаписывает таблицу Excel пустой (только заголовки)"""
+    buffer = io.BytesIO()
+    write_export('xlsx', 'all', get_store(), buffer)
+    with exclusive_export():
+        write_file_atomic(os.path.join(DATA_DIR, EXCEL_FILENAME), buffer.getvalue())
+
+def save_all_to_excel(data):
+    """Сохраняем готовую таблицу Excel в файл"""
+    try:
+        # Определяем путь к файлу (по умолчанию текущая директория)
         # На Railway файлы можно сохранять в корневую директорию проекта
-        filename = "все_интервью.xlsx"
-        filepath = os.path.join(os.getcwd(), filename)
+        filepath = os.path.join(DATA_DIR, EXCEL_FILENAME)
         
-        # Сохраняем в файл
-        df.to_excel(filepath, index=False, engine='openpyxl')
+        # Несколько процессов пишут один файл: по очереди и через временный файл
+        with exclusive_export():
+            write_file_atomic(filepath, data)
         
-        logger.info(f"Data saved to {filepath}, total records: {len(all_interviews)}")
+        logger.info(f"Data saved to {filepath}")
         return filepath
         
     except Exception as e:
         logger.error(f"Error saving to Excel: {e}", exc_info=True)
         return None
 
-def get_user_interview(user_id):
-    """Получает интервью пользователя или создает новое"""
-    if user_id not in interviews:
-        interviews[user_id] = InterviewData()
-    return interviews[user_id]
+def bulk_send_args(context):
+    """rate_limit_args для массовых отправок (отчеты, файлы): они уступают очередь подсказкам интервью"""
+    return {'rate_limit_args': BULK} if context.bot.rate_limiter else {}
+
+def get_user_interview(context):
+    """Получает интервью пользователя или создает новое
+    
+    Интервью хранится в user_data, поэтому сохраняется вместе с сессией
+    и восстанавливается после перезапуска бота.
+    """
+    if 'interview' not in context.user_data:
+        context.user_data['interview'] = InterviewData()
+    return context.user_data['interview']
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало интервью"""
-    user_id = update.message.from_user.id
-    
     # Если уже есть активное интервью, предупреждаем
-    if user_id in interviews:
+    if 'interview' in context.user_data:
         await update.message.reply_text(
             "⚠️ У вас уже есть активное интервью.\n"
             "Начинаю новое интервью. Старые данные будут потеряны.\n\n"
@@ -168,7 +590,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     # Создаем новое интервью
-    interviews[user_id] = InterviewData()
+    context.user_data['interview'] = InterviewData()
     
     try:
         await update.message.reply_text(
@@ -187,10 +609,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def respondent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получение номера респондента"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         interview.respondent_id = update.message.text.strip()
         interview.date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
@@ -208,10 +628,8 @@ async def respondent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def day_map(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Описание дня"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         interview.day_description = update.message.text.strip()
         
         keyboard = PAIN_POINT_OPTIONS.copy()
@@ -234,11 +652,10 @@ async def day_map(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def pain_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка точек напряжения"""
-    user_id = update.message.from_user.id
     choice = update.message.text.strip()
     
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         
         # Обработка специальных команд
         if choice == "Продолжить":
@@ -283,10 +700,8 @@ async def pain_points(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def pain_points_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ввода других проблем"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         other_text = update.message.text.strip()
         
         if other_text and other_text not in interview.pain_points:
@@ -327,10 +742,8 @@ async def regular_problems_start(update: Update, context: ContextTypes.DEFAULT_T
 
 async def regular_problems(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Основные боли"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         interview.main_pains = update.message.text.strip()
         
         await update.message.reply_text(
@@ -347,25 +760,18 @@ async def regular_problems(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def pain_analysis_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка ввода названия боли или команды"""
-    user_id = update.message.from_user.id
     text = update.message.text.strip()
     text_lower = text.lower()
     
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         
         # Проверяем команды для перехода дальше
         if text_lower in ['дальше', 'продолжить', 'next', '➡️', 'пропустить', 'skip']:
             # Если еще не было добавлено ни одной боли, сохраняем most_annoying как первую
             if not interview.pain_analysis and interview.most_annoying:
                 # Создаем простую запись о боли
-                interview.pain_analysis.append({
-                    'name': interview.most_annoying,
-                    'last_case': '',
-                    'reason': '',
-                    'emotion': '',
-                    'score': 0
-                })
+                interview.pain_analysis.append(Pain(name=interview.most_annoying))
             return await magic_wand_start(update, context)
         
         # Если не команда, то это название новой боли
@@ -374,13 +780,7 @@ async def pain_analysis_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
             interview.most_annoying = pain_name
         
         # Инициализируем текущую боль
-        context.user_data['current_pain'] = {
-            'name': pain_name,
-            'last_case': '',
-            'reason': '',
-            'emotion': '',
-            'score': 0
-        }
+        context.user_data['current_pain'] = Pain(name=pain_name)
         
         await update.message.reply_text(
             f"📝 Боль: {pain_name}\n\n"
@@ -398,9 +798,9 @@ async def pain_analysis_case(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Получаем описание случая"""
     try:
         if 'current_pain' not in context.user_data:
-            context.user_data['current_pain'] = {}
+            context.user_data['current_pain'] = Pain()
         
-        context.user_data['current_pain']['last_case'] = update.message.text.strip()
+        context.user_data['current_pain'].last_case = update.message.text.strip()
         
         await update.message.reply_text(
             "❓ Почему было тяжело?\n\n"
@@ -418,9 +818,9 @@ async def pain_analysis_reason(update: Update, context: ContextTypes.DEFAULT_TYP
     """Получаем причину сложностей"""
     try:
         if 'current_pain' not in context.user_data:
-            context.user_data['current_pain'] = {}
+            context.user_data['current_pain'] = Pain()
         
-        context.user_data['current_pain']['reason'] = update.message.text.strip()
+        context.user_data['current_pain'].reason = update.message.text.strip()
         
         keyboard = [row[:] for row in EMOTION_OPTIONS]  # Копируем список
         reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
@@ -441,7 +841,7 @@ async def pain_analysis_emotion(update: Update, context: ContextTypes.DEFAULT_TY
     """Получаем эмоцию"""
     try:
         if 'current_pain' not in context.user_data:
-            context.user_data['current_pain'] = {}
+            context.user_data['current_pain'] = Pain()
         
         emotion_text = update.message.text.strip()
         
@@ -453,7 +853,7 @@ async def pain_analysis_emotion(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return PAIN_EMOTION
         
-        context.user_data['current_pain']['emotion'] = emotion_text
+        context.user_data['current_pain'].emotion = emotion_text
         
         keyboard = [
             [str(i) for i in range(1, 6)],
@@ -476,14 +876,12 @@ async def pain_analysis_emotion(update: Update, context: ContextTypes.DEFAULT_TY
 
 async def pain_analysis_score(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Получаем оценку и завершаем анализ одной боли"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         
         # Обработка эмоции, если это текстовый ввод
-        if 'current_pain' in context.user_data and not context.user_data['current_pain'].get('emotion'):
-            context.user_data['current_pain']['emotion'] = update.message.text.strip()
+        if 'current_pain' in context.user_data and not context.user_data['current_pain'].emotion:
+            context.user_data['current_pain'].emotion = update.message.text.strip()
             await update.message.reply_text(
                 "📊 Оценка боли\n\n"
                 "Оцени боль от 1 до 10 (введи число):"
@@ -501,20 +899,14 @@ async def pain_analysis_score(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         if 'current_pain' not in context.user_data:
             logger.warning("current_pain не найден в user_data")
-            context.user_data['current_pain'] = {
-                'name': interview.most_annoying or 'Не указано',
-                'last_case': '',
-                'reason': '',
-                'emotion': '',
-                'score': score
-            }
+            context.user_data['current_pain'] = Pain(name=interview.most_annoying or 'Не указано', score=score)
         else:
-            context.user_data['current_pain']['score'] = score
+            context.user_data['current_pain'].score = score
         
-        # Сохраняем боль
-        interview.pain_analysis.append(context.user_data['current_pain'].copy())
+        # Сохраняем боль (объект больше не меняется, user_data очищается ниже)
+        interview.pain_analysis.append(context.user_data['current_pain'])
         
-        pain_name = context.user_data['current_pain']['name']
+        pain_name = context.user_data['current_pain'].name
         pain_count = len(interview.pain_analysis)
         
         await update.message.reply_text(
@@ -553,10 +945,8 @@ async def magic_wand_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def magic_wand(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ответ волшебной палочки"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
+        interview = get_user_interview(context)
         interview.magic_wand = update.message.text.strip()
         
         await update.message.reply_text(
@@ -573,11 +963,9 @@ async def magic_wand(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def insights_surprise(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Что удивило"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
-        interview.insights['surprise'] = update.message.text.strip()
+        interview = get_user_interview(context)
+        interview.insights.surprise = update.message.text.strip()
         
         await update.message.reply_text(
             "🎯 Скрытые потребности\n\n"
@@ -592,11 +980,9 @@ async def insights_surprise(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def insights_needs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Скрытые потребности"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
-        interview.insights['hidden_needs'] = update.message.text.strip()
+        interview = get_user_interview(context)
+        interview.insights.hidden_needs = update.message.text.strip()
         
         await update.message.reply_text(
             "🍔 Сигналы о еде/столовой\n\n"
@@ -611,11 +997,9 @@ async def insights_needs(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def insights_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сигналы о еде"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
-        interview.insights['food_signals'] = update.message.text.strip()
+        interview = get_user_interview(context)
+        interview.insights.food_signals = update.message.text.strip()
         
         await update.message.reply_text(
             "💰 Готовность платить\n\n"
@@ -630,15 +1014,15 @@ async def insights_food(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def insights_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Завершение инсайтов и интервью"""
-    user_id = update.message.from_user.id
-    
     try:
-        interview = get_user_interview(user_id)
-        interview.insights['willingness_to_pay'] = update.message.text.strip()
+        interview = get_user_interview(context)
+        interview.insights.willingness_to_pay = update.message.text.strip()
         
         # Сохраняем в общую базу
         try:
             save_to_global_database(interview)
+            # Фиксация и перезапись таблицы выполняются отложенно, пачкой
+            write_behind.mark_dirty()
             save_success = True
         except Exception as e:
             logger.error(f"Ошибка при сохранении интервью: {e}", exc_info=True)
@@ -646,15 +1030,7 @@ async def insights_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Генерируем и отправляем отчет
         report = generate_report(interview)
-        
-        # Разбиваем отчет на части, если он слишком длинный (лимит Telegram ~4096 символов)
-        max_length = 4000
-        if len(report) > max_length:
-            parts = [report[i:i+max_length] for i in range(0, len(report), max_length)]
-            for part in parts:
-                await update.message.reply_text(part)
-        else:
-            await update.message.reply_text(report)
+        await send_report(update, context, report, interview.respondent_id)
         
         # Сообщение о завершении
         status_msg = "✅ Данные сохранены" if save_success else "⚠️ Данные сохранены с ошибками"
@@ -670,8 +1046,8 @@ async def insights_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         # Очищаем сессию
-        if user_id in interviews:
-            del interviews[user_id]
+        if 'interview' in context.user_data:
+            del context.user_data['interview']
         if 'current_pain' in context.user_data:
             del context.user_data['current_pain']
         
@@ -685,6 +1061,24 @@ async def insights_complete(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ConversationHandler.END
 
+async def send_report(update: Update, context: ContextTypes.DEFAULT_TYPE, report, respondent_id):
+    """Отправляет отчет минимальным числом сообщений или одним файлом, если он очень длинный"""
+    parts = split_message(report)
+    if REPORT_DOCUMENT_AFTER and len(parts) > REPORT_DOCUMENT_AFTER:
+        title = f"Отчет об интервью, респондент №{respondent_id or 'Не указано'}"
+        content, extension = report_document(report, title, REPORT_DOCUMENT_FORMAT)
+        await context.bot.send_document(
+            update.effective_chat.id,
+            document=content,
+            filename=f"отчет_{respondent_id or 'интервью'}.{extension}",
+            caption=f"📊 {title}",
+            **bulk_send_args(context)
+        )
+        return
+
+    for part in parts:
+        await context.bot.send_message(update.effective_chat.id, part, **bulk_send_args(context))
+
 def generate_report(interview):
     """Генерация отчета"""
     try:
@@ -715,14 +1109,14 @@ def generate_report(interview):
         
         if interview.pain_analysis:
             for i, pain in enumerate(interview.pain_analysis, 1):
-                score = pain.get('score', 0)
+                score = pain.score
                 score_icon = "❗" if score >= 7 else "⚠️" if score >= 4 else "✓"
                 report_lines.extend([
-                    f"  Боль #{i}: {pain.get('name', 'Не указано')}",
+                    f"  Боль #{i}: {pain.name}",
                     f"    Оценка: {score}/10 {score_icon}",
-                    f"    Эмоция: {pain.get('emotion', 'Не указано')}",
-                    f"    Случай: {pain.get('last_case', 'Не указано')}",
-                    f"    Причина: {pain.get('reason', 'Не указано')}",
+                    f"    Эмоция: {pain.emotion}",
+                    f"    Случай: {pain.last_case}",
+                    f"    Причина: {pain.reason}",
                     ""
                 ])
         else:
@@ -734,10 +1128,10 @@ def generate_report(interview):
             f"  {interview.magic_wand or 'Не указано'}",
             "",
             "💡 Инсайты:",
-            f"  Удивило: {interview.insights.get('surprise', 'Не указано')}",
-            f"  Скрытые потребности: {interview.insights.get('hidden_needs', 'Не указано')}",
-            f"  Еда: {interview.insights.get('food_signals', 'Не указано')}",
-            f"  Готовность платить: {interview.insights.get('willingness_to_pay', 'Не указано')}"
+            f"  Удивило: {interview.insights.surprise}",
+            f"  Скрытые потребности: {interview.insights.hidden_needs}",
+            f"  Еда: {interview.insights.food_signals}",
+            f"  Готовность платить: {interview.insights.willingness_to_pay}"
         ])
         
         return "\n".join(report_lines)
@@ -747,52 +1141,91 @@ def generate_report(interview):
         return "Ошибка при генерации отчета"
 
 async def export_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Экспорт ВСЕХ данных в Excel"""
-    global all_interviews
-    
+    """Экспорт ВСЕХ данных (/export_all [xlsx|csv|jsonl|parquet] [wide] [gz])"""
     try:
-        if not all_interviews:
+        args = [arg.lower() for arg in (context.args or [])]
+        compress = any(arg in ('gz', 'gzip') for arg in args)
+        wide = 'wide' in args
+        formats = [arg for arg in args if arg not in ('gz', 'gzip', 'wide')]
+        fmt = formats[0] if formats else 'xlsx'
+        
+        if fmt not in EXPORT_FORMATS or len(formats) > 1:
             await update.message.reply_text(
-                "❌ Нет данных для экспорта.\n"
-                "Сначала проведи несколько интервью через /start"
+                "Использование: /export_all [формат] [wide] [gz]\n\n"
+                "Форматы: xlsx (по умолчанию), csv, jsonl, parquet\n"
+                "wide - одна широкая таблица с колонками Боль_1_..., Боль_2_...\n"
+                "gz - сжать файл, например: /export_all csv gz"
             )
             return
         
-        filename = save_all_to_excel()
+        # Какие таблицы отправлять: по умолчанию респонденты и боли отдельно
+        if wide:
+            tables = ['wide']
+        elif fmt in ('xlsx', 'jsonl'):
+            tables = ['all']  # Листы в одном xlsx / вложенный список болей в jsonl
+        else:
+            tables = ['respondents', 'pains']
         
-        if not filename or not os.path.exists(filename):
+        if get_store().count() == 0:
             await update.message.reply_text(
-                "❌ Ошибка при создании файла Excel.\n"
-                "Проверьте логи для подробностей."
+                "❌ Нет данных для экспорта.\n"
+                "Сначала проведи несколько интервью через /start"
             )
             return
         
-        total = len(all_interviews)
+        total = get_store().count()
         
-        # Отправляем файл
-        try:
-            with open(filename, 'rb') as file:
-                await update.message.reply_document(
-                    document=file,
-                    filename=f"все_интервью_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+        for table in tables:
+            try:
+                # При неизменных данных файл отдается из кэша без повторной сборки
+                data = await get_export_file(fmt, table, compress)
+            except ExportQueueFull:
+                await update.message.reply_text(
+                    "⏳ Сейчас уже готовится несколько файлов.\n"
+                    "Попробуйте повторить /export_all через минуту."
+                )
+                return
+            except ExportFormatUnavailable as e:
+                await update.message.reply_text(
+                    f"❌ Для формата {fmt} не установлена библиотека {e}.\n"
+                    f"Установите ее: pip install {e}"
+                )
+                return
+            
+            if not data:
+                await update.message.reply_text(
+                    "❌ Ошибка при создании файла.\n"
+                    "Проверьте логи для подробностей."
+                )
+                return
+            
+            # Отправляем файл
+            try:
+                await context.bot.send_document(
+                    update.effective_chat.id,
+                    document=data,
+                    filename=build_export_filename(fmt, table, compress),
                     caption=(
-                        f"📊 ОБЩАЯ ТАБЛИЦА\n\n"
+                        f"{EXPORT_CAPTIONS[table]}\n\n"
                         f"Всего респондентов: {total}\n"
                         f"Файл обновляется автоматически"
-                    )
+                    ),
+                    **bulk_send_args(context)
                 )
-        except BadRequest as e:
-            logger.error(f"Ошибка Telegram API при отправке файла: {e}")
-            await update.message.reply_text(
-                f"❌ Ошибка при отправке файла.\n"
-                f"Проверьте, что файл не слишком большой.\n"
-                f"Всего записей: {total}"
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при отправке файла: {e}", exc_info=True)
-            await update.message.reply_text(
-                f"❌ Ошибка при отправке файла: {str(e)}"
-            )
+            except BadRequest as e:
+                logger.error(f"Ошибка Telegram API при отправке файла: {e}")
+                await update.message.reply_text(
+                    f"❌ Ошибка при отправке файла.\n"
+                    f"Проверьте, что файл не слишком большой.\n"
+                    f"Всего записей: {total}"
+                )
+                return
+            except Exception as e:
+                logger.error(f"Ошибка при отправке файла: {e}", exc_info=True)
+                await update.message.reply_text(
+                    f"❌ Ошибка при отправке файла: {str(e)}"
+                )
+                return
             
     except Exception as e:
         logger.error(f"Ошибка в export_all: {e}", exc_info=True)
@@ -801,43 +1234,50 @@ async def export_all(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Проверьте логи для подробностей."
         )
 
+EXPORT_FILENAMES = {
+    'all': "все_интервью",
+    'respondents': "респонденты",
+    'pains': "боли",
+    'wide': "все_интервью_широкая",
+}
+
+EXPORT_CAPTIONS = {
+    'all': "📊 ОБЩАЯ ТАБЛИЦА (листы: респонденты и боли)",
+    'respondents': "📊 РЕСПОНДЕНТЫ",
+    'pains': "📊 БОЛИ (одна строка на боль)",
+    'wide': "📊 ОБЩАЯ ТАБЛИЦА (широкий формат)",
+}
+
+def build_export_filename(fmt, table='all', compress=False):
+    """Имя файла выгрузки с датой и временем"""
+    filename = f"{EXPORT_FILENAMES[table]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt]}"
+    # xlsx и parquet сжимаются внутри файла
+    if compress and fmt in ('csv', 'jsonl'):
+        filename += ".gz"
+    return filename
+
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать статистику"""
-    global all_interviews
-    
     try:
-        if not all_interviews:
+        # Агрегаты поддерживаются при сохранении, поэтому ответ не зависит от объема данных
+        summary = await get_running_stats()
+        total = summary.total
+        
+        if not total:
             await update.message.reply_text("📊 Пока нет данных для статистики")
             return
         
-        total = len(all_interviews)
-        
-        # Безопасно получаем даты
-        first_date = "Не указано"
-        last_date = "Не указано"
+        first_date = summary.first_date or "Не указано"
+        last_date = summary.last_date or "Не указано"
+        total_pains = summary.total_pains
+        high_pain_count = summary.high_pain_count  # Боли с оценкой >= 7
         
-        try:
-            if all_interviews:
-                first_interview = all_interviews[0]
-                last_interview = all_interviews[-1]
-                first_date = first_interview.get('Дата', 'Не указано')
-                last_date = last_interview.get('Дата', 'Не указано')
-        except Exception as e:
-            logger.warning(f"Ошибка при получении дат: {e}")
-        
-        # Подсчитываем статистику по болям
-        total_pains = 0
-        high_pain_count = 0  # Боли с оценкой >= 7
-        
-        for interview in all_interviews:
-            for i in range(1, 11):  # Проверяем до 10 болей
-                pain_score_key = f'Боль_{i}_Оценка'
-                if pain_score_key in interview:
-                    score = interview[pain_score_key]
-                    if isinstance(score, (int, float)) and score > 0:
-                        total_pains += 1
-                        if score >= 7:
-                            high_pain_count += 1
+        if summary.emotions:
+            emotions_text = "\n".join(
+                f"  • {emotion}: {count}" for emotion, count in summary.emotions.most_common()
+            )
+        else:
+            emotions_text = "  • Нет данных"
         
         stats_text = (
             f"📈 СТАТИСТИКА ПО ВСЕМ ИНТЕРВЬЮ\n\n"
@@ -846,9 +1286,16 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Последнее интервью: {last_date}\n"
             f"Всего проанализировано болей: {total_pains}\n"
             f"Высокая интенсивность (≥7): {high_pain_count}\n\n"
+            f"Эмоции:\n{emotions_text}\n\n"
+            f"Идут сейчас: {session_manager.live(context.application)}, "
+            f"закрыто по неактивности: {session_manager.evicted}\n\n"
             f"Команды:\n"
             f"/export_all - скачать общую таблицу Excel\n"
             f"/stats - показать эту статистику\n"
+            f"/analytics - аналитика по болям и оценкам\n"
+            f"/search - поиск по ответам респондентов\n"
+            f"/pains - частые боли и кто их называл\n"
+            f"/import - загрузить интервью из файла xlsx/csv\n"
             f"/clear_data - очистить все данные (осторожно!)\n"
             f"/start - начать новое интервью"
         )
@@ -862,13 +1309,323 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Проверьте логи для подробностей."
         )
 
+def build_analytics_text():
+    """Считает аналитику по болям и оформляет ее в текст ответа"""
+    store = get_store()
+    if store.count() == 0:
+        return None
+    
+    categories = [option for row in PAIN_POINT_OPTIONS for option in row if option != "Пропустить"]
+    result = compute_analytics(store, categories)
+    
+    if result['top_pains']:
+        top_text = "\n".join(f"  {i}. {name}: {count}" for i, (name, count) in enumerate(result['top_pains'], 1))
+    else:
+        top_text = "  • Нет данных"
+    
+    total_emotions = sum(count for _, count in result['emotions'])
+    if total_emotions:
+        emotions_text = "\n".join(
+            f"  • {emotion}: {count} ({count / total_emotions:.0%})" for emotion, count in result['emotions']
+        )
+    else:
+        emotions_text = "  • Нет данных"
+    
+    histogram = result['histogram']
+    if result['scored']:
+        peak = max(histogram)
+        histogram_text = "\n".join(
+            f"  {score:>2} | {'█' * round(count / peak * 15)} {count}"
+            for score, count in enumerate(histogram, 1)
+        )
+        histogram_text += f"\n  Средняя: {result['mean_score']:.1f}, медиана: {result['median_score']:.1f}"
+    else:
+        histogram_text = "  • Нет оценок"
+    
+    if result['by_category']:
+        category_text = "\n".join(
+            f"  • {category}: средняя {mean:.1f}, медиана {median:.1f} (болей: {count})"
+            for category, mean, median, count in result['by_category']
+        )
+    else:
+        category_text = "  • Нет данных"
+    
+    return (
+        f"🔬 АНАЛИТИКА ПО БОЛЯМ\n\n"
+        f"Респондентов: {result['respondents']}, болей: {result['pains']}, с оценкой: {result['scored']}\n\n"
+        f"Частые боли:\n{top_text}\n\n"
+        f"Эмоции:\n{emotions_text}\n\n"
+        f"Оценки:\n{histogram_text}\n\n"
+        f"Оценки по точкам напряжения:\n{category_text}"
+    )
+
+def format_metrics_summary():
+    """Краткая сводка метрик для команды /metrics"""
+    gauges = metrics.gauge_values()
+    errors = {dict(labels)['handler']: counter.value for labels, counter in metrics.families(HANDLER_ERRORS).items()}
+    
+    handler_lines = []
+    for labels, histogram in sorted(metrics.families(HANDLER_DURATION).items(), key=lambda item: -item[1].count):
+        name = dict(labels)['handler']
+        handler_lines.append(
+            f"  • {name}: {histogram.count}, {histogram.sum / histogram.count * 1000:.1f} мс, "
+            f"p95 ≤ {histogram.quantile(0.95) * 1000:g} мс, ошибок {errors.get(name, 0)}"
+        )
+    
+    sizes = metrics.families('bot_export_size_bytes')
+    export_lines = []
+    for labels, histogram in metrics.families('bot_export_duration_seconds').items():
+        label = dict(labels)
+        size = sizes.get(labels)
+        average_size = size.sum / size.count / 1024 if size and size.count else 0
+        export_lines.append(
+            f"  • {label['format']}/{label['table']}: {histogram.count}, "
+            f"{histogram.sum / histogram.count:.2f} с, {average_size:.0f} КБ"
+        )
+    
+    handlers_text = "\n".join(handler_lines) or "  • Нет данных"
+    exports_text = "\n".join(export_lines) or "  • Нет данных"
+    
+    return (
+        f"📟 МЕТРИКИ\n\n"
+        f"Идут интервью: {gauges.get('bot_active_sessions', '—')}, "
+        f"закрыто по неактивности: {gauges.get('bot_sessions_evicted', '—')}\n"
+        f"Сохранено интервью: {gauges.get('bot_stored_interviews', '—')}\n\n"
+        f"Обработчики (вызовов, среднее, p95, ошибок):\n"
+        f"{handlers_text}\n\n"
+        f"Выгрузки (штук, среднее время, средний размер):\n"
+        f"{exports_text}"
+    )
+
+async def show_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать метрики бота (/metrics raw - полный текст в формате Prometheus)"""
+    try:
+        if ADMIN_IDS and update.effective_user.id not in ADMIN_IDS:
+            await update.message.reply_text("⛔ Команда доступна только администраторам.")
+            return
+        
+        if context.args and context.args[0].lower() == 'raw':
+            await update.message.reply_document(
+                document=metrics.render().encode('utf-8'),
+                filename=f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            )
+            return
+        
+        await update.message.reply_text(format_metrics_summary())
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_metrics: {e}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при получении метрик.\n"
+            "Проверьте логи для подробностей."
+        )
+
+async def analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать аналитику по болям"""
+    try:
+        # Результат кэшируется по версии данных: повторный запрос без новых интервью бесплатный
+        version = get_store().version()
+        text = analytics_cache.get(version, 'text')
+        if text is None:
+            text = await run_in_export_pool(build_analytics_text)
+            if text:
+                analytics_cache.put(version, 'text', text)
+        else:
+            logger.info(f"Analytics served from cache (version {version})")
+        
+        if not text:
+            await update.message.reply_text("📊 Пока нет данных для аналитики")
+            return
+        
+        await update.message.reply_text(text)
+        
+    except ExportQueueFull:
+        await update.message.reply_text("⏳ Сейчас уже готовится несколько файлов.\n"
+            "Попробуйте повторить /analytics через минуту.")
+    except Exception as e:
+        logger.error(f"Ошибка в analytics: {e}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при расчете аналитики.\n"
+            "Проверьте логи для подробностей."
+        )
+
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Поиск по свободным ответам (/search слова)"""
+    try:
+        query = ' '.join(context.args or [])
+        query_terms = set(terms(query))
+        if not query_terms:
+            await update.message.reply_text(
+                "Использование: /search слова\n\n"
+                "Ищет по описаниям дня, болям и инсайтам всех интервью, "
+                "например: /search очередь столовая"
+            )
+            return
+        
+        started = time.perf_counter()
+        index = await get_search_index()
+        found, hits = index.search(query, limit=SEARCH_RESULTS)
+        if not hits:
+            await update.message.reply_text(f"🔍 По запросу «{query}» ничего не найдено")
+            return
+        
+        # Чтение записей с диска идет в потоке, как построение индекса
+        records = await asyncio.get_running_loop().run_in_executor(
+            None, get_store().get_records, [interview_id for interview_id, _, _ in hits]
+        )
+        lines = []
+        for number, (interview_id, respondent, _) in enumerate(hits, 1):
+            record = records.get(interview_id)
+            fragment = snippet(record, query_terms) if record else None
+            lines.append(f"{number}. Респондент №{respondent or '—'} (ID {interview_id})")
+            if fragment:
+                lines.append(f"   {fragment[0]}: {fragment[1]}")
+        elapsed = (time.perf_counter() - started) * 1000
+        
+        await update.message.reply_text(
+            f"🔍 «{query}»: найдено интервью: {found}, показаны первые {len(hits)} ({elapsed:.0f} мс)\n\n"
+            + "\n".join(lines)
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в search: {e}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при поиске.\n"
+            "Проверьте логи для подробностей."
+        )
+
+async def pains(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Частые боли (/pains) или респонденты, назвавшие боль (/pains название)"""
+    try:
+        index = await get_pain_index()
+        query = ' '.join(context.args or [])
+        
+        if not query:
+            top = index.top(PAINS_TOP)
+            if not top:
+                await update.message.reply_text("📊 Пока нет данных о болях")
+                return
+            lines = "\n".join(
+                f"{number}. {label} - респондентов: {interviews}, упоминаний: {mentions}"
+                for number, (_, label, interviews, mentions) in enumerate(top, 1)
+            )
+            await update.message.reply_text(
+                f"🔥 ЧАСТЫЕ БОЛИ\n\n{lines}\n\n"
+                f"Написания одной боли объединены (регистр, окончания, синонимы).\n"
+                f"Кто называл боль: /pains название, например /pains очереди"
+            )
+            return
+        
+        matched, interviews = index.respondents(query)
+        if not interviews:
+            await update.message.reply_text(f"🔍 Боль «{query}» никто не называл")
+            return
+        
+        shown = interviews[:PAINS_RESPONDENTS]
+        respondents = ", ".join(f"№{respondent or '—'} (ID {interview_id})" for interview_id, respondent in shown)
+        more = f" и еще {len(interviews) - len(shown)}" if len(interviews) > len(shown) else ""
+        variants = "\n".join(
+            f"  • {index.label(canonical)}: {len(index.interviews[canonical])}" for canonical in matched[:PAINS_TOP]
+        )
+        await update.message.reply_text(
+            f"🔍 Боль «{query}»: респондентов {len(interviews)}\n\n"
+            f"Варианты:\n{variants}\n\n"
+            f"Респонденты: {respondents}{more}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в pains: {e}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при подсчете болей.\n"
+            "Проверьте логи для подробностей."
+        )
+
+def format_import_result(result):
+    """Текст ответа на /import"""
+    lines = [
+        f"📥 ИМПОРТ {os.path.basename(result.filename)}\n",
+        f"Строк в файле: {result.rows}",
+        f"Загружено интервью: {result.imported}",
+        f"Пропущено (респондент уже есть в базе или выше в файле): {result.duplicates}",
+        f"Пропущено с ошибками: {result.invalid}",
+    ]
+    if result.errors:
+        lines.append("\nОшибки:")
+        lines += [f"  • строка {row_no}: {error}" for row_no, error in result.errors]
+        if result.invalid > len(result.errors):
+            lines.append(f"  • и еще {result.invalid - len(result.errors)}")
+    lines.append(f"\nВсего в базе: {get_store().count()}, время: {result.seconds:.1f} с")
+    return "\n".join(lines)
+
+async def import_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Загрузка интервью прошлых волн: файл с подписью /import или /import в ответ на файл"""
+    try:
+        message = update.message
+        document = message.document or (message.reply_to_message and message.reply_to_message.document)
+        if not document:
+            await message.reply_text(
+                "Использование: отправьте файл xlsx, csv или jsonl с подписью /import "
+                "(или ответьте /import на сообщение с файлом).\n\n"
+                "Подходят таблицы в колонках выгрузки /export_all: широкая таблица с колонками "
+                "Боль_1_..., xlsx с листами «Респонденты» и «Боли», jsonl.\n"
+                "Респонденты, которые уже есть в базе, пропускаются."
+            )
+            return
+
+        filename = document.file_name or "import"
+        try:
+            import_format(filename)
+        except ImportFormatError as e:
+            await message.reply_text(f"❌ Не удалось загрузить файл: {e}")
+            return
+
+        await message.reply_text(f"⏳ Загружаю {filename}...")
+        loop = asyncio.get_running_loop()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, os.path.basename(filename))
+            try:
+                telegram_file = await document.get_file()
+            except BadRequest as e:
+                logger.error(f"Ошибка Telegram API при получении файла: {e}")
+                await message.reply_text(
+                    "❌ Telegram не отдает этот файл (ботам доступны файлы до 20 МБ).\n"
+                    "Большие файлы загрузите на сервере: python bot.py import файл"
+                )
+                return
+            await telegram_file.download_to_drive(path)
+            # Файл читается и пишется в хранилище в пуле, пачки попадают в индексы в event loop
+            result = await run_in_export_pool(
+                import_file, get_store(), path, filename, IMPORT_CHUNK,
+                lambda saved: loop.call_soon_threadsafe(index_imported, saved),
+            )
+
+        metrics.counter('bot_imported_interviews_total', "Интервью, загруженные через /import").inc(result.imported)
+        if result.imported:
+            # Таблица Excel (EXCEL_AUTOSAVE) перезапишется вместе с остальными изменениями
+            write_behind.mark_dirty()
+        await message.reply_text(format_import_result(result))
+
+    except ExportQueueFull:
+        await update.message.reply_text("⏳ Сейчас уже готовится несколько файлов.\n"
+            "Попробуйте повторить /import через минуту.")
+    except ImportFormatError as e:
+        result = getattr(e, 'result', None)
+        partial = ""
+        if result is not None and result.imported:
+            partial = f"\nЗагружено до ошибки: {result.imported} (при повторной загрузке они пропустятся)"
+        await update.message.reply_text(f"❌ Не удалось загрузить файл: {e}{partial}")
+    except Exception as e:
+        logger.error(f"Ошибка в import_data: {e}", exc_info=True)
+        await update.message.reply_text(
+            "❌ Произошла ошибка при загрузке файла.\n"
+            "Проверьте логи для подробностей."
+        )
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена интервью"""
-    user_id = update.message.from_user.id
-    
     try:
-        if user_id in interviews:
-            del interviews[user_id]
+        if 'interview' in context.user_data:
+            del context.user_data['interview']
         if 'current_pain' in context.user_data:
             del context.user_data['current_pain']
         
@@ -885,9 +1642,7 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для очистки всех данных"""
     try:
-        global all_interviews
-        
-        total = len(all_interviews)
+        total = get_store().count()
         
         if total == 0:
             await update.message.reply_text(
@@ -916,25 +1671,22 @@ async def clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def confirm_clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Подтверждение очистки данных"""
     try:
-        global all_interviews
-        
         choice = update.message.text.strip()
         
         if "Да" in choice or "удалить" in choice.lower():
-            # Сохраняем количество для отчета
-            total_deleted = len(all_interviews)
-            
-            # Очищаем данные в памяти
-            all_interviews.clear()
+            # Очищаем хранилище (возвращает количество для отчета)
+            total_deleted = get_store().clear()
+            if running_stats is not None:
+                running_stats.reset()
+            if search_index is not None:
+                search_index.reset()
+            if pain_index is not None:
+                pain_index.reset()
             
             # Очищаем файл Excel (перезаписываем пустым DataFrame)
             try:
-                filename = "все_интервью.xlsx"
-                filepath = os.path.join(os.getcwd(), filename)
-                
-                # Создаем пустой DataFrame и сохраняем
-                df = pd.DataFrame()
-                df.to_excel(filepath, index=False, engine='openpyxl')
+                # Оставляем только заголовки (в пуле, чтобы не блокировать других)
+                await run_in_export_pool(clear_excel_file)
                 
                 logger.info(f"Data cleared. Deleted {total_deleted} records. File cleared.")
             except Exception as e:
@@ -966,6 +1718,72 @@ async def confirm_clear_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ConversationHandler.END
 
+def prewarm_imports():
+    """Импортирует тяжелые библиотеки заранее, чтобы первая выгрузка их не ждала"""
+    for name in HEAVY_MODULES:
+        try:
+            started = time.perf_counter()
+            importlib.import_module(name)
+            logger.info(f"Prewarmed {name} in {time.perf_counter() - started:.2f}s")
+        except ImportError as e:
+            logger.warning(f"Could not prewarm {name}: {e}")
+
+async def prewarm(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновый импорт тяжелых библиотек после запуска бота"""
+    # Импорт идет в отдельном потоке, event loop продолжает обрабатывать обновления
+    await asyncio.get_running_loop().run_in_executor(None, prewarm_imports)
+
+async def warm_indexes(context: ContextTypes.DEFAULT_TYPE):
+    """Строит индексы при запуске, чтобы первые /stats, /pains и /search их не ждали"""
+    await get_running_stats()
+    await get_pain_index()
+    await get_search_index()
+
+async def post_shutdown(application: Application):
+    """Финальный сброс отложенных изменений при остановке бота"""
+    await write_behind.flush()
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмечает активность пользователя перед обработкой любого обновления"""
+    if context.user_data is None:
+        return
+    session_manager.touch(context.user_data)
+    
+    if not context.user_data.get(EXPIRED_KEY) or not update.message:
+        return
+    
+    # Интервью закрыто сборщиком, но диалог мог остаться на старом шаге (например, после перезапуска):
+    # пропускаем только команды, а /start и /cancel снимают отметку
+    text = update.message.text or ""
+    if text.startswith('/start') or text.startswith('/cancel'):
+        del context.user_data[EXPIRED_KEY]
+    elif not text.startswith('/'):
+        await update.message.reply_text(SESSION_EXPIRED_TEXT, reply_markup=ReplyKeyboardRemove())
+        raise ApplicationHandlerStop
+
+async def session_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Интервью закрыто по conversation_timeout"""
+    try:
+        # Диалог уже завершен PTB, отметка сборщика больше не нужна
+        context.user_data.pop(EXPIRED_KEY, None)
+        if session_manager.evict(context.user_data) and SESSION_NOTIFY and update.effective_chat:
+            await context.bot.send_message(
+                update.effective_chat.id, SESSION_EXPIRED_TEXT, reply_markup=ReplyKeyboardRemove()
+            )
+    except Exception as e:
+        logger.error(f"Ошибка в session_timeout: {e}", exc_info=True)
+
+async def sweep_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """Закрывает брошенные интервью, которые не закрылись по таймауту (например, после перезапуска)"""
+    evicted = session_manager.sweep(context.application)
+    if not SESSION_NOTIFY:
+        return
+    for user_id in evicted:
+        try:
+            await context.bot.send_message(user_id, SESSION_EXPIRED_TEXT, reply_markup=ReplyKeyboardRemove())
+        except Exception as e:
+            logger.warning(f"Could not notify user {user_id} about expired session: {e}")
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ошибок"""
     try:
@@ -983,8 +1801,236 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Error sending error message: {e}")
 
+def application_builder(token):
+    """Application.builder() с токеном и адресом сервера Bot API"""
+    return Application.builder().token(token).base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+
+def build_application(builder, shard=None):
+    """Собирает приложение со всеми обработчиками
+    
+    builder - Application.builder() с уже заданным токеном; тестовые стенды
+    передают сюда свой слой запросов (request / get_updates_request).
+    shard=(номер, всего) - процесс-обработчик в режиме WORKERS > 1.
+    """
+    if RATE_LIMIT:
+        # Лимит Telegram общий на бота: процессы-обработчики делят его (и пачку) поровну
+        workers = shard[1] if shard else 1
+        # Подсказки интервью отправляются раньше отчетов и файлов, RetryAfter обрабатывается внутри
+        builder = builder.rate_limiter(PriorityRateLimiter(
+            overall_rate=RATE_LIMIT_GLOBAL / workers,
+            overall_burst=max(1, OVERALL_BURST // workers),
+            chat_rate=RATE_LIMIT_CHAT,
+            chat_burst=RATE_LIMIT_BURST,
+            max_retries=RATE_LIMIT_RETRIES,
+        ))
+    if CONCURRENT_UPDATES > 1:
+        # Медленный обработчик одного интервьюера не задерживает остальных
+        builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(CONCURRENT_UPDATES))
+    persistence = SQLiteSessionPersistence(
+        os.path.join(DATA_DIR, SESSIONS_FILENAME), update_interval=SESSIONS_INTERVAL, shard=shard
+    )
+    application = builder.persistence(persistence).post_shutdown(post_shutdown).build()
+    
+    # Отложенная запись на JobQueue
+    write_behind.start(application.job_queue)
+    
+    # Фоновая подгрузка pandas/openpyxl, когда бот уже принимает обновления
+    if PREWARM_IMPORTS and application.job_queue:
+        application.job_queue.run_once(prewarm, PREWARM_DELAY, name='prewarm')
+    
+    # Агрегаты /stats, частоты болей и поисковый индекс строятся в фоне сразу после запуска
+    if application.job_queue:
+        application.job_queue.run_once(warm_indexes, 0, name='indexes')
+    
+    # Обработчик ошибок
+    application.add_error_handler(error_handler)
+    
+    # Время последней активности (группа -1 выполняется раньше диалогов)
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
+    
+    # Брошенные интервью: таймаут диалога плюс периодический сборщик для сессий,
+    # восстановленных после перезапуска (таймеры PTB не сохраняются)
+    if SESSION_TTL > 0 and application.job_queue:
+        application.job_queue.run_repeating(
+            sweep_sessions, interval=SESSION_SWEEP_INTERVAL, first=SESSION_SWEEP_INTERVAL, name='session_sweep'
+        )
+    
+    # ConversationHandler для интервью
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={
+            RESPONDENT_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, respondent_info)],
+            DAY_MAP: [MessageHandler(filters.TEXT & ~filters.COMMAND, day_map)],
+            PAIN_POINTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_points)],
+            PAIN_POINTS_OTHER: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_points_other)],
+            REGULAR_PROBLEMS: [MessageHandler(filters.TEXT & ~filters.COMMAND, regular_problems)],
+            PAIN_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_name)],
+            PAIN_CASE: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_case)],
+            PAIN_REASON: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_reason)],
+            PAIN_EMOTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_emotion)],
+            PAIN_SCORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_score)],
+            MAGIC_WAND: [MessageHandler(filters.TEXT & ~filters.COMMAND, magic_wand)],
+            INSIGHTS_SURPRISE: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_surprise)],
+            INSIGHTS_NEEDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_needs)],
+            INSIGHTS_FOOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_food)],
+            INSIGHTS_PAY: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_complete)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, session_timeout)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        # /start во время интервью начинает новое (см. предупреждение в start)
+        allow_reentry=True,
+        conversation_timeout=SESSION_TTL or None,
+        name='interview',
+        persistent=True
+    )
+    
+    application.add_handler(conv_handler)
+    application.add_handler(CommandHandler("export_all", export_all))
+    application.add_handler(CommandHandler("stats", stats))
+    application.add_handler(CommandHandler("analytics", analytics))
+    application.add_handler(CommandHandler("search", search))
+    application.add_handler(CommandHandler("pains", pains))
+    # Файл с подписью /import (CommandHandler подписи к документам не разбирает) или /import ответом на файл
+    application.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/import\b'), import_data))
+    application.add_handler(CommandHandler("import", import_data))
+    application.add_handler(CommandHandler("metrics", show_metrics))
+    
+    # Обработчик очистки данных (с подтверждением)
+    clear_data_handler = ConversationHandler(
+        entry_points=[CommandHandler('clear_data', clear_data)],
+        states={
+            CONFIRM_CLEAR_DATA: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_clear_data)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel)],
+        name='clear_data',
+        persistent=True
+    )
+    application.add_handler(clear_data_handler)
+    
+    # Время и ошибки каждого обработчика, состояние сессий и хранилища
+    instrument_application(application)
+    install_error_counter()
+    metrics.gauge('bot_active_sessions', "Незавершенные интервью", lambda: session_manager.live(application))
+    metrics.gauge('bot_sessions_evicted', "Интервью, закрытые по неактивности", lambda: session_manager.evicted)
+    metrics.gauge('bot_stored_interviews', "Сохраненные интервью", lambda: get_store().count())
+    
+    return application
+
+def webhook_settings():
+    """Параметры run_webhook из переменных окружения"""
+    base_url = WEBHOOK_URL
+    if not base_url and os.getenv('RAILWAY_PUBLIC_DOMAIN'):
+        # На Railway публичный домен сервиса известен из окружения
+        base_url = f"https://{os.getenv('RAILWAY_PUBLIC_DOMAIN')}"
+    if not base_url:
+        raise ValueError("WEBHOOK_URL is required when BOT_MODE=webhook")
+    
+    # Telegram принимает секрет из 1-256 символов A-Z, a-z, 0-9, _ и -.
+    # Без WEBHOOK_SECRET секрет генерируется заново при каждом запуске (set_webhook вызывается при старте)
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', secret):
+        raise ValueError("WEBHOOK_SECRET may contain only A-Z, a-z, 0-9, _ and - (1-256 chars)")
+    
+    return {
+        'listen': WEBHOOK_LISTEN,
+        'port': WEBHOOK_PORT,
+        'url_path': WEBHOOK_PATH,
+        'webhook_url': f"{base_url.rstrip('/')}/{WEBHOOK_PATH}",
+        'secret_token': secret,
+    }
+
+def run_bot(application):
+    """Запускает получение обновлений в режиме BOT_MODE (polling или webhook)"""
+    if BOT_MODE == 'webhook':
+        settings = webhook_settings()
+        logger.info(f"Starting webhook on {settings['listen']}:{settings['port']}/{settings['url_path']}")
+        print(f"Starting webhook on port {settings['port']}...")
+        # Встроенный сервер PTB отклоняет запросы без заголовка X-Telegram-Bot-Api-Secret-Token
+        application.run_webhook(
+            drop_pending_updates=True,
+            allowed_updates=Update.ALL_TYPES,
+            **settings
+        )
+    elif BOT_MODE == 'polling':
+        # Запускаем бота с улучшенной обработкой ошибок
+        application.run_polling(
+            drop_pending_updates=True,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE} (expected polling or webhook)")
+
+def worker_main(index, count, queue, lock):
+    """Процесс-обработчик в режиме WORKERS > 1: обрабатывает обновления своих чатов из queue"""
+    global export_lock, SQLITE_COMMIT_BATCH
+    ignore_stop_signals()
+    export_lock = lock
+    # Незафиксированная пачка держала бы блокировку записи базы, и остальные процессы ждали бы ее
+    SQLITE_COMMIT_BATCH = 1
+    
+    metrics_server = None
+    try:
+        get_store()
+        application = build_application(
+            application_builder(os.getenv('BOT_TOKEN')).updater(None), shard=(index, count)
+        )
+        if METRICS_PORT:
+            # У каждого процесса свои метрики и свой порт: METRICS_PORT + номер
+            metrics_server = start_http_server(METRICS_PORT + index, METRICS_HOST)
+        logger.info(f"Worker {index + 1}/{count} started")
+        asyncio.run(feed_updates(application, queue))
+    finally:
+        export_executor.shutdown(wait=True)
+        if store is not None:
+            store.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+def run_workers(token):
+    """Главный процесс в режиме WORKERS > 1: webhook и раздача обновлений обработчикам"""
+    if STORAGE_BACKEND != 'sqlite':
+        raise ValueError("WORKERS > 1 requires STORAGE_BACKEND=sqlite")
+    settings = webhook_settings()
+    bot = Bot(token, base_url=f"{BOT_API_URL}/bot", base_file_url=f"{BOT_API_URL}/file/bot")
+    
+    pool = WorkerPool(worker_main, WORKERS)
+    pool.start()
+    print(f"Starting webhook on port {settings['port']} with {WORKERS} workers...")
+    try:
+        asyncio.run(serve_ingress(bot, settings, pool))
+    finally:
+        pool.stop()
+
+def import_files(paths):
+    """python bot.py import файл [файл ...]: загрузка интервью в хранилище без запуска бота"""
+    if not paths:
+        print("Usage: python bot.py import FILE [FILE ...]")
+        return 1
+    
+    failed = False
+    try:
+        for path in paths:
+            try:
+                result = import_file(get_store(), path, chunk_size=IMPORT_CHUNK)
+            except (ImportFormatError, OSError) as e:
+                print(f"ERROR: {path}: {e}")
+                failed = True
+                continue
+            print(result.summary())
+            for row_no, error in result.errors:
+                print(f"  row {row_no}: {error}")
+        print(f"Interviews in storage: {get_store().count()}")
+    finally:
+        if store is not None:
+            store.close()
+    return 1 if failed else 0
+
 def main():
     """Запуск бота"""
+    if sys.argv[1:2] == ['import']:
+        # Загрузка файлов из командной строки; токен не нужен
+        sys.exit(import_files(sys.argv[2:]))
+    
     # Получаем токен из переменной окружения
     TOKEN = os.getenv('BOT_TOKEN')
     
@@ -996,62 +2042,32 @@ def main():
         print("Or set environment variable BOT_TOKEN")
         return
     
+    metrics_server = None
     try:
         logger.info("Starting bot initialization...")
         print("Starting bot initialization...")
         
+        # Открываем хранилище (данные читаются по запросу, в память не загружаются)
+        get_store()
+        
+        if WORKERS > 1:
+            if BOT_MODE == 'webhook':
+                # Миграции схемы уже выполнены при открытии хранилища, до запуска обработчиков
+                run_workers(TOKEN)
+                return
+            logger.warning("WORKERS > 1 requires BOT_MODE=webhook, running a single process")
+        
         # Создаем приложение
-        application = Application.builder().token(TOKEN).build()
-        
-        # Обработчик ошибок
-        application.add_error_handler(error_handler)
-        
-        # ConversationHandler для интервью
-        conv_handler = ConversationHandler(
-            entry_points=[CommandHandler('start', start)],
-            states={
-                RESPONDENT_INFO: [MessageHandler(filters.TEXT & ~filters.COMMAND, respondent_info)],
-                DAY_MAP: [MessageHandler(filters.TEXT & ~filters.COMMAND, day_map)],
-                PAIN_POINTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_points)],
-                PAIN_POINTS_OTHER: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_points_other)],
-                REGULAR_PROBLEMS: [MessageHandler(filters.TEXT & ~filters.COMMAND, regular_problems)],
-                PAIN_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_name)],
-                PAIN_CASE: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_case)],
-                PAIN_REASON: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_reason)],
-                PAIN_EMOTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_emotion)],
-                PAIN_SCORE: [MessageHandler(filters.TEXT & ~filters.COMMAND, pain_analysis_score)],
-                MAGIC_WAND: [MessageHandler(filters.TEXT & ~filters.COMMAND, magic_wand)],
-                INSIGHTS_SURPRISE: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_surprise)],
-                INSIGHTS_NEEDS: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_needs)],
-                INSIGHTS_FOOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_food)],
-                INSIGHTS_PAY: [MessageHandler(filters.TEXT & ~filters.COMMAND, insights_complete)],
-            },
-            fallbacks=[CommandHandler('cancel', cancel)]
-        )
+        application = build_application(application_builder(TOKEN))
         
-        application.add_handler(conv_handler)
-        application.add_handler(CommandHandler("export_all", export_all))
-        application.add_handler(CommandHandler("stats", stats))
-        
-        # Обработчик очистки данных (с подтверждением)
-        clear_data_handler = ConversationHandler(
-            entry_points=[CommandHandler('clear_data', clear_data)],
-            states={
-                CONFIRM_CLEAR_DATA: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_clear_data)],
-            },
-            fallbacks=[CommandHandler('cancel', cancel)]
-        )
-        application.add_handler(clear_data_handler)
+        logger.info(f"Bot initialized successfully. Starting {BOT_MODE}...")
+        print(f"Bot initialized successfully. Starting {BOT_MODE}...")
+        print("Bot commands: /start, /export_all, /stats, /analytics, /search, /pains, /import, /clear_data, /cancel")
         
-        logger.info("Bot initialized successfully. Starting polling...")
-        print("Bot initialized successfully. Starting polling...")
-        print("Bot commands: /start, /export_all, /stats, /clear_data, /cancel")
+        if METRICS_PORT:
+            metrics_server = start_http_server(METRICS_PORT, METRICS_HOST)
         
-        # Запускаем бота с улучшенной обработкой ошибок
-        application.run_polling(
-            drop_pending_updates=True,
-            allowed_updates=Update.ALL_TYPES
-        )
+        run_bot(application)
         
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
@@ -1061,6 +2077,13 @@ def main():
         logger.error(error_msg, exc_info=True)
         print(f"CRITICAL ERROR: {error_msg}")
         raise
+    finally:
+        # Дожидаемся файлов, которые еще строятся в пуле
+        export_executor.shutdown(wait=True)
+        if store is not None:
+            store.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
 
 if __name__ == '__main__':
     main()
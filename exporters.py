@@ -0,0 +1,198 @@
+"""Выгрузка интервью в файлы"""
+import csv
+import gzip
+import io
+import logging
+from datetime import datetime
+
+from storage import (
+    ID_COLUMN, PAIN_TABLE_COLUMNS, RESPONDENT_COLUMNS, record_to_json, to_wide, wide_columns,
+)
+
+logger = logging.getLogger(__name__)
+
+# Форматы выгрузки: название -> расширение файла
+EXPORT_FORMATS = {
+    'xlsx': 'xlsx',
+    'csv': 'csv',
+    'jsonl': 'jsonl',
+    'parquet': 'parquet',
+}
+
+# Таблицы выгрузки:
+#   all         - все данные: в xlsx листы "Респонденты" и "Боли", в jsonl записи со списком болей
+#   respondents - данные респондентов, одна строка на интервью
+#   pains       - таблица болей, одна строка на боль
+#   wide        - широкая таблица с колонками Боль_{i}_*
+EXPORT_TABLES = ('all', 'respondents', 'pains', 'wide')
+
+SHEET_TITLES = {
+    'respondents': 'Респонденты',
+    'pains': 'Боли',
+    'wide': 'Интервью',
+}
+
+PARQUET_BATCH_SIZE = 5000
+GZIP_LEVEL = 6  # Уровень 9 заметно медленнее при почти том же размере
+
+
+class ExportFormatUnavailable(Exception):
+    """Для формата не установлена нужная библиотека"""
+
+
+def table_rows(store, table):
+    """Колонки и поток строк таблицы (respondents, pains или wide)"""
+    if table == 'respondents':
+        return RESPONDENT_COLUMNS, store.iter_records()
+    if table == 'pains':
+        return PAIN_TABLE_COLUMNS, store.iter_pains()
+    if table == 'wide':
+        return wide_columns(store.max_pain_count()), (to_wide(record) for record in store.iter_records())
+    raise ValueError(f"Unknown export table: {table}")
+
+
+def write_xlsx_sheets(sheets, fileobj):
+    """Потоково пишет листы (название, колонки, строки) в xlsx
+
+    Используется write-only режим openpyxl: строки по одной уходят во временный
+    файл, поэтому память не зависит от количества респондентов.
+    Возвращает количество строк на первом листе.
+    """
+    # openpyxl импортируется при первой выгрузке, чтобы не замедлять запуск бота
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    wb = Workbook(write_only=True)
+    counts = []
+
+    for title, columns, rows in sheets:
+        ws = wb.create_sheet(title)
+
+        header = []
+        for column in columns:
+            cell = WriteOnlyCell(ws, value=column)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        ws.append(header)
+
+        count = 0
+        for row in rows:
+            ws.append([row.get(column) for column in columns])
+            count += 1
+        counts.append(count)
+
+    wb.save(fileobj)
+    return counts[0] if counts else 0
+
+
+def write_xlsx(records, columns, fileobj, sheet_title='Интервью'):
+    """Потоково пишет записи на один лист xlsx, возвращает количество строк"""
+    return write_xlsx_sheets([(sheet_title, columns, records)], fileobj)
+
+
+def write_csv(records, columns, fileobj):
+    """Потоково пишет записи в CSV (UTF-8 с BOM, чтобы Excel понял кириллицу)"""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    writer = csv.writer(text)
+    writer.writerow(columns)
+
+    count = 0
+    for record in records:
+        writer.writerow(['' if record.get(column) is None else record.get(column) for column in columns])
+        count += 1
+
+    # detach, чтобы закрытие обертки не закрыло исходный файл
+    text.flush()
+    text.detach()
+    return count
+
+
+def write_jsonl(records, fileobj, columns=None):
+    """Потоково пишет записи в JSONL, одна строка на запись
+
+    Без columns запись пишется целиком (вместе со списком болей).
+    """
+    count = 0
+    for record in records:
+        if columns is not None:
+            record = {column: record.get(column) for column in columns}
+        fileobj.write(record_to_json(record).encode('utf-8'))
+        fileobj.write(b"\n")
+        count += 1
+    return count
+
+
+def write_parquet(records, columns, fileobj, compression='snappy'):
+    """Пишет записи в Parquet пачками по PARQUET_BATCH_SIZE строк"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportFormatUnavailable("pyarrow")
+
+    # Схема задается заранее, чтобы все пачки имели одинаковые типы
+    fields = []
+    for column in columns:
+        if column == 'Время_записи':
+            fields.append(pa.field(column, pa.timestamp('us')))
+        elif column in (ID_COLUMN, 'Номер_боли', 'Оценка') or column.endswith('_Оценка'):
+            fields.append(pa.field(column, pa.int64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    schema = pa.schema(fields)
+
+    def to_batch(rows):
+        data = {column: [row.get(column) for row in rows] for column in columns}
+        return pa.RecordBatch.from_pydict(data, schema=schema)
+
+    count = 0
+    with pq.ParquetWriter(fileobj, schema, compression=compression) as writer:
+        rows = []
+        for record in records:
+            # Время, которое не удалось разобрать при чтении, в колонку timestamp не попадет
+            if 'Время_записи' in columns and not isinstance(record.get('Время_записи'), datetime):
+                record['Время_записи'] = None
+            rows.append(record)
+            if len(rows) >= PARQUET_BATCH_SIZE:
+                writer.write_batch(to_batch(rows))
+                count += len(rows)
+                rows = []
+        if rows:
+            writer.write_batch(to_batch(rows))
+            count += len(rows)
+    return count
+
+
+def write_export(fmt, table, store, fileobj, compress=False):
+    """Пишет таблицу из хранилища в файл указанного формата, возвращает количество строк
+
+    compress - сжать gzip (для parquet вместо этого используется
+    встроенное сжатие gzip внутри файла).
+    """
+    if fmt == 'xlsx':
+        # xlsx уже является zip-архивом, дополнительное сжатие не нужно
+        tables = ('respondents', 'pains') if table == 'all' else (table,)
+        sheets = [(SHEET_TITLES[name], *table_rows(store, name)) for name in tables]
+        return write_xlsx_sheets(sheets, fileobj)
+
+    if table == 'all':
+        if fmt != 'jsonl':
+            raise ValueError(f"Format {fmt} needs a single table")
+        columns, rows = None, store.iter_records()
+    else:
+        columns, rows = table_rows(store, table)
+
+    if fmt == 'parquet':
+        return write_parquet(rows, columns, fileobj, compression='gzip' if compress else 'snappy')
+
+    target = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_LEVEL) if compress else fileobj
+    try:
+        if fmt == 'csv':
+            return write_csv(rows, columns, target)
+        if fmt == 'jsonl':
+            return write_jsonl(rows, target, columns)
+        raise ValueError(f"Unknown export format: {fmt}")
+    finally:
+        if compress:
+            target.close()
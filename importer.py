@@ -0,0 +1,324 @@
+"""Загрузка интервью прошлых волн из файлов (xlsx, csv, jsonl)
+
+Понимаются файлы в тех же колонках, что пишет выгрузка (см. exporters):
+широкая таблица с колонками Боль_{i}_* (как в старой таблице
+все_интервью.xlsx), таблица респондентов без болей, xlsx с листами
+"Респонденты" и "Боли" и jsonl со списком болей в каждой строке.
+
+Файл читается потоково: xlsx - в режиме read_only openpyxl, csv и jsonl -
+построчно (можно сжатые .gz). Проверенные строки пишутся в хранилище
+пачками (add_many), поэтому память не зависит от количества строк, кроме
+множества уже известных ID респондентов, по которому отбрасываются
+повторы - и из базы, и внутри самого файла. ID_интервью из файла не
+сохраняется: хранилище выдает новые.
+"""
+import csv
+import gzip
+import itertools
+import json
+import logging
+import time
+from datetime import datetime
+
+from exporters import SHEET_TITLES
+from pains import canonical_pain
+from storage import BASE_COLUMNS, CANONICAL_KEY, ID_COLUMN, PAIN_FIELDS, PAINS_KEY, from_wide, record_from_json
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('xlsx', 'csv', 'jsonl')
+IMPORT_CHUNK = 200  # Строк в одной записи в хранилище
+MAX_ERRORS = 10  # Сколько ошибочных строк перечислять в отчете
+MAX_SCORE = 10
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # Как в interview.date
+
+
+class ImportFormatError(Exception):
+    """Файл нельзя загрузить: неизвестный формат или нет нужных колонок"""
+
+
+class ImportResult:
+    """Итоги загрузки одного файла"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = 0  # Прочитано строк с данными
+        self.imported = 0
+        self.duplicates = 0  # Респонденты, которые уже есть в базе или выше в файле
+        self.invalid = 0
+        self.errors = []  # [(номер строки, описание)] первых MAX_ERRORS ошибок
+        self.seconds = 0.0
+
+    def summary(self):
+        """Одна строка для лога и командной строки"""
+        return (
+            f"{self.filename}: rows {self.rows}, imported {self.imported}, "
+            f"duplicates {self.duplicates}, invalid {self.invalid}, {self.seconds:.1f}s"
+        )
+
+
+def import_format(filename):
+    """(формат, сжат ли gzip) по имени файла"""
+    name = filename.lower()
+    compressed = name.endswith('.gz')
+    if compressed:
+        name = name[:-3]
+    fmt = name.rsplit('.', 1)[-1] if '.' in name else ''
+    if fmt not in IMPORT_FORMATS or (compressed and fmt == 'xlsx'):
+        raise ImportFormatError(f"неизвестный тип файла {filename}, нужен .xlsx, .csv или .jsonl")
+    return fmt, compressed
+
+
+def open_text(path, compressed):
+    # utf-8-sig: csv выгрузки начинается с BOM для Excel
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def check_header(header, table='respondents'):
+    """Проверяет, что в таблице есть нужные колонки"""
+    if table == 'pains':
+        missing = [column for column in (ID_COLUMN, 'Название') if column not in header]
+        if missing:
+            raise ImportFormatError(f"на листе '{SHEET_TITLES['pains']}' нет колонок {', '.join(missing)}")
+        return
+    if 'Номер_боли' in header:
+        raise ImportFormatError(
+            "это таблица болей: загрузите широкую таблицу или xlsx с листами респондентов и болей"
+        )
+    if 'Респондент' not in header:
+        raise ImportFormatError("нет колонки 'Респондент'")
+
+
+def table_rows(rows, table='respondents'):
+    """(номер строки, {колонка: значение}) из потока строк-списков; первая непустая строка - заголовок"""
+    header = None
+    for row_no, values in enumerate(rows, 1):
+        if not any(value not in (None, '') for value in values):
+            continue
+        if header is None:
+            header = [str(value).strip() if value is not None else '' for value in values]
+            check_header(header, table)
+            continue
+        yield row_no, {column: value for column, value in zip(header, values) if column}
+    if header is None:
+        raise ImportFormatError("файл пустой")
+
+
+def row_id(row):
+    """ID_интервью строки выгрузки (0, если его нет)"""
+    try:
+        return int(float(row.get(ID_COLUMN)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_sheets(respondents, pains):
+    """Слияние листов "Респонденты" и "Боли" по ID_интервью
+
+    Выгрузка пишет оба листа по возрастанию ID, поэтому листы читаются
+    одновременно, без загрузки листа болей в память.
+    """
+    pain_rows = table_rows(pains.iter_rows(values_only=True), 'pains')
+    pain = next(pain_rows, None)
+    last_pain_id = 0
+    for row_no, row in respondents:
+        interview_id = row_id(row)
+        record_pains = []
+        while pain is not None and row_id(pain[1]) <= interview_id:
+            pain_id = row_id(pain[1])
+            if pain_id < last_pain_id:
+                raise ImportFormatError(
+                    f"лист '{SHEET_TITLES['pains']}' не отсортирован по {ID_COLUMN} (строка {pain[0]})"
+                )
+            last_pain_id = pain_id
+            if pain_id == interview_id:
+                record_pains.append({field: pain[1].get(field) for field in PAIN_FIELDS})
+            pain = next(pain_rows, None)
+        yield row_no, {**row, PAINS_KEY: record_pains}
+
+
+def iter_xlsx(path):
+    # openpyxl импортируется при первой загрузке, чтобы не замедлять запуск бота
+    from openpyxl import load_workbook
+
+    # read_only: строки читаются из xml по одной, а не всем листом
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        names = wb.sheetnames
+        if SHEET_TITLES['respondents'] in names and SHEET_TITLES['pains'] in names:
+            respondents = table_rows(wb[SHEET_TITLES['respondents']].iter_rows(values_only=True))
+            yield from merge_sheets(respondents, wb[SHEET_TITLES['pains']])
+        else:
+            yield from table_rows(wb.worksheets[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def iter_csv(path, compressed):
+    with open_text(path, compressed) as f:
+        # Excel с русской локалью сохраняет csv через точку с запятой
+        first = f.readline()
+        delimiter = ';' if first.count(';') > first.count(',') else ','
+        yield from table_rows(csv.reader(itertools.chain([first], f), delimiter=delimiter))
+
+
+def iter_jsonl(path, compressed):
+    with open_text(path, compressed) as f:
+        for row_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = record_from_json(line)
+            except json.JSONDecodeError:
+                # Строка пойдет в отчет об ошибках
+                row = None
+            yield row_no, row
+
+
+def iter_rows(path, fmt, compressed=False):
+    """(номер строки, строка файла) для формата fmt"""
+    if fmt == 'xlsx':
+        return iter_xlsx(path)
+    if fmt == 'csv':
+        return iter_csv(path, compressed)
+    if fmt == 'jsonl':
+        return iter_jsonl(path, compressed)
+    raise ImportFormatError(f"неизвестный формат {fmt}")
+
+
+def is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def as_text(value):
+    """Значение ячейки как строка (числа из Excel приходят как float)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    return str(value)
+
+
+def parse_score(value):
+    """Оценка боли 0-10 (пустая - 0, как у боли без оценки)"""
+    if is_empty(value):
+        return 0
+    try:
+        score = float(str(value).replace(',', '.'))
+    except ValueError:
+        raise ValueError(f"оценка '{value}' - не число")
+    if not score.is_integer() or not 0 <= score <= MAX_SCORE:
+        raise ValueError(f"оценка {value} - не целое от 0 до {MAX_SCORE}")
+    return int(score)
+
+
+def parse_recorded_at(value):
+    if isinstance(value, datetime):
+        return value
+    if is_empty(value):
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        return None
+
+
+def build_record(row):
+    """Запись интервью из строки файла; ValueError - строка не прошла проверку"""
+    if not isinstance(row, dict):
+        raise ValueError("строка не разобрана")
+    if PAINS_KEY not in row:
+        row = from_wide(row)
+
+    respondent = as_text(row.get('Респондент')).strip()
+    if not respondent:
+        raise ValueError("нет ID респондента")
+
+    record = {column: as_text(row.get(column)) for column in BASE_COLUMNS}
+    record['Респондент'] = respondent
+    record['Время_записи'] = parse_recorded_at(row.get('Время_записи'))
+
+    pains = []
+    for i, pain in enumerate(row[PAINS_KEY] or [], 1):
+        if not isinstance(pain, dict):
+            raise ValueError(f"боль {i} не разобрана")
+        # Пустые колонки Боль_{i}_* широкой таблицы у тех, кто назвал меньше болей
+        if all(is_empty(pain.get(field)) for field in PAIN_FIELDS):
+            continue
+        try:
+            score = parse_score(pain.get('Оценка'))
+        except ValueError as e:
+            raise ValueError(f"боль {i}: {e}")
+        name = as_text(pain.get('Название'))
+        pains.append({
+            'Название': name,
+            'Оценка': score,
+            'Эмоция': as_text(pain.get('Эмоция')),
+            'Случай': as_text(pain.get('Случай')),
+            'Причина': as_text(pain.get('Причина')),
+            CANONICAL_KEY: canonical_pain(name),
+        })
+    record[PAINS_KEY] = pains
+    return record
+
+
+def known_respondents(store):
+    """Множество ID респондентов в хранилище - индекс для отсева повторов"""
+    return {str(respondent).strip() for respondent in store.iter_respondents() if respondent}
+
+
+def import_file(store, path, filename=None, chunk_size=IMPORT_CHUNK, on_chunk=None):
+    """Загружает интервью из файла в хранилище, возвращает ImportResult
+
+    filename - исходное имя (по нему определяется формат), если path - временный файл.
+    on_chunk([(запись, ID)]) вызывается после записи каждой пачки (в том же потоке).
+    Повторная загрузка того же файла ничего не добавляет: все респонденты уже в базе.
+    """
+    filename = filename or path
+    fmt, compressed = import_format(filename)
+    result = ImportResult(filename)
+    started = time.perf_counter()
+    known = known_respondents(store)
+    chunk = []
+
+    def write_chunk():
+        ids = store.add_many(chunk)
+        result.imported += len(ids)
+        if on_chunk is not None:
+            on_chunk(list(zip(chunk, ids)))
+
+    try:
+        for row_no, row in iter_rows(path, fmt, compressed):
+            result.rows += 1
+            try:
+                record = build_record(row)
+            except ValueError as e:
+                result.invalid += 1
+                if len(result.errors) < MAX_ERRORS:
+                    result.errors.append((row_no, str(e)))
+                continue
+
+            if record['Респондент'] in known:
+                result.duplicates += 1
+                continue
+            known.add(record['Респондент'])
+
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                write_chunk()
+                chunk = []
+        if chunk:
+            write_chunk()
+    except ImportFormatError as e:
+        # Ошибка посреди файла (лист болей не по порядку): записанные пачки остаются в базе
+        e.result = result
+        raise
+
+    result.seconds = time.perf_counter() - started
+    logger.info(f"Imported {result.summary()}")
+    return result
@@ -0,0 +1,252 @@
+"""Метрики бота в текстовом формате Prometheus
+
+Без внешних зависимостей: счетчики и гистограммы хранятся в памяти процесса,
+страница /metrics отдается встроенным http.server в отдельном потоке.
+Замер обработчика - это perf_counter и bisect по границам корзин, поэтому
+метрики можно держать включенными в продакшене.
+"""
+import bisect
+import functools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.ext import ApplicationHandlerStop, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин: время в секундах и размер файлов в байтах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000)
+
+# Обработчик, в котором сейчас выполняется код (у каждой задачи asyncio свой контекст)
+_current_handler = ContextVar('current_handler', default=None)
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля сверху: граница корзины, в которую он попадает"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Набор метрик: счетчики и гистограммы с метками, плюс gauge-функции"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # имя -> (тип, описание, {метки: метрика})
+        self._gauges = {}  # имя -> (описание, функция)
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is None or key not in family[2]:
+            with self._lock:
+                family = self._families.setdefault(name, (kind, help_text, {}))
+                if key not in family[2]:
+                    family[2][key] = factory()
+        return family[2][key]
+
+    def counter(self, name, help_text, **labels):
+        return self._get('counter', name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        return self._get('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name, help_text, func):
+        """Значение считается функцией в момент чтения метрик"""
+        self._gauges[name] = (help_text, func)
+
+    def families(self, name):
+        """{метки: метрика} для одного имени (для сводки в /metrics)"""
+        family = self._families.get(name)
+        return dict(family[2]) if family else {}
+
+    def gauge_values(self):
+        values = {}
+        for name, (_, func) in list(self._gauges.items()):
+            try:
+                values[name] = func()
+            except Exception as e:
+                logger.debug(f"Gauge {name} failed: {e}")
+        return values
+
+    def render(self):
+        """Текст в формате Prometheus exposition 0.0.4"""
+        lines = []
+        with self._lock:
+            families = [(name, kind, help_text, list(series.items()))
+                        for name, (kind, help_text, series) in self._families.items()]
+
+        for name, kind, help_text, series in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series:
+                if kind == 'counter':
+                    lines.append(f"{name}{_labels_text(labels)} {_number(metric.value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), list(metric.counts)):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels_text(labels, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels_text(labels)} {_number(metric.sum)}")
+                lines.append(f"{name}_count{_labels_text(labels)} {metric.count}")
+
+        gauge_values = self.gauge_values()
+        for name, (help_text, _) in list(self._gauges.items()):
+            if name not in gauge_values:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(gauge_values[name])}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HANDLER_DURATION = 'bot_handler_duration_seconds'
+HANDLER_ERRORS = 'bot_handler_errors_total'
+
+
+def instrument(callback):
+    """Оборачивает обработчик: время выполнения и ошибки (исключения и logger.error внутри)"""
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        token = _current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # Штатная остановка цепочки обработчиков, не ошибка
+            raise
+        except Exception:
+            metrics.counter(HANDLER_ERRORS, "Ошибки в обработчиках", handler=name).inc()
+            raise
+        finally:
+            metrics.histogram(HANDLER_DURATION, "Время работы обработчика", handler=name).observe(
+                time.perf_counter() - started
+            )
+            _current_handler.reset(token)
+
+    return wrapper
+
+
+def instrument_application(application):
+    """Подключает замеры ко всем обработчикам приложения, включая шаги ConversationHandler"""
+    def nested(handler):
+        if isinstance(handler, ConversationHandler):
+            children = [*handler.entry_points, *handler.fallbacks]
+            for state_handlers in handler.states.values():
+                children.extend(state_handlers)
+            for child in children:
+                yield from nested(child)
+        else:
+            yield handler
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            for leaf in nested(handler):
+                if not getattr(leaf.callback, '__wrapped__', None):
+                    leaf.callback = instrument(leaf.callback)
+
+
+class _ErrorLogCounter(logging.Handler):
+    """Считает записи уровня ERROR как ошибки текущего обработчика
+
+    Обработчики бота перехватывают исключения и пишут logger.error, поэтому
+    ошибка видна только в логе.
+    """
+
+    def emit(self, record):
+        name = _current_handler.get()
+        if name is not None and record.levelno >= logging.ERROR:
+            metrics.counter(HANDLER_ERRORS, "Ошибки в обработчиках", handler=name).inc()
+
+
+_error_counter = None
+
+
+def install_error_counter():
+    global _error_counter
+    if _error_counter is None:
+        _error_counter = _ErrorLogCounter(level=logging.ERROR)
+        logging.getLogger().addHandler(_error_counter)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Запросы Prometheus раз в несколько секунд не нужны в логе бота
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Запускает страницу /metrics в фоновом потоке, возвращает сервер (для shutdown)"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,43 @@
+"""Записи незавершенного интервью
+
+Вынесены из bot.py, чтобы сохраненные сессии (см. persistence.py) читались
+одинаково при запуске bot.py как скрипта и при импорте из стендов.
+"""
+from dataclasses import dataclass, field
+
+# Записи со __slots__: без __dict__ у каждого экземпляра, что заметно
+# при большом количестве одновременных интервью
+
+
+@dataclass(slots=True)
+class Pain:
+    """Анализ одной боли"""
+    name: str = ""
+    last_case: str = ""
+    reason: str = ""
+    emotion: str = ""
+    score: int = 0
+
+
+@dataclass(slots=True)
+class Insights:
+    """Ключевые инсайты интервью"""
+    surprise: str = ""
+    hidden_needs: str = ""
+    food_signals: str = ""
+    willingness_to_pay: str = ""
+
+
+@dataclass(slots=True)
+class InterviewData:
+    """Класс для хранения данных интервью"""
+    respondent_id: str = None
+    date: str = None
+    duration: str = None
+    day_description: str = ""
+    pain_points: list = field(default_factory=list)
+    main_pains: str = ""
+    most_annoying: str = ""
+    pain_analysis: list = field(default_factory=list)  # Список Pain
+    magic_wand: str = ""
+    insights: Insights = field(default_factory=Insights)
@@ -0,0 +1,56 @@
+"""Канонические ID болей
+
+Одна и та же боль записывается по-разному: "Длинные очереди",
+"очереди в столовой", "Другое: очередь в буфете". Название приводится
+к набору основ слов (см. stemmer), синонимы заменяются на одну основу,
+а слова-усилители отбрасываются; отсортированные основы через пробел и
+есть канонический ID ("очеред столов"). ID вычисляется при сохранении и
+хранится вместе с болью.
+"""
+import re
+from functools import lru_cache
+
+from stemmer import stem, terms
+
+# Увеличить при изменении правил ниже: сохраненные ID будут пересчитаны
+CANONICAL_VERSION = 1
+
+# Каноническое слово -> слова, которые к нему приводятся
+SYNONYM_GROUPS = {
+    'очередь': ['очередь', 'толпа', 'давка', 'толкучка'],
+    'столовая': ['столовая', 'столовка', 'буфет', 'кафе', 'кафетерий', 'кафешка'],
+    'опоздание': ['опоздание', 'опоздания', 'опоздать', 'опоздал', 'опоздала', 'опаздывать', 'опаздываю'],
+    'спешка': ['спешка', 'спешить', 'спешу', 'торопиться', 'тороплюсь', 'суета', 'бегом'],
+    'расписание': ['расписание', 'распорядок', 'график'],
+    'цена': ['цена', 'цены', 'дорого', 'дорогой', 'дорогая', 'дорогие', 'стоимость'],
+    'время': ['время', 'времени', 'временем'],
+    'нехватка': ['нехватка', 'недостаток', 'хватает', 'хватило', 'нет'],
+    'еда': ['еда', 'еды', 'питание', 'пища'],
+    'обед': ['обед', 'обедать', 'пообедать'],
+    'пара': ['пара', 'пары', 'занятие', 'занятия', 'лекция', 'лекции', 'семинар'],
+}
+# Слова, которые не меняют суть боли
+FILLER_WORDS = [
+    'очень', 'слишком', 'длинный', 'длинные', 'большой', 'большие', 'огромный', 'огромные',
+    'высокий', 'высокие', 'постоянный', 'постоянно', 'вечный', 'вечно', 'сильно', 'всегда',
+    'часто', 'проблема', 'проблемы', 'между', 'другое',
+]
+
+SYNONYMS = {stem(word): stem(head) for head, words in SYNONYM_GROUPS.items() for word in words}
+FILLERS = frozenset(stem(word) for word in FILLER_WORDS)
+
+_OTHER_PREFIX = re.compile(r'^\s*Другое\s*:\s*', re.IGNORECASE)
+
+
+def pain_label(name):
+    """Название боли для вывода: без префикса "Другое:" и пробелов по краям"""
+    return _OTHER_PREFIX.sub('', str(name or '')).strip()
+
+
+@lru_cache(maxsize=10_000)
+def canonical_pain(name):
+    """Канонический ID боли по ее названию ('' - если в названии нет слов)"""
+    stems = [SYNONYMS.get(term, term) for term in terms(pain_label(name))]
+    # Название только из усилителей ("Проблемы") остается как есть
+    meaningful = [term for term in stems if term not in FILLERS] or stems
+    return ' '.join(sorted(set(meaningful)))
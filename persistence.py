@@ -0,0 +1,181 @@
+"""Сохранение незавершенных интервью между перезапусками бота"""
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from workers import shard_for
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_FILENAME = 'sessions.db'
+
+
+class SQLiteSessionPersistence(BasePersistence):
+    """Persistence для PTB в локальном файле SQLite
+
+    Хранятся user_data (интервью и текущая боль) и состояния ConversationHandler.
+    PTB раз в update_interval передает только измененные записи; они собираются
+    в пачку и пишутся одной транзакцией в отдельном потоке, поэтому обработка
+    сообщений не ждет диска. Пустые user_data и завершенные диалоги удаляются.
+
+    shard=(номер, всего) - для нескольких процессов с общим файлом: процесс
+    загружает только сессии своих пользователей (см. workers.shard_for), а пишет
+    и так только их, потому что обновления других пользователей к нему не приходят.
+    """
+
+    def __init__(self, path, update_interval=5, shard=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.shard = shard
+        self._conn = None
+        self._lock = threading.Lock()  # Соединение используется из потоков to_thread
+        self._pending = {}  # (вид, ключ) -> значение; None - удалить
+        self._write_task = None
+
+    def _connection(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, kind):
+        """Все записи вида kind: {ключ: значение}"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM sessions WHERE kind = ?", (kind,)
+            ).fetchall()
+
+        data = {}
+        for key, value in rows:
+            try:
+                key = json.loads(key)
+                # Ключи диалогов - кортежи (chat_id, user_id), в JSON они становятся списками
+                key = tuple(key) if isinstance(key, list) else key
+                if not self._owns(key):
+                    continue
+                data[key] = pickle.loads(value)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable session {kind}/{key}: {e}")
+        return data
+
+    def _owns(self, key):
+        """Сессия принадлежит этому процессу (ключ - id пользователя или (chat_id, user_id))"""
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        # Обновления раздаются по id пользователя, поэтому и диалоги делятся по нему, а не по чату
+        user_id = key[-1] if isinstance(key, tuple) else key
+        return shard_for(user_id, count) == index
+
+    def _queue(self, kind, key, value):
+        """Запоминает изменение и планирует запись пачки"""
+        self._pending[(kind, key)] = value
+        if self._write_task is None:
+            # PTB вызывает update_* для всех измененных записей сразу (через gather),
+            # задача записи стартует после них и забирает всю пачку
+            self._write_task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    async def _write_pending(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, {}
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                except Exception as e:
+                    logger.error(f"Error saving sessions: {e}", exc_info=True)
+                    # Вернем несохраненное в очередь, если его не перезаписали более новые данные
+                    for item, value in batch.items():
+                        self._pending.setdefault(item, value)
+                    break
+        finally:
+            self._write_task = None
+
+    def _write(self, batch):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for (kind, key), value in batch.items():
+                    key = json.dumps(key)
+                    if value is None or value == {}:
+                        conn.execute("DELETE FROM sessions WHERE kind = ? AND key = ?", (kind, key))
+                    else:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO sessions (kind, key, value) VALUES (?, ?, ?)",
+                            (kind, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)),
+                        )
+        logger.debug(f"Saved {len(batch)} session changes")
+
+    async def get_user_data(self):
+        return await asyncio.to_thread(self._load, 'user')
+
+    async def get_chat_data(self):
+        return await asyncio.to_thread(self._load, 'chat')
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return await asyncio.to_thread(self._load, f'conversation:{name}')
+
+    async def update_conversation(self, name, key, new_state):
+        self._queue(f'conversation:{name}', key, new_state)
+
+    async def update_user_data(self, user_id, data):
+        self._queue('user', user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._queue('chat', chat_id, data)
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        self._queue('user', user_id, None)
+
+    async def drop_chat_data(self, chat_id):
+        self._queue('chat', chat_id, None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        # Данные живут в памяти приложения, перечитывать их из файла не нужно
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Дописывает оставшиеся изменения и закрывает файл (при остановке бота)"""
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            await asyncio.to_thread(self._write, batch)
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
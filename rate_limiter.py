@@ -0,0 +1,149 @@
+"""Ограничение частоты исходящих сообщений с приоритетами"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты отправки: подсказки интервью важнее отчетов и файлов выгрузки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+BULK = {'priority': PRIORITY_BULK}  # rate_limit_args для массовых отправок
+OVERALL_BURST = 5  # Сколько сообщений сверх общего лимита можно отправить пачкой
+
+# Корзины простаивающих чатов удаляются, когда их становится больше этого числа
+MAX_IDLE_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity за раз"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько секунд ждать до появления токена"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def retry_after_seconds(error):
+    """RetryAfter.retry_after - число секунд или timedelta (зависит от версии PTB)"""
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    """Ограничитель запросов Bot API с общей и поканальной корзинами
+
+    Ограничиваются только запросы с chat_id (отправка сообщений и файлов),
+    служебные вызовы вроде getUpdates проходят сразу. Пока подсказке интервью
+    не хватает только общего токена, массовые отправки (rate_limit_args=BULK)
+    его не забирают; подсказки, которые ждут корзину своего чата, отправкам
+    в другие чаты не мешают. При RetryAfter все отправки приостанавливаются на указанное
+    Telegram время, а запрос повторяется до max_retries раз.
+    """
+
+    def __init__(self, overall_rate=25, overall_burst=OVERALL_BURST, chat_rate=1, chat_burst=3, group_rate=20 / 60,
+                 max_retries=3):
+        # По умолчанию за любую секунду уходит не больше 30 сообщений (25 в секунду плюс пачка 5) -
+        # это лимит Telegram для бота
+        self.overall = TokenBucket(overall_rate, overall_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._chats = {}
+        self._interactive_waiting = {}  # Корзина чата -> сколько подсказок в нем ждут
+        self._paused_until = 0.0
+        self.retries = 0
+        self.throttled = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_full(now)}
+            # Группы и каналы (отрицательный id или @username) ограничены строже личных чатов
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(self.group_rate, 1) if is_group else TokenBucket(self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _interactive_ready(self, now):
+        """Ждет ли подсказка, которой не хватает только общего токена"""
+        if now < self._paused_until:
+            return False
+        return any(chat.wait_time(now) <= 0 for chat in self._interactive_waiting)
+
+    async def _acquire(self, chat_id, priority):
+        chat = self._chat_bucket(chat_id)
+        interactive = priority == PRIORITY_INTERACTIVE
+        if interactive:
+            self._interactive_waiting[chat] = self._interactive_waiting.get(chat, 0) + 1
+        try:
+            throttled = False
+            while True:
+                now = time.monotonic()
+                wait = max(self._paused_until - now, chat.wait_time(now), self.overall.wait_time(now))
+                if wait <= 0 and not interactive and self._interactive_ready(now):
+                    # Общий токен достанется подсказке, у которой свободна корзина чата
+                    wait = 1 / self.overall.rate
+                if wait <= 0:
+                    chat.consume(now)
+                    self.overall.consume(now)
+                    if throttled:
+                        self.throttled += 1
+                    return
+                throttled = True
+                await asyncio.sleep(wait)
+        finally:
+            if interactive:
+                self._interactive_waiting[chat] -= 1
+                if not self._interactive_waiting[chat]:
+                    del self._interactive_waiting[chat]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get('priority', PRIORITY_INTERACTIVE)
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.retries += 1
+                logger.warning(f"Flood limit on {endpoint} for chat {chat_id}, retrying in {delay:.1f}s")
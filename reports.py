@@ -0,0 +1,105 @@
+"""Разбиение отчета на сообщения Telegram и отчет-документ
+
+Telegram ограничивает текст сообщения 4096 символами, считая в единицах
+UTF-16: эмодзи вне BMP (📊, 🎉) занимают две единицы. Отчет делится по
+разделам (блоки, разделенные пустой строкой), которые жадно укладываются
+в сообщения целиком; раздел длиннее лимита делится по строкам, а строка -
+по словам, но никогда не внутри символа и не перед модификатором эмодзи.
+"""
+import html
+import unicodedata
+
+MAX_MESSAGE_LENGTH = 4096
+REPORT_DOCUMENT_FORMATS = ('html', 'txt')
+
+SECTION_SEPARATOR = '\n\n'
+LINE_SEPARATOR = '\n'
+# Символы, которые нельзя отрывать от предыдущего: ZWJ, селекторы вариантов, модификаторы тона кожи
+_GLUE = {'\u200d', '\ufe0e', '\ufe0f', *map(chr, range(0x1f3fb, 0x1f400))}
+
+
+def utf16_len(text):
+    """Длина текста так, как ее считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _glued(text, cut):
+    """Нельзя резать text перед позицией cut"""
+    char = text[cut]
+    return char in _GLUE or text[cut - 1] == '\u200d' or unicodedata.combining(char) > 0
+
+
+def _split_line(line, limit):
+    """Делит строку длиннее limit: по последнему пробелу, иначе по границе символа"""
+    while utf16_len(line) > limit:
+        units = 0
+        cut = 0
+        for char in line:
+            units += 2 if ord(char) > 0xFFFF else 1
+            if units > limit:
+                break
+            cut += 1
+        space = line.rfind(' ', 0, cut)
+        if space > 0:
+            cut = space + 1
+        else:
+            while cut > 1 and _glued(line, cut):
+                cut -= 1
+        yield line[:cut]
+        line = line[cut:]
+    if line:
+        yield line
+
+
+def _pieces(text, limit):
+    """(разделитель, кусок): разделы целиком, если влезают, иначе строки или части строк"""
+    for section_number, section in enumerate(text.split(SECTION_SEPARATOR)):
+        separator = SECTION_SEPARATOR if section_number else ''
+        if utf16_len(section) <= limit:
+            yield separator, section
+            continue
+        for line_number, line in enumerate(section.split(LINE_SEPARATOR)):
+            line_separator = separator if line_number == 0 else LINE_SEPARATOR
+            for part_number, part in enumerate(_split_line(line, limit)):
+                yield (line_separator if part_number == 0 else ''), part
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Делит текст на минимальное при таком порядке число сообщений не длиннее limit (UTF-16)"""
+    messages = []
+    current = []
+    current_length = 0
+    for separator, piece in _pieces(text, limit):
+        piece_length = utf16_len(piece)
+        if current and current_length + utf16_len(separator) + piece_length <= limit:
+            current.extend((separator, piece))
+            current_length += utf16_len(separator) + piece_length
+            continue
+        if current:
+            messages.append(''.join(current))
+        # Новое сообщение не начинается с пустых строк: Telegram не принимает пустой текст
+        piece = piece.lstrip('\n')
+        current = [piece] if piece.strip() else []
+        current_length = utf16_len(piece) if current else 0
+    if current:
+        messages.append(''.join(current))
+    return messages
+
+
+def report_document(text, title, fmt='html'):
+    """Отчет одним файлом: (содержимое в байтах, расширение)"""
+    if fmt == 'txt':
+        return text.encode('utf-8'), 'txt'
+    if fmt != 'html':
+        raise ValueError(f"Unknown report document format: {fmt}")
+    sections = [section.strip('\n') for section in text.split(SECTION_SEPARATOR) if section.strip()]
+    body = ''.join(f"<section><pre>{html.escape(section)}</pre></section>\n" for section in sections)
+    page = (
+        '<!DOCTYPE html>\n<html lang="ru">\n<head>\n<meta charset="utf-8">\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+        f'<title>{html.escape(title)}</title>\n'
+        '<style>body{font-family:sans-serif;max-width:48em;margin:1em auto;padding:0 1em}'
+        'pre{white-space:pre-wrap;font-family:inherit}</style>\n'
+        f'</head>\n<body>\n{body}</body>\n</html>\n'
+    )
+    return page.encode('utf-8'), 'html'
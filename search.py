@@ -0,0 +1,140 @@
+"""Полнотекстовый поиск по свободным ответам интервью
+
+Тексты разбиваются на слова и приводятся к основам (см. stemmer), поэтому
+"очереди", "очередь" и "очередях" совпадают. Индекс - словарь основа ->
+постинги (номера документов и частоты в массивах array, чтобы десятки
+тысяч интервью занимали десятки мегабайт). Ранжирование - BM25; фрагмент для ответа вырезается из записи, прочитанной из хранилища.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter
+
+from stemmer import WORD, normalize, stem, terms
+from storage import ID_COLUMN, PAINS_KEY, IncrementalIndex
+
+# Свободные ответы: ключ записи -> название поля в результатах поиска
+TEXT_FIELDS = (
+    ('Описание_дня', 'День'),
+    ('Основные_проблемы', 'Основные проблемы'),
+    ('Самая_раздражающая', 'Самая раздражающая'),
+    ('Волшебная_палочка', 'Волшебная палочка'),
+    ('Что_удивило', 'Удивило'),
+    ('Скрытые_потребности', 'Скрытые потребности'),
+    ('Сигналы_о_еде', 'Еда'),
+    ('Готовность_платить', 'Готовность платить'),
+)
+PAIN_TEXT_FIELDS = (
+    ('Название', 'название'),
+    ('Случай', 'случай'),
+    ('Причина', 'причина'),
+)
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+SNIPPET_CHARS = 160
+
+
+def record_texts(record):
+    """(название поля, текст) всех свободных ответов интервью"""
+    for key, label in TEXT_FIELDS:
+        value = record.get(key)
+        if value:
+            yield label, str(value)
+    for number, pain in enumerate(record.get(PAINS_KEY) or [], 1):
+        for key, label in PAIN_TEXT_FIELDS:
+            value = pain.get(key)
+            if value:
+                yield f"Боль {number}, {label}", str(value)
+
+
+def snippet(record, query_terms, width=SNIPPET_CHARS):
+    """(поле, фрагмент) с наибольшим числом слов запроса, None - если совпадений нет"""
+    best = None
+    for label, text in record_texts(record):
+        found = set()
+        first = None
+        for match in WORD.finditer(text):
+            term = stem(normalize(match.group()))
+            if term in query_terms:
+                found.add(term)
+                if first is None:
+                    first = match.start()
+        if found and (best is None or len(found) > best[0]):
+            best = (len(found), label, text, first)
+    if best is None:
+        return None
+
+    _, label, text, first = best
+    start = max(0, first - width // 3)
+    if start:
+        # Начинаем с границы слова
+        space = text.find(' ', start)
+        start = space + 1 if 0 <= space < first else start
+    end = min(len(text), start + width)
+    if end < len(text):
+        space = text.rfind(' ', start, end)
+        end = space if space > first else end
+    fragment = text[start:end].strip()
+    return label, ('…' if start else '') + fragment + ('…' if end < len(text) else '')
+
+
+class SearchIndex(IncrementalIndex):
+    """Инвертированный индекс по свободным ответам с ранжированием BM25"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self._postings = {}  # терм -> (номера документов array('I'), частоты array('H'))
+        self._doc_ids = array('I')  # номер документа -> ID интервью
+        self._doc_lengths = array('I')
+        self._respondents = []
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    @property
+    def term_count(self):
+        return len(self._postings)
+
+    def add(self, record):
+        counts = Counter(terms('\n'.join(text for _, text in record_texts(record))))
+        doc = len(self._doc_ids)
+        length = sum(counts.values())
+        self._doc_ids.append(record[ID_COLUMN])
+        self._doc_lengths.append(length)
+        self._respondents.append(str(record.get('Респондент') or ''))
+        self._total_length += length
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('H'))
+            postings[0].append(doc)
+            postings[1].append(count if count < 0xFFFF else 0xFFFF)
+
+    def search(self, query, limit=10):
+        """(всего найдено, [(ID интервью, респондент, оценка)]) по убыванию релевантности"""
+        docs = len(self._doc_ids)
+        if not docs:
+            return 0, []
+        average_length = self._total_length / docs or 1
+        # Нормировка BM25 по длине документа считается один раз на запрос
+        norms = [K1 * (1 - B) + K1 * B / average_length * length for length in self._doc_lengths]
+        scores = [0.0] * docs
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            doc_numbers, counts = postings
+            frequency = len(doc_numbers)
+            weight = math.log(1 + (docs - frequency + 0.5) / (frequency + 0.5)) * (K1 + 1)
+            for doc, count in zip(doc_numbers, counts):
+                scores[doc] += weight * count / (count + norms[doc])
+
+        found = docs - scores.count(0.0)
+        top = heapq.nlargest(min(limit, found), range(docs), key=scores.__getitem__)
+        return found, [(self._doc_ids[doc], self._respondents[doc], scores[doc]) for doc in top]
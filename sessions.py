@@ -0,0 +1,83 @@
+"""Учет активности незавершенных интервью и закрытие брошенных"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Ключи user_data, из которых состоит незавершенное интервью
+SESSION_KEYS = ('interview', 'current_pain')
+LAST_ACTIVITY_KEY = 'last_activity'
+# Интервью закрыто сборщиком: следующее сообщение пользователя не должно попасть в старый шаг диалога
+EXPIRED_KEY = 'session_expired'
+
+
+class SessionManager:
+    """Время последней активности, TTL и счетчики сессий
+
+    Время хранится в самом user_data, поэтому переживает перезапуск вместе
+    с сессией. Брошенные интервью закрываются по conversation_timeout,
+    а после перезапуска (когда таймеры PTB потеряны) - периодическим sweep.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.evicted = 0
+
+    def touch(self, user_data):
+        """Отмечает активность пользователя"""
+        user_data[LAST_ACTIVITY_KEY] = time.time()
+
+    @staticmethod
+    def is_live(user_data):
+        return any(key in user_data for key in SESSION_KEYS)
+
+    def live(self, application):
+        """Количество незавершенных интервью"""
+        # Копия списка: метод вызывается и из потока страницы метрик
+        return sum(1 for user_data in list(application.user_data.values()) if self.is_live(user_data))
+
+    def evict(self, user_data, mark_expired=False):
+        """Удаляет данные интервью из user_data, возвращает True, если было что удалять"""
+        if not self.is_live(user_data):
+            return False
+        for key in SESSION_KEYS:
+            user_data.pop(key, None)
+        if mark_expired:
+            # Флаг снимается командой /start или /cancel, а при закрытии по conversation_timeout -
+            # обработчиком таймаута (диалог в этом случае уже завершен самим PTB)
+            user_data[EXPIRED_KEY] = True
+        self.evicted += 1
+        return True
+
+    def sweep(self, application, now=None):
+        """Закрывает интервью без активности дольше ttl
+
+        Возвращает id пользователей, у которых интервью было закрыто.
+        user_data без времени активности (например, восстановленные из старой
+        базы сессий) получают текущее время и закрываются не раньше чем через ttl.
+        user_data без интервью, простаивающие дольше ttl, удаляются целиком,
+        чтобы память не росла с числом всех когда-либо писавших пользователей.
+        """
+        now = now or time.time()
+        evicted = []
+        idle = []
+        for user_id, user_data in list(application.user_data.items()):
+            last_activity = user_data.get(LAST_ACTIVITY_KEY)
+            if last_activity is None:
+                # Данные без отметки (сохранены до ее появления): ttl отсчитывается с первой проверки
+                user_data[LAST_ACTIVITY_KEY] = now
+                continue
+            if now - last_activity < self.ttl:
+                continue
+            if self.evict(user_data, mark_expired=True):
+                evicted.append(user_id)
+            elif EXPIRED_KEY not in user_data:
+                idle.append(user_id)
+
+        for user_id in idle:
+            application.drop_user_data(user_id)
+        if evicted:
+            application.mark_data_for_update_persistence(user_ids=evicted)
+        if evicted or idle:
+            logger.info(f"Session sweep: evicted {len(evicted)} interviews, dropped {len(idle)} idle users")
+        return evicted
@@ -0,0 +1,50 @@
+"""Нормализация русского текста для поиска и сравнения ответов
+
+Текст приводится к нижнему регистру (ё -> е) и разбивается на слова;
+стоп-слова отбрасываются, а слова приводятся к основе легким стеммером:
+отбрасывается одно окончание (и возвратная частица). Этого хватает, чтобы
+"очереди", "очередь" и "очередях" давали одну основу.
+"""
+import re
+from functools import lru_cache
+
+WORD = re.compile(r'[0-9a-zа-яё]+', re.IGNORECASE)
+
+STOP_WORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне "
+    "было вот от меня о из ему когда даже ну ли если уже или ни быть был него до вас опять уж вам "
+    "ведь там потом себя ей может они тут где есть надо ней для мы тебя их чем была сам без чего "
+    "раз тоже себе под будет ж тогда кто этот того потому этого какой ним здесь этом мой тем чтобы "
+    "нее были куда при об хоть после над через эти нас про всего них эту моя свою этой перед том им".split()
+)
+
+# Окончания, от длинных к коротким; отбрасывается одно, основа не короче MIN_STEM
+_REFLEXIVE = ('ся', 'сь')
+_ENDINGS = tuple(sorted(set(
+    "иями ями ами ием ией иях ого его ому ему ыми ими ешь ете ите ишь ила ило или ала ало али ыла ыло "
+    "ыли ела ело ели ует уют ая яя ое ее ие ые ой ей ий ый ом ем ах ях ов ев ию ью ия ья ам ям ут ют "
+    "ит ат ят ет ил ал ыл ел ть ти ою ею ую юю ии а я о е ы и у ю ь й".split()
+), key=len, reverse=True))
+MIN_STEM = 2
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """Основа слова (word уже в нижнем регистре и без ё)"""
+    for suffix in _REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) > MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for suffix in _ENDINGS:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def terms(text):
+    """Основы слов текста в порядке следования (без стоп-слов)"""
+    return [stem(word) for word in WORD.findall(normalize(text)) if word not in STOP_WORDS]
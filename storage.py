@@ -0,0 +1,976 @@
+"""Хранилища завершенных интервью
+
+Запись интервью - словарь с данными респондента (BASE_COLUMNS) и списком
+болей под ключом 'Боли'. Каждая боль - словарь с ключами PAIN_FIELDS.
+Количество болей не ограничено; широкая таблица Боль_{i}_* строится
+из записи только для выгрузки (см. to_wide). Канонический ID боли (см.
+pains) хранится под ключом 'Канон'.
+"""
+import json
+import logging
+import io
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+from functools import lru_cache
+
+from pains import CANONICAL_VERSION, canonical_pain
+
+logger = logging.getLogger(__name__)
+
+HIGH_PAIN_SCORE = 7  # Боли с оценкой >= 7 считаются высокой интенсивности
+
+# Колонки записи интервью (в порядке вывода в таблицу)
+BASE_COLUMNS = [
+    'Респондент', 'Дата', 'Описание_дня', 'Точки_напряжения', 'Основные_проблемы',
+    'Самая_раздражающая', 'Волшебная_палочка', 'Что_удивило', 'Скрытые_потребности',
+    'Сигналы_о_еде', 'Готовность_платить', 'Время_записи',
+]
+PAIN_FIELDS = ['Название', 'Оценка', 'Эмоция', 'Случай', 'Причина']
+PAINS_KEY = 'Боли'
+ID_COLUMN = 'ID_интервью'
+CANONICAL_KEY = 'Канон'
+
+# Таблица респондентов и таблица болей (длинный формат)
+RESPONDENT_COLUMNS = [ID_COLUMN] + BASE_COLUMNS
+PAIN_TABLE_COLUMNS = [ID_COLUMN, 'Респондент', 'Номер_боли'] + PAIN_FIELDS + [CANONICAL_KEY]
+
+
+@lru_cache(maxsize=None)
+def pain_keys(i):
+    """Ключи Боль_{i}_* (Название, Оценка, Эмоция, Случай, Причина) для i-й боли
+
+    Строки интернированы и кэшируются, поэтому все записи используют
+    одни и те же объекты ключей вместо новой строки в каждой записи.
+    """
+    return tuple(sys.intern(f'Боль_{i}_{field}') for field in PAIN_FIELDS)
+
+
+def pain_columns(count):
+    """Колонки Боль_{i}_* для count болей"""
+    return [key for i in range(1, count + 1) for key in pain_keys(i)]
+
+
+def wide_columns(max_pains):
+    """Колонки широкой таблицы: данные респондента + Боль_{i}_* для каждой боли"""
+    return RESPONDENT_COLUMNS + pain_columns(max_pains)
+
+
+def to_wide(record):
+    """Разворачивает боли записи в колонки Боль_{i}_*"""
+    row = {key: value for key, value in record.items() if key != PAINS_KEY}
+    for i, pain in enumerate(record.get(PAINS_KEY) or [], 1):
+        for key, field in zip(pain_keys(i), PAIN_FIELDS):
+            row[key] = pain.get(field)
+    return row
+
+
+def from_wide(row):
+    """Собирает боли из колонок Боль_{i}_* в список (обратное к to_wide)"""
+    record = {}
+    for key, value in row.items():
+        if not key.startswith('Боль_'):
+            record[key] = value
+    pains = list(row.get(PAINS_KEY) or [])
+    i = 1
+    while pain_keys(i)[0] in row:
+        pains.append({field: row.get(key) for key, field in zip(pain_keys(i), PAIN_FIELDS)})
+        i += 1
+    record[PAINS_KEY] = pains
+    return record
+
+
+def pain_canonical(pain):
+    """Канонический ID боли: сохраненный или вычисленный по названию"""
+    return pain.get(CANONICAL_KEY) or canonical_pain(pain.get('Название'))
+
+
+def iter_pain_rows(record):
+    """Строки таблицы болей для одной записи"""
+    for i, pain in enumerate(record.get(PAINS_KEY) or [], 1):
+        row = {
+            ID_COLUMN: record.get(ID_COLUMN),
+            'Респондент': record.get('Респондент'),
+            'Номер_боли': i,
+        }
+        for field in PAIN_FIELDS:
+            row[field] = pain.get(field)
+        row[CANONICAL_KEY] = pain_canonical(pain)
+        yield row
+
+
+def count_pains(record):
+    """Возвращает (всего болей с оценкой, болей с высокой оценкой) для записи"""
+    total_pains = 0
+    high_pain_count = 0
+    for pain in record.get(PAINS_KEY) or []:
+        score = pain.get('Оценка')
+        if isinstance(score, (int, float)) and score > 0:
+            total_pains += 1
+            if score >= HIGH_PAIN_SCORE:
+                high_pain_count += 1
+    return total_pains, high_pain_count
+
+
+def record_to_json(record):
+    """Сериализует запись в строку JSON"""
+    data = dict(record)
+    if isinstance(data.get('Время_записи'), datetime):
+        data['Время_записи'] = data['Время_записи'].isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+
+def record_from_json(line):
+    """Восстанавливает запись из строки JSON"""
+    record = json.loads(line)
+    if record.get('Время_записи'):
+        try:
+            record['Время_записи'] = datetime.fromisoformat(record['Время_записи'])
+        except (TypeError, ValueError):
+            pass
+    return record
+
+
+class InterviewStore:
+    """Базовый класс хранилища интервью"""
+
+    def add(self, record):
+        """Добавляет одно интервью, возвращает его ID"""
+        raise NotImplementedError
+
+    def add_many(self, records):
+        """Добавляет пачку интервью одной записью на диск, возвращает их ID"""
+        return [self.add(record) for record in records]
+
+    def count(self):
+        """Количество сохраненных интервью"""
+        raise NotImplementedError
+
+    def version(self):
+        """Версия данных: увеличивается при каждом добавлении и очистке"""
+        raise NotImplementedError
+
+    def generation(self):
+        """Номер очистки: меняется только при clear (между очистками записи только дописываются)"""
+        raise NotImplementedError
+
+    def iter_records(self, after_id=0):
+        """Перебирает записи (с ID_интервью и списком болей) в порядке сохранения
+
+        after_id - только записи с ID больше этого (догнать изменения других процессов).
+        """
+        raise NotImplementedError
+
+    def get_records(self, ids):
+        """Записи с указанными ID: {ID: запись}"""
+        wanted = set(ids)
+        return {record[ID_COLUMN]: record for record in self.iter_records() if record[ID_COLUMN] in wanted}
+
+    def iter_respondents(self):
+        """Перебирает ID респондентов всех интервью"""
+        for record in self.iter_records():
+            yield record.get('Респондент')
+
+    def iter_pains(self):
+        """Перебирает строки таблицы болей (PAIN_TABLE_COLUMNS)"""
+        for record in self.iter_records():
+            yield from iter_pain_rows(record)
+
+    def max_pain_count(self):
+        """Наибольшее количество болей в одной записи (для колонок широкой таблицы)"""
+        return max((len(record[PAINS_KEY]) for record in self.iter_records()), default=0)
+
+    def clear(self):
+        """Удаляет все интервью, возвращает количество удаленных"""
+        raise NotImplementedError
+
+    def flush(self):
+        """Записывает накопленные изменения на диск"""
+
+    def close(self):
+        """Закрывает хранилище"""
+        self.flush()
+
+
+class JsonlInterviewStore(InterviewStore):
+    """Журнал интервью (write-ahead log) плюс снимок
+
+    Каждое интервью дописывается в журнал одной строкой JSON и сбрасывается
+    на диск (fsync) до возврата из add, поэтому сохраненное интервью
+    переживает падение процесса или машины. Когда в журнале накапливается
+    snapshot_every записей, они переносятся в снимок (файл .snapshot с
+    заголовком), а журнал начинается заново; оба файла заменяются атомарно.
+    При открытии читается только заголовок снимка и хвост журнала, а
+    оборванная при падении последняя строка журнала отрезается.
+
+    ID интервью - порядковый номер записи; он хранится в каждой строке, поэтому
+    записи журнала, уже перенесенные в снимок, при повторном чтении пропускаются.
+    Рядом со снимком лежит индекс .snapshot.idx - смещения строк снимка по ID,
+    а смещения строк журнала хранятся в памяти; поэтому get_records читает
+    только нужные строки, а не оба файла целиком.
+    """
+
+    SNAPSHOT_FORMAT = 1
+    # ID в строке снимка ищется без разбора JSON (в строковых значениях кавычки экранированы);
+    # ключ пишется последним, поэтому поиск идет с конца строки
+    ID_KEY = f'"{ID_COLUMN}": '.encode('utf-8')
+    ID_PATTERN = re.compile(re.escape(ID_KEY) + rb'(\d+)')
+    # Индекс снимка: int64 little-endian; ячейка 0 - количество записей снимка,
+    # ячейка ID - смещение строки этого ID (-1 - строки нет)
+    OFFSET = struct.Struct('<q')
+
+    def __init__(self, path, snapshot_every=1000, fsync=True):
+        self.path = path
+        self.snapshot_path = f"{os.path.splitext(path)[0]}.snapshot"
+        self.index_path = f"{self.snapshot_path}.idx"
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self._version = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self._recover()
+
+    def _read_header(self, f):
+        """Количество записей в снимке по его первой строке"""
+        line = f.readline()
+        try:
+            return json.loads(line)['count']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"Broken snapshot header in {self.snapshot_path}")
+
+    def _snapshot_count(self):
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            return self._read_header(f)
+
+    def _line_id(self, line):
+        """ID из строки снимка (None, если его нет)"""
+        match = self.ID_PATTERN.match(line, max(line.rfind(self.ID_KEY), 0))
+        return int(match.group(1)) if match else None
+
+    def _empty_index(self, count):
+        table = array('q', [-1]) * (count + 1)
+        table[0] = count
+        return table
+
+    def _index_bytes(self, table):
+        if sys.byteorder == 'big':
+            table = array('q', table)
+            table.byteswap()
+        return table.tobytes()
+
+    def _load_index(self, count):
+        """Индекс снимка из count записей с диска (None, если его нет или он от другого снимка)"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if len(data) != self.OFFSET.size * (count + 1) or self.OFFSET.unpack_from(data)[0] != count:
+            return None
+        table = array('q')
+        table.frombytes(data)
+        if sys.byteorder == 'big':
+            table.byteswap()
+        return table
+
+    def _write_index(self, tmp_path, table):
+        with open(tmp_path, 'wb') as f:
+            f.write(self._index_bytes(table))
+            self._sync(f)
+
+    def _recover(self):
+        """Читает заголовок снимка и хвост журнала, отрезает оборванную строку"""
+        self._snapshot = self._snapshot_count()
+        self._journal_offsets = {}  # ID -> смещение строки журнала (только хвост после снимка)
+        last_id = 0
+        tail = 0
+        valid_end = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                offset = 0
+                for line_no, line in enumerate(f, 1):
+                    start = offset
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping broken line {line_no} in {self.path}")
+                        continue
+                    # Строки без ID записаны до появления снимков: ID - номер строки
+                    last_id = data.get(ID_COLUMN) or last_id + 1
+                    if last_id > self._snapshot:
+                        tail += 1
+                        self._journal_offsets[last_id] = start
+                    valid_end = offset
+                size = offset
+
+            if size > valid_end:
+                # Запись, оборванная при падении, не была подтверждена - отрезаем ее
+                with open(self.path, 'r+b') as f:
+                    f.truncate(valid_end)
+                    self._sync(f)
+                logger.warning(f"Truncated {size - valid_end} bytes of an incomplete record in {self.path}")
+            elif valid_end:
+                with open(self.path, 'rb') as f:
+                    f.seek(valid_end - 1)
+                    unterminated = f.read(1) != b'\n'
+                if unterminated:
+                    with open(self.path, 'ab') as f:
+                        f.write(b'\n')
+                        self._sync(f)
+
+        self._count = max(self._snapshot, last_id)
+        self._tail = tail
+        if tail:
+            logger.info(f"Replayed {tail} journal records after a snapshot of {self._snapshot}")
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _sync_dir(self):
+        """Сбрасывает на диск переименования в папке (на Windows не требуется)"""
+        if not self.fsync or not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _replace(self, tmp_path, path):
+        os.replace(tmp_path, path)
+        self._sync_dir()
+
+    def add(self, record):
+        return self.add_many([record])[0]
+
+    def add_many(self, records):
+        with self._lock:
+            first_id = self._count + 1
+            lines = [
+                (record_to_json({**record, ID_COLUMN: interview_id}) + "\n").encode('utf-8')
+                for interview_id, record in enumerate(records, first_id)
+            ]
+            # Одна запись и один fsync на пачку; при падении посреди пачки
+            # целые строки остаются, оборванная последняя отрезается при открытии
+            with open(self.path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(b''.join(lines))
+                self._sync(f)
+            for interview_id, line in enumerate(lines, first_id):
+                self._journal_offsets[interview_id] = offset
+                offset += len(line)
+            self._count += len(records)
+            self._tail += len(records)
+            self._version += len(records)
+            if self.snapshot_every and self._tail >= self.snapshot_every:
+                self._try_compact()
+            return list(range(first_id, self._count + 1))
+
+    def _try_compact(self):
+        try:
+            self._compact()
+        except OSError as e:
+            # Например, на Windows снимок открыт выгрузкой; журнал остается, повторим позже
+            logger.warning(f"Could not compact {self.path}: {e}")
+
+    def _compact(self):
+        """Переносит журнал в снимок (под self._lock)"""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        table = self._empty_index(self._count)
+        with open(tmp_path, 'wb') as out:
+            header = (json.dumps({'snapshot': self.SNAPSHOT_FORMAT, 'count': self._count}) + "\n").encode('utf-8')
+            out.write(header)
+            if os.path.exists(self.snapshot_path):
+                old = self._load_index(self._snapshot)
+                with open(self.snapshot_path, 'rb') as f:
+                    # Строки снимка копируются байт в байт и сдвигаются на разницу длины заголовков
+                    shift = len(header) - len(f.readline())
+                    if old is not None:
+                        shutil.copyfileobj(f, out)
+                        for interview_id in range(1, len(old)):
+                            if old[interview_id] >= 0:
+                                table[interview_id] = old[interview_id] + shift
+                    else:
+                        # Снимок без индекса (записан до его появления или индекс не успел замениться)
+                        offset = len(header)
+                        for line in f:
+                            out.write(line)
+                            interview_id = self._line_id(line)
+                            if interview_id is not None and interview_id <= self._count:
+                                table[interview_id] = offset
+                            offset += len(line)
+            offset = out.tell()
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for record in self._parse(f, self.path):
+                    if record[ID_COLUMN] > self._snapshot:
+                        line = (record_to_json(record) + "\n").encode('utf-8')
+                        out.write(line)
+                        table[record[ID_COLUMN]] = offset
+                        offset += len(line)
+            self._sync(out)
+        index_tmp_path = f"{self.index_path}.tmp"
+        self._write_index(index_tmp_path, table)
+        # Индекс заменяется после снимка; если процесс упадет между заменами,
+        # количество в индексе не совпадет со снимком и он построится заново
+        self._replace(tmp_path, self.snapshot_path)
+        self._replace(index_tmp_path, self.index_path)
+        self._snapshot = self._count
+        self._journal_offsets = {}
+
+        # Новый пустой журнал вместо усечения: читатели дочитывают открытый старый файл.
+        # Если процесс упадет до замены, записи старого журнала пропустятся по ID
+        tmp_path = f"{self.path}.tmp"
+        open(tmp_path, 'w').close()
+        self._replace(tmp_path, self.path)
+        self._tail = 0
+        logger.info(f"Compacted {self.path}: snapshot of {self._count} records")
+
+    def _parse(self, f, path):
+        """Записи из файла с ID (строкам без ID присваивается следующий номер)"""
+        last_id = 0
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = record_from_json(line)
+            except json.JSONDecodeError:
+                # Строка могла оборваться при падении процесса
+                logger.warning(f"Skipping broken line {line_no} in {path}")
+                continue
+            last_id = record.get(ID_COLUMN) or last_id + 1
+            record[ID_COLUMN] = last_id
+            yield record
+
+    def count(self):
+        return self._count
+
+    def version(self):
+        return self._version
+
+    def generation(self):
+        return self._generation
+
+    def iter_records(self, after_id=0):
+        # Оба файла открываются вместе, чтобы перенос журнала в снимок не попал между ними
+        with self._lock:
+            snapshot = open(self.snapshot_path, 'r', encoding='utf-8') if os.path.exists(self.snapshot_path) else None
+            journal = open(self.path, 'r', encoding='utf-8') if os.path.exists(self.path) else None
+        try:
+            sources = []
+            snapshot_count = 0
+            if snapshot is not None:
+                snapshot_count = self._read_header(snapshot)
+                if after_id < snapshot_count:
+                    sources.append((snapshot, self.snapshot_path))
+            if journal is not None:
+                sources.append((journal, self.path))
+
+            start = max(after_id, 0)
+            for f, path in sources:
+                for record in self._parse(f, path):
+                    interview_id = record[ID_COLUMN]
+                    if interview_id <= start or (f is journal and interview_id <= snapshot_count):
+                        continue
+                    yield self._decode(record, interview_id)
+        finally:
+            for f in (snapshot, journal):
+                if f is not None:
+                    f.close()
+
+    @staticmethod
+    def _decode(record, interview_id):
+        """Запись в текущем формате из строки файла"""
+        if PAINS_KEY not in record:
+            # Строки, записанные до появления таблицы болей, хранились в широком формате
+            record = from_wide(record)
+        record[ID_COLUMN] = interview_id
+        # Журнал не переписывается, поэтому канонические ID считаются по текущим правилам
+        for pain in record[PAINS_KEY]:
+            pain[CANONICAL_KEY] = canonical_pain(pain.get('Название'))
+        return record
+
+    def _snapshot_index(self, snapshot, count):
+        """Файл индекса для открытого снимка; нет или устарел - строится по строкам снимка"""
+        table = self._load_index(count)
+        if table is None:
+            started = time.perf_counter()
+            table = self._empty_index(count)
+            offset = snapshot.tell()
+            for line in snapshot:
+                interview_id = self._line_id(line)
+                if interview_id is not None and interview_id <= count:
+                    table[interview_id] = offset
+                offset += len(line)
+            with self._lock:
+                # Пока строился индекс, снимок мог смениться
+                if self._snapshot == count and os.path.exists(self.snapshot_path):
+                    tmp_path = f"{self.index_path}.tmp"
+                    self._write_index(tmp_path, table)
+                    self._replace(tmp_path, self.index_path)
+            logger.info(f"Built snapshot index of {count} records in {time.perf_counter() - started:.2f}s")
+        return io.BytesIO(self._index_bytes(table))
+
+    def get_records(self, ids):
+        # Файлы и смещения журнала берутся вместе, чтобы перенос журнала в снимок не попал между ними
+        wanted = sorted(set(ids))
+        with self._lock:
+            snapshot = open(self.snapshot_path, 'rb') if os.path.exists(self.snapshot_path) else None
+            journal = open(self.path, 'rb') if os.path.exists(self.path) else None
+            journal_offsets = {interview_id: self._journal_offsets.get(interview_id) for interview_id in wanted}
+        index = None
+        records = {}
+        missing = []
+        try:
+            snapshot_count = 0
+            if snapshot is not None:
+                snapshot_count = self._read_header(snapshot)
+                if wanted and wanted[0] <= snapshot_count:
+                    index = self._snapshot_index(snapshot, snapshot_count)
+            for interview_id in wanted:
+                if interview_id <= snapshot_count:
+                    f = snapshot
+                    index.seek(self.OFFSET.size * interview_id)
+                    offset = self.OFFSET.unpack(index.read(self.OFFSET.size))[0]
+                else:
+                    f = journal
+                    offset = journal_offsets[interview_id]
+                record = None
+                if f is not None and offset is not None and offset >= 0:
+                    f.seek(offset)
+                    try:
+                        record = record_from_json(f.readline())
+                    except json.JSONDecodeError:
+                        pass
+                # Смещения нет (запись другого процесса) или строка не та (файлы переписал другой процесс)
+                if not isinstance(record, dict) or (record.get(ID_COLUMN) or interview_id) != interview_id:
+                    missing.append(interview_id)
+                    continue
+                records[interview_id] = self._decode(record, interview_id)
+        finally:
+            for f in (snapshot, journal):
+                if f is not None:
+                    f.close()
+        if missing:
+            # Такие записи ищутся полным проходом по файлам
+            records.update(super().get_records(missing))
+        return records
+
+    def clear(self):
+        with self._lock:
+            total = self._count
+            # Сначала журнал: при падении между шагами остается целый снимок, а не его хвост
+            if os.path.exists(self.path):
+                tmp_path = f"{self.path}.tmp"
+                open(tmp_path, 'w').close()
+                self._replace(tmp_path, self.path)
+            for path in (self.snapshot_path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+                    self._sync_dir()
+            self._snapshot = 0
+            self._journal_offsets = {}
+            self._count = 0
+            self._tail = 0
+            self._version += 1
+            self._generation += 1
+        return total
+
+
+class SQLiteInterviewStore(InterviewStore):
+    """Хранилище интервью в SQLite (режим WAL)
+
+    Данные респондента лежат в таблице interviews, боли - в отдельной
+    таблице pains (одна строка на боль). Записи дописываются в транзакцию
+    и фиксируются пачками по commit_batch штук (или при flush). Чтение для
+    экспорта идет через отдельное соединение, поэтому не мешает записи.
+    Версия данных хранится в таблице meta и увеличивается в той же
+    транзакции, что и изменение. Канонические ID болей пересчитываются при
+    открытии, если с прошлого раза изменились правила (CANONICAL_VERSION).
+    С fsync=True (synchronous=FULL) журнал WAL сбрасывается на диск при
+    каждой фиксации; восстановление после падения и перенос журнала в базу
+    (checkpoint) SQLite выполняет сам.
+    """
+
+    SCHEMA_VERSION = 3
+
+    SQL_CREATE = """
+        CREATE TABLE IF NOT EXISTS interviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            respondent TEXT,
+            date TEXT,
+            recorded_at TEXT,
+            pain_count INTEGER NOT NULL DEFAULT 0,
+            high_pain_count INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        )
+    """
+    SQL_CREATE_PAINS = """
+        CREATE TABLE IF NOT EXISTS pains (
+            interview_id INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            name TEXT,
+            score INTEGER,
+            emotion TEXT,
+            last_case TEXT,
+            reason TEXT,
+            canonical TEXT,
+            PRIMARY KEY (interview_id, idx)
+        )
+    """
+    SQL_ADD_CANONICAL = "ALTER TABLE pains ADD COLUMN canonical TEXT"
+    SQL_CREATE_CANONICAL_INDEX = "CREATE INDEX IF NOT EXISTS pains_canonical ON pains (canonical)"
+    SQL_CREATE_META = "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+    SQL_INIT_VERSION = "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('generation', 0)"
+    SQL_VERSION = "SELECT value FROM meta WHERE key = 'version'"
+    SQL_BUMP_VERSION = "UPDATE meta SET value = value + 1 WHERE key = 'version'"
+    SQL_ADD_VERSION = "UPDATE meta SET value = value + ? WHERE key = 'version'"
+    SQL_GENERATION = "SELECT value FROM meta WHERE key = 'generation'"
+    SQL_BUMP_GENERATION = "UPDATE meta SET value = value + 1 WHERE key = 'generation'"
+    SQL_SCHEMA = "SELECT value FROM meta WHERE key = 'schema'"
+    SQL_SET_SCHEMA = "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)"
+    SQL_CANONICAL_VERSION = "SELECT value FROM meta WHERE key = 'canonical'"
+    SQL_SET_CANONICAL_VERSION = "INSERT OR REPLACE INTO meta (key, value) VALUES ('canonical', ?)"
+    SQL_INSERT = (
+        "INSERT INTO interviews (respondent, date, recorded_at, pain_count, high_pain_count, data) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    SQL_INSERT_PAIN = (
+        "INSERT INTO pains (interview_id, idx, name, score, emotion, last_case, reason, canonical) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+    SQL_COUNT = "SELECT COUNT(*) FROM interviews"
+    SQL_SELECT_RESPONDENTS = "SELECT respondent FROM interviews"
+    SQL_SELECT_ALL = "SELECT id, data FROM interviews ORDER BY id"
+    SQL_SELECT_AFTER = "SELECT id, data FROM interviews WHERE id > ? ORDER BY id"
+    SQL_SELECT_PAINS = (
+        "SELECT interview_id, idx, name, score, emotion, last_case, reason, canonical "
+        "FROM pains WHERE interview_id > ? ORDER BY interview_id, idx"
+    )
+    SQL_SELECT_PAIN_ROWS = (
+        "SELECT p.interview_id, i.respondent, p.idx, p.name, p.score, p.emotion, p.last_case, p.reason, "
+        "p.canonical "
+        "FROM pains p JOIN interviews i ON i.id = p.interview_id "
+        "ORDER BY p.interview_id, p.idx"
+    )
+    SQL_MAX_PAINS = "SELECT COALESCE(MAX(cnt), 0) FROM (SELECT COUNT(*) AS cnt FROM pains GROUP BY interview_id)"
+    SQL_DELETE_ALL = "DELETE FROM interviews"
+    SQL_DELETE_PAINS = "DELETE FROM pains"
+    SQL_UPDATE_DATA = "UPDATE interviews SET data = ? WHERE id = ?"
+    SQL_SELECT_PAIN_NAMES = "SELECT interview_id, idx, name, canonical FROM pains"
+    SQL_UPDATE_CANONICAL = "UPDATE pains SET canonical = ? WHERE interview_id = ? AND idx = ?"
+
+    def __init__(self, path, commit_batch=1, fsync=True):
+        self.path = path
+        self.commit_batch = max(1, commit_batch)
+        self.synchronous = 'FULL' if fsync else 'NORMAL'
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Соединение используется из event loop и из пула экспорта, доступ под self._lock
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.execute(self.SQL_CREATE)
+            self._conn.execute(self.SQL_CREATE_PAINS)
+            self._conn.execute(self.SQL_CREATE_META)
+            self._conn.execute(self.SQL_INIT_VERSION)
+            self._migrate()
+            self._canonicalize()
+            self._conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def _migrate(self):
+        """Миграции схемы: колонка canonical у болей (схема 3), перенос болей
+        из широких JSON-строк (схема 1) в таблицу pains"""
+        row = self._conn.execute(self.SQL_SCHEMA).fetchone()
+        schema = row[0] if row else 1
+        if schema >= self.SCHEMA_VERSION:
+            return
+
+        columns = {column[1] for column in self._conn.execute("PRAGMA table_info(pains)")}
+        if 'canonical' not in columns:
+            self._conn.execute(self.SQL_ADD_CANONICAL)
+        self._conn.execute(self.SQL_CREATE_CANONICAL_INDEX)
+
+        migrated = 0
+        for interview_id, data in self._conn.execute(self.SQL_SELECT_ALL).fetchall():
+            record = record_from_json(data)
+            if PAINS_KEY in record:
+                continue
+            record = from_wide(record)
+            self._conn.executemany(self.SQL_INSERT_PAIN, self._pain_params(interview_id, record))
+            self._conn.execute(self.SQL_UPDATE_DATA, (self._data_json(record), interview_id))
+            migrated += 1
+        self._conn.execute(self.SQL_SET_SCHEMA, (self.SCHEMA_VERSION,))
+        if migrated:
+            logger.info(f"Migrated {migrated} interviews to the pains table")
+
+    def _canonicalize(self):
+        """Пересчитывает канонические ID болей, сохраненные по другим правилам"""
+        row = self._conn.execute(self.SQL_CANONICAL_VERSION).fetchone()
+        if row and row[0] == CANONICAL_VERSION:
+            return
+
+        changed = [
+            (canonical_pain(name), interview_id, idx)
+            for interview_id, idx, name, canonical in self._conn.execute(self.SQL_SELECT_PAIN_NAMES)
+            if canonical != canonical_pain(name)
+        ]
+        self._conn.executemany(self.SQL_UPDATE_CANONICAL, changed)
+        if changed:
+            # Индексы, построенные по старым ID, перестраиваются как после очистки
+            self._conn.execute(self.SQL_BUMP_VERSION)
+            self._conn.execute(self.SQL_BUMP_GENERATION)
+            logger.info(f"Updated canonical IDs of {len(changed)} pains")
+        self._conn.execute(self.SQL_SET_CANONICAL_VERSION, (CANONICAL_VERSION,))
+
+    @staticmethod
+    def _data_json(record):
+        # Боли хранятся в своей таблице, в JSON остаются только данные респондента
+        return record_to_json({
+            key: value for key, value in record.items() if key not in (PAINS_KEY, ID_COLUMN)
+        })
+
+    @staticmethod
+    def _pain_params(interview_id, record):
+        return [
+            (interview_id, i, pain.get('Название'), pain.get('Оценка'), pain.get('Эмоция'),
+             pain.get('Случай'), pain.get('Причина'), pain_canonical(pain))
+            for i, pain in enumerate(record.get(PAINS_KEY) or [], 1)
+        ]
+
+    @classmethod
+    def _row_params(cls, record):
+        pain_count, high_pain_count = count_pains(record)
+        recorded_at = record.get('Время_записи')
+        if isinstance(recorded_at, datetime):
+            recorded_at = recorded_at.isoformat()
+        return (
+            record.get('Респондент', ''),
+            record.get('Дата', ''),
+            recorded_at,
+            pain_count,
+            high_pain_count,
+            cls._data_json(record),
+        )
+
+    def add(self, record):
+        params = self._row_params(record)
+        with self._lock:
+            interview_id = self._conn.execute(self.SQL_INSERT, params).lastrowid
+            self._conn.executemany(self.SQL_INSERT_PAIN, self._pain_params(interview_id, record))
+            self._conn.execute(self.SQL_BUMP_VERSION)
+            self._pending += 1
+            if self._pending >= self.commit_batch:
+                self._commit()
+        return interview_id
+
+    def add_many(self, records):
+        params = [self._row_params(record) for record in records]
+        with self._lock:
+            ids = []
+            pains = []
+            for record, row in zip(records, params):
+                interview_id = self._conn.execute(self.SQL_INSERT, row).lastrowid
+                pains += self._pain_params(interview_id, record)
+                ids.append(interview_id)
+            self._conn.executemany(self.SQL_INSERT_PAIN, pains)
+            self._conn.execute(self.SQL_ADD_VERSION, (len(ids),))
+            # Пачка фиксируется сразу, вместе с ранее накопленными записями
+            self._commit()
+        return ids
+
+    def _commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(self.SQL_COUNT).fetchone()[0]
+
+    def version(self):
+        with self._lock:
+            return self._conn.execute(self.SQL_VERSION).fetchone()[0]
+
+    def generation(self):
+        with self._lock:
+            return self._conn.execute(self.SQL_GENERATION).fetchone()[0]
+
+    def _reader(self):
+        # Отдельное соединение видит только зафиксированные данные
+        self.flush()
+        return self._connect()
+
+    @staticmethod
+    def _merge_records(interviews, pains):
+        """Слияние двух упорядоченных по ID потоков: интервью и их боли"""
+        pain = pains.fetchone()
+        for interview_id, data in interviews:
+            record = record_from_json(data)
+            record[ID_COLUMN] = interview_id
+            record_pains = []
+            while pain is not None and pain[0] <= interview_id:
+                if pain[0] == interview_id:
+                    record_pains.append({**dict(zip(PAIN_FIELDS, pain[2:7])), CANONICAL_KEY: pain[7]})
+                pain = pains.fetchone()
+            record[PAINS_KEY] = record_pains
+            yield record
+
+    def iter_records(self, after_id=0):
+        conn = self._reader()
+        try:
+            yield from self._merge_records(
+                conn.cursor().execute(self.SQL_SELECT_AFTER, (after_id,)),
+                conn.execute(self.SQL_SELECT_PAINS, (after_id,)),
+            )
+        finally:
+            conn.close()
+
+    def get_records(self, ids):
+        ids = sorted(set(ids))
+        if not ids:
+            return {}
+        placeholders = ','.join('?' * len(ids))
+        with self._lock:
+            interviews = self._conn.execute(
+                f"SELECT id, data FROM interviews WHERE id IN ({placeholders}) ORDER BY id", ids
+            ).fetchall()
+            pains = self._conn.execute(
+                "SELECT interview_id, idx, name, score, emotion, last_case, reason, canonical FROM pains "
+                f"WHERE interview_id IN ({placeholders}) ORDER BY interview_id, idx", ids
+            )
+            return {record[ID_COLUMN]: record for record in self._merge_records(interviews, pains)}
+
+    def iter_respondents(self):
+        # Только колонка respondent, без разбора JSON записей
+        conn = self._reader()
+        try:
+            for (respondent,) in conn.execute(self.SQL_SELECT_RESPONDENTS):
+                yield respondent
+        finally:
+            conn.close()
+
+    def iter_pains(self):
+        conn = self._reader()
+        try:
+            for row in conn.execute(self.SQL_SELECT_PAIN_ROWS):
+                yield dict(zip(PAIN_TABLE_COLUMNS, row))
+        finally:
+            conn.close()
+
+    def max_pain_count(self):
+        with self._lock:
+            return self._conn.execute(self.SQL_MAX_PAINS).fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            total = self._conn.execute(self.SQL_DELETE_ALL).rowcount
+            self._conn.execute(self.SQL_DELETE_PAINS)
+            self._conn.execute(self.SQL_BUMP_VERSION)
+            self._conn.execute(self.SQL_BUMP_GENERATION)
+            self._commit()
+        return total
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+
+class IncrementalIndex:
+    """Структура по всем интервью (агрегаты, поисковый индекс), обновляемая по одной записи
+
+    Подклассы реализуют reset() и add(record). Полный проход по хранилищу
+    (rebuild) нужен один раз; затем интервью этого процесса учитываются
+    сразу (add_saved), а сохраненные другими процессами дочитываются по ID
+    (catch_up). Между очистками записи только дописываются с растущими ID,
+    поэтому после смены generation индекс строится заново.
+    """
+
+    version = None  # Версия хранилища, до которой индекс дочитан
+    generation = None  # Номер очистки хранилища, на котором построен индекс
+    last_id = 0  # ID последней дочитанной записи
+
+    def reset(self):
+        raise NotImplementedError
+
+    def add(self, record):
+        raise NotImplementedError
+
+    def rebuild(self, store):
+        """Строит индекс заново по всем записям"""
+        # Версия берется до чтения: записи, появившиеся во время прохода, catch_up дочитает
+        generation, version = store.generation(), store.version()
+        self.reset()
+        self._saved = set()
+        last_id = 0
+        for record in store.iter_records():
+            self.add(record)
+            last_id = record[ID_COLUMN]
+        self.generation, self.version, self.last_id = generation, version, last_id
+
+    def add_saved(self, record, interview_id):
+        """Учитывает интервью, только что сохраненное этим процессом"""
+        if self.version is not None:
+            if interview_id <= self.last_id:
+                # Пачку импорта, записанную в потоке, catch_up мог дочитать раньше
+                return
+            self._saved.add(interview_id)
+        self.add({**record, ID_COLUMN: interview_id})
+
+    def catch_up(self, store):
+        """Дочитывает записи других процессов; False - индекс нужно построить заново"""
+        if self.version is None or store.generation() != self.generation:
+            return False
+        version = store.version()
+        if version - self.version == len(self._saved):
+            # Все изменения с прошлой проверки сделал этот процесс, и они уже учтены
+            self.last_id = max([self.last_id, *self._saved])
+        else:
+            for record in store.iter_records(after_id=self.last_id):
+                if record[ID_COLUMN] not in self._saved:
+                    self.add(record)
+                self.last_id = record[ID_COLUMN]
+        self._saved.clear()
+        self.version = version
+        return True
+
+    def sync(self, store):
+        """Приводит индекс в соответствие с хранилищем"""
+        if not self.catch_up(store):
+            self.rebuild(store)
+
+
+def create_store(backend, data_dir, commit_batch=1, snapshot_every=1000, fsync=True):
+    """Создает хранилище по названию бэкенда (sqlite или jsonl)"""
+    if backend == 'jsonl':
+        return JsonlInterviewStore(
+            os.path.join(data_dir, "все_интервью.jsonl"), snapshot_every=snapshot_every, fsync=fsync
+        )
+    if backend == 'sqlite':
+        return SQLiteInterviewStore(os.path.join(data_dir, "interviews.db"), commit_batch=commit_batch, fsync=fsync)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,45 @@
+"""Исходящие сообщения под лимитами Telegram с PriorityRateLimiter
+
+Небольшой раунд benchmarks/bench_rate_limit.py: поддельный Telegram отвечает
+429 при превышении лимитов, а с ограничителем ни одно сообщение не теряется.
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_rate_limit  # noqa: E402
+from bench_export import make_record  # noqa: E402
+
+
+def test_limiter_loses_no_messages(tmp_path, monkeypatch):
+    # Настройки читаются при импорте bot.py
+    monkeypatch.setenv('DATA_DIR', str(tmp_path))
+    monkeypatch.setenv('PREWARM_IMPORTS', '0')
+    bot = importlib.import_module('bot')
+    monkeypatch.setattr(bot, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(bot, 'store', None)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    store = bot.get_store()
+    rng = random.Random(1)
+    for i in range(50):
+        store.add(make_record(rng, i, datetime(2024, 9, 1, 9, 0)))
+    store.flush()
+
+    args = argparse.Namespace(finishers=10, exporters=2, interactive=4, pains=1, rtt_ms=5, timeout=30)
+    try:
+        result = asyncio.run(bench_rate_limit.run_mode(bot, args, True, first_user=100000))
+    finally:
+        bot.store.close()
+
+    assert result['completed'] == args.finishers
+    assert result['documents'] == args.exporters * 2
+    assert result['lost'] == 0
+    assert result['stalled'] == 0
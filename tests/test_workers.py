@@ -0,0 +1,20 @@
+"""Несколько процессов-обработчиков за одним webhook (WORKERS)
+
+Небольшой раунд benchmarks/bench_workers.py: бот запускается как в
+продакшене, и каждое интервью сохраняется в общей базе ровно один раз.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import bench_workers  # noqa: E402
+
+
+def test_every_interview_saved_once(tmp_path):
+    args = argparse.Namespace(users=6, pains=1)
+    latencies, elapsed, stored, distinct, returncode = asyncio.run(bench_workers.run(args, 2, str(tmp_path)))
+    assert stored == distinct == args.users
+    assert returncode == 0
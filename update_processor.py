@@ -0,0 +1,69 @@
+"""Параллельная обработка обновлений с сохранением порядка внутри чата"""
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных чатов параллельно, а одного чата - строго по очереди
+
+    ConversationHandler и словарь interviews рассчитаны на то, что шаги одного
+    интервью выполняются последовательно. Поэтому на каждый чат берется свой
+    asyncio.Lock (FIFO), а общий семафор PTB ограничивает число обработчиков,
+    работающих одновременно.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        # chat_id -> [lock, сколько обновлений чата ждут или обрабатываются]
+        self._locks = {}
+
+    @property
+    def active_chats(self):
+        """Количество чатов, у которых сейчас есть обновления в работе"""
+        return len(self._locks)
+
+    @staticmethod
+    def chat_key(update):
+        """Ключ сериализации: чат, а для обновлений без чата - пользователь"""
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        return None
+
+    async def process_update(self, update, coroutine):
+        key = self.chat_key(update)
+        if key is None:
+            # Служебные обновления без чата и пользователя порядок не требуют
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # Блокировка чата берется до общего семафора: очередь сообщений
+            # одного чата не занимает слоты, нужные другим интервьюерам
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self._locks:
+            logger.warning(f"Update processor stopped with {len(self._locks)} chats still in progress")
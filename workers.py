@@ -0,0 +1,198 @@
+"""Несколько процессов-обработчиков за одним webhook
+
+Главный процесс принимает webhook от Telegram и раскладывает обновления по
+процессам-обработчикам по id пользователя: все сообщения одного интервьюера
+попадают в один процесс, поэтому его user_data, состояние диалога и порядок
+сообщений сохраняются (в том числе в группе, где у чата несколько
+пользователей), а разные интервьюеры обслуживаются на разных ядрах. Процессы обмениваются только
+очередями multiprocessing; интервью и сессии лежат в общих файлах SQLite,
+а построение файлов выгрузки защищено общей блокировкой.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import signal
+
+logger = logging.getLogger(__name__)
+
+STOP = None  # Сигнал процессу-обработчику: очередь закончилась, пора завершаться
+CHECK_INTERVAL = 1.0  # Как часто главный процесс проверяет, что обработчики живы
+STOP_TIMEOUT = 30.0  # Сколько ждать, пока обработчик дообработает свою очередь
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def shard_for(user_id, count):
+    """Номер процесса, который обслуживает пользователя"""
+    return user_id % count
+
+
+def update_user_id(data):
+    """id пользователя обновления Bot API (dict), без пользователя - chat id, иначе None"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if user:
+            return user['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+    return None
+
+
+class WorkerPool:
+    """Процессы-обработчики с отдельной очередью обновлений у каждого
+
+    target(index, count, queue, export_lock) выполняется в новом процессе
+    (start method spawn, одинаково на Linux и Windows) и должен обрабатывать
+    обновления из queue, пока не получит STOP.
+    """
+
+    def __init__(self, target, count):
+        self.target = target
+        self.count = count
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue() for _ in range(count)]
+        self.export_lock = self._context.Lock()
+        self.processes = [None] * count
+        self.restarts = 0
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.count, self.queues[index], self.export_lock),
+            name=f'worker-{index}',
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info(f"Started {self.count} workers")
+
+    def dispatch(self, data, raw):
+        """Кладет обновление (разобранное и исходные байты) в очередь его пользователя"""
+        user_id = update_user_id(data)
+        index = 0 if user_id is None else shard_for(user_id, self.count)
+        self.queues[index].put(raw)
+
+    def check(self):
+        """Перезапускает обработчики, которые завершились сами (упали)"""
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Дает обработчикам дообработать очереди и дождаться сохранения сессий"""
+        for queue in self.queues:
+            queue.put(STOP)
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {index} did not stop in {timeout:.0f}s, terminating")
+                process.terminate()
+                process.join()
+        logger.info("Workers stopped")
+
+
+def ignore_stop_signals():
+    """Обработчик завершается по STOP от главного процесса, а не по Ctrl+C / SIGTERM всей группе"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+async def feed_updates(application, queue):
+    """Передает обновления из очереди процесса в приложение PTB (без Updater) до STOP"""
+    from telegram import Update
+
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        try:
+            while True:
+                raw = await loop.run_in_executor(None, queue.get)
+                if raw is STOP:
+                    break
+                try:
+                    update = Update.de_json(json.loads(raw), application.bot)
+                except Exception as e:
+                    logger.error(f"Skipping unreadable update: {e}", exc_info=True)
+                    continue
+                await application.update_queue.put(update)
+        finally:
+            # stop дожидается обработки уже поставленных в очередь обновлений
+            await application.stop()
+    if application.post_shutdown:
+        await application.post_shutdown(application)
+
+
+def make_ingress_app(url_path, secret_token, dispatch):
+    """Приложение tornado, которое принимает webhook и передает обновления в dispatch"""
+    # tornado нужен только главному процессу в режиме нескольких обработчиков
+    import tornado.web
+
+    class WebhookHandler(tornado.web.RequestHandler):
+        def post(self):
+            # Как у встроенного webhook PTB: без верного секрета запрос отклоняется
+            if not hmac.compare_digest(self.request.headers.get(SECRET_HEADER, ''), secret_token):
+                self.set_status(403)
+                return
+            try:
+                data = json.loads(self.request.body)
+            except ValueError:
+                self.set_status(400)
+                return
+            dispatch(data, self.request.body)
+
+        def log_exception(self, typ, value, tb):
+            logger.error(f"Error in webhook ingress: {value}", exc_info=(typ, value, tb))
+
+    return tornado.web.Application([(rf"/{url_path}/?", WebhookHandler)])
+
+
+async def serve_ingress(bot, settings, pool, drop_pending_updates=True):
+    """Принимает webhook и раздает обновления процессам pool до SIGINT/SIGTERM
+
+    settings - параметры как у run_webhook (listen, port, url_path,
+    webhook_url, secret_token); bot нужен только для setWebhook.
+    """
+    from telegram import Update
+
+    app = make_ingress_app(settings['url_path'], settings['secret_token'], pool.dispatch)
+    server = app.listen(settings['port'], address=settings['listen'])
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, AttributeError, ValueError):
+            # Windows: остановка через KeyboardInterrupt
+            pass
+
+    try:
+        async with bot:
+            await bot.set_webhook(
+                settings['webhook_url'],
+                secret_token=settings['secret_token'],
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+            )
+        logger.info(f"Webhook ingress on {settings['listen']}:{settings['port']}/{settings['url_path']}")
+        while not stop.is_set():
+            pool.check()
+            try:
+                await asyncio.wait_for(stop.wait(), CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        server.stop()